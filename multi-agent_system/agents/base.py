@@ -1,6 +1,13 @@
+import asyncio
 from abc import ABC, abstractmethod
 
 class BaseMedicalAgent(ABC):  
     @abstractmethod
     def answer(self, question):
         pass
+
+    async def aanswer(self, question):
+        return await asyncio.to_thread(self.answer, question)
+
+    def stream_answer(self, question):
+        yield self.answer(question)
@@ -1,34 +1,152 @@
-import os
-from langchain_core.documents import Document
-from langchain_community.vectorstores import FAISS
-from langchain_openai import OpenAIEmbeddings
+import asyncio
+import numpy as np
+import config
 from agents.base import BaseMedicalAgent
-from config import client
+from config import (
+    ADAPTIVE_K_GAP, CARDIOLOGY_INDEX_PATH, CHAT_MODEL, CONTEXT_TOKEN_BUDGET, EMBEDDING_BATCH_SIZE,
+    EMBEDDING_CACHE_PATH, EMBEDDING_MODEL, EMBEDDING_WORKERS, HIERARCHICAL_DOCS, HNSW_EF_SEARCH, HYBRID_RETRIEVAL,
+    INDEX_TYPE, IVF_NPROBE, MMR_FETCH_K, MMR_LAMBDA, MMR_RETRIEVAL, RETRIEVAL_FETCH_K, RETRIEVAL_K, RETRIEVAL_K_MAX,
+    RETRIEVAL_K_MIN, RETRIEVAL_SHARDS, SHARDED_INDEX
+)
+from retrieval.ann import configure_search
+from retrieval.bm25 import load_or_build_bm25, reciprocal_rank_fusion
+from retrieval.context import assemble_context
+from retrieval.embedding_cache import make_embeddings
+from retrieval.embedding_job import count_tokens
+from retrieval.hierarchical import HierarchicalIndex
+from retrieval.index_store import load_or_build_index, read_manifest, search_by_vectors
+from retrieval.mmr import adaptive_k, mmr
+from retrieval.sharded import ShardedIndex
+from tracing import span
 
 
 
 class CardiologistAgent(BaseMedicalAgent):
 
-    def __init__(self, folder_path):
-        self.embeddings = OpenAIEmbeddings()
-        documents = []
+    def __init__(self, folder_path, index_path=CARDIOLOGY_INDEX_PATH):
+        self.embeddings = make_embeddings(EMBEDDING_MODEL, EMBEDDING_CACHE_PATH)
+        self.index_path = index_path
+        self.vectorstore = None
+        self.shards = None
+        self.hierarchy = None
+        if SHARDED_INDEX:
+            self.shards = ShardedIndex(
+                folder_path, index_path, self.embeddings, EMBEDDING_MODEL,
+                batch_size=EMBEDDING_BATCH_SIZE, max_workers=EMBEDDING_WORKERS,
+                index_type=INDEX_TYPE, nprobe=IVF_NPROBE, ef_search=HNSW_EF_SEARCH
+            )
+        else:
+            self.vectorstore = load_or_build_index(
+                folder_path, index_path, self.embeddings, EMBEDDING_MODEL, EMBEDDING_BATCH_SIZE, EMBEDDING_WORKERS,
+                INDEX_TYPE
+            )
+            configure_search(self.vectorstore.index, IVF_NPROBE, HNSW_EF_SEARCH)
+            if HIERARCHICAL_DOCS > 0:
+                self.hierarchy = HierarchicalIndex(self.vectorstore)
+        # MMR picks the final, diversified hits itself; fusing BM25 hits in afterwards would undo that
+        hybrid = HYBRID_RETRIEVAL and not MMR_RETRIEVAL
+        self.bm25 = load_or_build_bm25(folder_path, index_path, self.index_version) if hybrid else None
+        self.fetch_k = RETRIEVAL_FETCH_K if self.bm25 is not None else RETRIEVAL_K
 
-        for root, dirs, files in os.walk(folder_path):
-            for file in files:
-                if file.endswith(".txt"):
-                    file_path = os.path.join(root, file)
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        text = f.read().strip()
-                        if text:
-                            documents.append(Document(page_content=text))
+    @property
+    def index_version(self):
+        """Read on every semantic cache lookup, so cached answers are dropped once the index is updated."""
+        if self.shards is not None:
+            return self.shards.version
+        return (read_manifest(self.index_path) or {}).get("corpus_hash")
 
-        self.vectorstore = FAISS.from_documents(documents, self.embeddings)
+    def _candidates(self, vector, shards=None):
+        """Stored vectors of the MMR_FETCH_K nearest chunks, best first, and a row -> document function."""
+        if self.shards is not None:
+            return self.shards.candidates(vector, MMR_FETCH_K, shards or RETRIEVAL_SHARDS)
+        if self.hierarchy is not None:
+            ids, _ = self.hierarchy.search(vector, MMR_FETCH_K, HIERARCHICAL_DOCS)
+        else:
+            _, found = self.vectorstore.index.search(np.asarray([vector], dtype=np.float32), MMR_FETCH_K)
+            ids = found[0][found[0] != -1]
+        store = self.vectorstore
+        vectors = store.index.reconstruct_batch(ids) if len(ids) else np.zeros((0, store.index.d), dtype=np.float32)
+        return vectors, lambda row: store.docstore.search(store.index_to_docstore_id[int(ids[row])])
 
-    def answer(self, question):
-        docs = self.vectorstore.similarity_search(question, k=3)
-        context = "\n\n".join([doc.page_content for doc in docs])
+    def _diverse(self, vector, shards=None):
+        """MMR order over the candidates, cut to an adaptive k by the relevance score gaps."""
+        vectors, document = self._candidates(vector, shards)
+        if not len(vectors):
+            return []
+        order, relevance = mmr(vector, vectors, RETRIEVAL_K_MAX, MMR_LAMBDA)
+        k = adaptive_k(relevance[order], RETRIEVAL_K_MIN, RETRIEVAL_K_MAX, ADAPTIVE_K_GAP)
+        return [document(int(i)) for i in order[:k]]
 
-        prompt = f"""
+    def _dense(self, vector, shards=None):
+        if MMR_RETRIEVAL:
+            return self._diverse(vector, shards)
+        if self.shards is not None:
+            return self.shards.similarity_search_by_vector(vector, k=self.fetch_k, shards=shards or RETRIEVAL_SHARDS)
+        if self.hierarchy is not None:
+            return self.hierarchy.similarity_search_by_vector(vector, k=self.fetch_k, n_docs=HIERARCHICAL_DOCS)
+        return self.vectorstore.similarity_search_by_vector(vector, k=self.fetch_k)
+
+    def _document(self, source):
+        if self.shards is not None:
+            return self.shards.get_document(source)
+        return self.vectorstore.docstore.search(source)
+
+    def _fuse(self, question, dense_docs, shards=None):
+        """Reciprocal rank fusion of the dense hits with BM25 hits for the same question."""
+        if self.bm25 is None:
+            # with MMR the dense side has already chosen how many hits to keep
+            return dense_docs if MMR_RETRIEVAL else dense_docs[:RETRIEVAL_K]
+
+        # BM25 covers the whole corpus; keep its hits to the shards the dense side searched
+        folders = (shards or RETRIEVAL_SHARDS) if self.shards is not None else None
+        lexical = [source for source, _ in self.bm25.search(question, k=self.fetch_k, folders=folders)]
+        dense = {doc.metadata["source"]: doc for doc in dense_docs}
+        ranked = reciprocal_rank_fusion([list(dense), lexical])[:RETRIEVAL_K]
+        return [dense[s] if s in dense else self._document(s) for s in ranked]
+
+    def retrieve(self, question, shards=None, vector=None):
+        """
+        shards limits a sharded index to some categories, e.g. ["Guidelines"].
+        vector is the question's embedding, if the caller has already computed it.
+        """
+        if vector is None:
+            with span("embed"):
+                vector = self.embeddings.embed_query(question)
+        return self._search(question, vector, shards)
+
+    def _search(self, question, vector, shards=None):
+        with span("search") as s:
+            docs = self._fuse(question, self._dense(vector, shards), shards)
+            s.attrs["hits"] = len(docs)
+        return docs
+
+    def retrieve_many(self, questions):
+        """Embeds all questions in one call and searches them as one matrix."""
+        if not questions:
+            return []
+        with span("embed", texts=len(questions)):
+            vectors = np.array(self.embeddings.embed_documents(questions), dtype=np.float32)
+        with span("search", queries=len(questions)):
+            if MMR_RETRIEVAL or self.hierarchy is not None:
+                found = [self._dense(v) for v in vectors]
+            elif self.shards is not None:
+                found = [[doc for doc, _ in hits]
+                         for hits in self.shards.search_many(vectors, self.fetch_k, RETRIEVAL_SHARDS)]
+            else:
+                found = search_by_vectors(self.vectorstore, vectors, k=self.fetch_k)
+            return [self._fuse(q, docs) for q, docs in zip(questions, found)]
+
+    async def aretrieve(self, question, vector=None):
+        """The dense search, BM25 and fusion all run in a worker thread, off the event loop."""
+        if vector is None:
+            with span("embed"):
+                vector = await self.embeddings.aembed_query(question)
+        return await asyncio.to_thread(self._search, question, vector)
+
+    def _prompt(self, question, docs):
+        context = assemble_context(docs, CONTEXT_TOKEN_BUDGET)
+
+        return f"""
         You are a cardiologist. Answer the patient's question using the context below.
         If the answer is not in the context, reply that more information is needed.
 
@@ -39,9 +157,36 @@ class CardiologistAgent(BaseMedicalAgent):
         {question}
         """
 
-        response = client.responses.create(
-            model="gpt-4o",
-            input=prompt
-          )
-        
-        return response.output_text.strip().lower()
\ No newline at end of file
+    def answer(self, question, docs=None):
+        if docs is None:
+            docs = self.retrieve(question)
+
+        prompt = self._prompt(question, docs)
+        with span("generate", prompt_tokens=count_tokens(prompt)):
+            return config.llm.complete(CHAT_MODEL, prompt).strip().lower()
+
+    def stream_answer(self, question, docs=None):
+        """Yields the answer text as it is generated."""
+        if docs is None:
+            docs = self.retrieve(question)
+
+        prompt = self._prompt(question, docs)
+        started = False
+        with span("generate", prompt_tokens=count_tokens(prompt)):
+            for delta in config.llm.stream(CHAT_MODEL, prompt):
+                delta = delta.lower()
+                if not started:
+                    delta = delta.lstrip()
+                    if not delta:
+                        continue
+                    started = True
+                yield delta
+
+    async def aanswer(self, question, docs=None):
+        if docs is None:
+            docs = await self.aretrieve(question)
+
+        prompt = self._prompt(question, docs)
+        with span("generate", prompt_tokens=count_tokens(prompt)):
+            answer = await config.llm.acomplete(CHAT_MODEL, prompt)
+        return answer.strip().lower()
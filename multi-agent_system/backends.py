@@ -0,0 +1,274 @@
+"""
+Model backends for chat and embeddings, selected with MODEL_BACKEND:
+
+    live    the OpenAI API
+    record  the OpenAI API, and every chat response and embedding is saved to RECORDINGS_PATH
+    replay  answers only from RECORDINGS_PATH; a request that was not recorded fails
+    stub    synthetic answers and hashed bag-of-words embeddings, no network and no recordings
+
+Replay and stub wait BACKEND_LATENCY_MS (+/- BACKEND_LATENCY_JITTER_MS) per
+call to simulate the API; with BACKEND_LATENCY_MS unset replay waits as
+long as the recorded call took and stub does not wait.
+
+Chat backends expose the same client.responses.create(...) surface as the
+SDK, so LLMGateway retries, coalescing and latency stats apply unchanged.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+import types
+import zlib
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from retrieval.embedding_cache import open_cache, text_key
+
+BACKENDS = ("live", "record", "replay", "stub")
+
+
+class Latency:
+    """Simulated call latency; mean_ms None means the recorded latency (or none)."""
+
+    def __init__(self, mean_ms: Optional[float] = None, jitter_ms: float = 0.0):
+        self.mean_ms = mean_ms
+        self.jitter_ms = jitter_ms
+
+    def seconds(self, recorded: Optional[float] = None) -> float:
+        if self.mean_ms is None:
+            return recorded or 0.0
+        return max(0.0, self.mean_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+
+
+def prompt_key(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+class ResponseStore:
+    """Chat responses on SQLite, keyed by (model, sha256 of the exact prompt), with the time the call took."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._connect()
+        os.register_at_fork(after_in_child=self._connect)
+
+    def _connect(self) -> None:
+        self._inherited = getattr(self, "_conn", None)  # see EmbeddingCache._connect
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " model TEXT NOT NULL, key TEXT NOT NULL, prompt TEXT NOT NULL, text TEXT NOT NULL, latency REAL NOT NULL,"
+            " PRIMARY KEY (model, key)) WITHOUT ROWID"
+        )
+        self._conn.commit()
+
+    def get(self, model: str, prompt: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT text, latency FROM responses WHERE model = ? AND key = ?", (model, prompt_key(prompt))
+            ).fetchone()
+
+    def put(self, model: str, prompt: str, text: str, latency: float) -> None:
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                               (model, prompt_key(prompt), prompt, text, latency))
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+_stores: Dict[str, ResponseStore] = {}
+
+
+def open_store(path: str) -> ResponseStore:
+    if path not in _stores:
+        _stores[path] = ResponseStore(path)
+    return _stores[path]
+
+
+def synthetic_reply(prompt: str) -> str:
+    """Stub output: routing prompts get "cardiologist" (so the whole retrieval path runs), anything else a fixed text."""
+    if "You are a medical orchestrator" in prompt:
+        numbered = re.findall(r"^\s*(\d+)\. ", prompt.split("Patient requests:", 1)[-1], re.M)
+        if "<number>: <specialist>" in prompt:
+            return "\n".join(f"{n}: cardiologist" for n in numbered)
+        return "cardiologist"
+    return f"Stub answer {prompt_key(prompt)[:8]}: this response was generated offline and is not medical advice."
+
+
+def _pieces(text: str) -> List[str]:
+    return re.findall(r"\s*\S+\s*", text) or [text]
+
+
+def _delta(piece: str):
+    return types.SimpleNamespace(type="response.output_text.delta", delta=piece)
+
+
+class _Client:
+    def __init__(self, responses):
+        self.responses = responses
+
+
+class _Responses:
+    """responses.create() served by source(model, prompt) -> (text, recorded latency) after a simulated wait."""
+
+    def __init__(self, source: Callable[[str, str], Tuple[str, Optional[float]]], latency: Latency):
+        self.source = source
+        self.latency = latency
+
+    def create(self, model: str, input: str, stream: bool = False, **kwargs):
+        text, recorded = self.source(model, input)
+        delay = self.latency.seconds(recorded)
+        if stream:
+            return self._stream(text, delay)
+        time.sleep(delay)
+        return types.SimpleNamespace(output_text=text)
+
+    def _stream(self, text: str, delay: float):
+        pieces = _pieces(text)
+        for piece in pieces:
+            time.sleep(delay / len(pieces))
+            yield _delta(piece)
+
+
+class _AsyncResponses(_Responses):
+
+    async def create(self, model: str, input: str, **kwargs):
+        text, recorded = self.source(model, input)
+        await asyncio.sleep(self.latency.seconds(recorded))
+        return types.SimpleNamespace(output_text=text)
+
+
+class _RecordingResponses:
+    """Passes calls to the live client and saves each completed response."""
+
+    def __init__(self, live, store: ResponseStore):
+        self.live = live
+        self.store = store
+
+    def create(self, model: str, input: str, stream: bool = False, **kwargs):
+        started = time.perf_counter()
+        if stream:
+            return self._stream(self.live.responses.create(model=model, input=input, stream=True, **kwargs),
+                                model, input, started)
+        response = self.live.responses.create(model=model, input=input, **kwargs)
+        self.store.put(model, input, response.output_text, time.perf_counter() - started)
+        return response
+
+    def _stream(self, events, model: str, prompt: str, started: float):
+        parts = []
+        for event in events:
+            if event.type == "response.output_text.delta":
+                parts.append(event.delta)
+            yield event
+        self.store.put(model, prompt, "".join(parts), time.perf_counter() - started)
+
+
+class _AsyncRecordingResponses(_RecordingResponses):
+
+    async def create(self, model: str, input: str, **kwargs):
+        started = time.perf_counter()
+        response = await self.live.responses.create(model=model, input=input, **kwargs)
+        self.store.put(model, input, response.output_text, time.perf_counter() - started)
+        return response
+
+
+def _replay_source(store: ResponseStore):
+    def source(model, prompt):
+        found = store.get(model, prompt)
+        if found is None:
+            raise LookupError(f"no recorded {model} response for prompt {prompt_key(prompt)[:12]} in {store.path}")
+        return found
+    return source
+
+
+def chat_client(backend: str, live: Callable[[], object], recordings_path: str, latency: Latency,
+                asynchronous: bool = False):
+    """Client for the backend; live() builds the SDK client and is only called for live and record."""
+    if backend == "live":
+        return live()
+    if backend == "record":
+        recording = _AsyncRecordingResponses if asynchronous else _RecordingResponses
+        return _Client(recording(live(), open_store(recordings_path)))
+    if backend == "replay":
+        source = _replay_source(open_store(recordings_path))
+    elif backend == "stub":
+        source = lambda model, prompt: (synthetic_reply(prompt), None)
+    else:
+        raise ValueError(f"unknown model backend {backend!r}, expected one of {BACKENDS}")
+    return _Client((_AsyncResponses if asynchronous else _Responses)(source, latency))
+
+
+class StubEmbeddings(Embeddings):
+    """
+    Feature-hashed bag of words, L2-normalized: deterministic across
+    processes, and texts sharing words are close, so retrieval and the
+    semantic cache behave plausibly without a model.
+    """
+
+    def __init__(self, dim: int = 1536, latency: Optional[Latency] = None):
+        self.dim = dim
+        self.latency = latency or Latency()
+
+    def _vector(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            h = zlib.crc32(word.encode("utf-8"))
+            vector[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency.seconds())
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.latency.seconds())
+        return self._vector(text)
+
+
+class ReplayEmbeddings(Embeddings):
+    """Vectors recorded in an embedding cache; a text that was not recorded fails."""
+
+    def __init__(self, cache, model_name: str, latency: Optional[Latency] = None):
+        self.cache = cache
+        self.model_name = model_name
+        self.latency = latency or Latency()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [text_key(t) for t in texts]
+        found = self.cache.get_many(self.model_name, list(set(keys)))
+        missing = len(set(keys) - found.keys())
+        if missing:
+            raise LookupError(f"{missing} texts have no recorded {self.model_name} embedding in {self.cache.path}")
+        time.sleep(self.latency.seconds())
+        return [found[key].tolist() for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def embedding_backend(backend: str, model_name: str, recordings_path: str, latency: Latency,
+                      dim: int = 1536) -> Embeddings:
+    if backend in ("live", "record"):
+        # make_embeddings saves what record mode returns, working cache hits included
+        from langchain_openai import OpenAIEmbeddings
+        return OpenAIEmbeddings(model=model_name)
+    if backend == "replay":
+        return ReplayEmbeddings(open_cache(recordings_path), model_name, latency)
+    if backend == "stub":
+        return StubEmbeddings(dim, latency)
+    raise ValueError(f"unknown model backend {backend!r}, expected one of {BACKENDS}")
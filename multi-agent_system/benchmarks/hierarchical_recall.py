@@ -0,0 +1,63 @@
+"""
+Recall@k of two-stage (summary -> chunks) search against flat search,
+for several numbers of candidate documents.
+
+    python -m benchmarks.hierarchical_recall --n-docs 5 10 20 50
+
+Without --questions, stored chunk vectors are used as queries, so no
+embedding calls are made.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from config import CARDIOLOGY_INDEX_PATH, EMBEDDING_CACHE_PATH, EMBEDDING_MODEL
+from retrieval.embedding_cache import make_embeddings
+from retrieval.hierarchical import HierarchicalIndex, recall_at_k
+from retrieval.index_store import load_index
+
+
+def sample_queries(vectorstore, n, seed=0):
+    ids = np.array(sorted(vectorstore.index_to_docstore_id), dtype=np.int64)
+    rng = np.random.default_rng(seed)
+    picked = rng.choice(ids, size=min(n, len(ids)), replace=False)
+    vectors = np.vstack([vectorstore.index.reconstruct(int(i)) for i in picked])
+    # small perturbation, so the query is not an exact copy of a stored chunk
+    return vectors + rng.normal(scale=0.01, size=vectors.shape).astype(np.float32)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index", default=CARDIOLOGY_INDEX_PATH)
+    parser.add_argument("--questions", help="text file with one question per line")
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--n-docs", type=int, nargs="+", default=[5, 10, 20, 50])
+    args = parser.parse_args()
+
+    embeddings = make_embeddings(EMBEDDING_MODEL, EMBEDDING_CACHE_PATH)
+    vectorstore = load_index(args.index, embeddings)
+    hierarchy = HierarchicalIndex(vectorstore)
+
+    if args.questions:
+        with open(args.questions, "r", encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+        queries = np.array(embeddings.embed_documents(questions), dtype=np.float32)
+    else:
+        queries = sample_queries(vectorstore, args.samples)
+
+    print(f"documents: {len(hierarchy.documents)}, chunks: {vectorstore.index.ntotal}, queries: {len(queries)}")
+
+    started = time.perf_counter()
+    vectorstore.index.search(queries, args.k)
+    flat_ms = (time.perf_counter() - started) * 1000 / len(queries)
+    print(f"flat: {flat_ms:.3f} ms/query")
+
+    for n_docs in args.n_docs:
+        started = time.perf_counter()
+        for q in queries:
+            hierarchy.search(q, args.k, n_docs)
+        ms = (time.perf_counter() - started) * 1000 / len(queries)
+        recall = recall_at_k(hierarchy, queries, args.k, n_docs)
+        print(f"n_docs={n_docs}: recall@{args.k}={recall:.3f}, {ms:.3f} ms/query")
@@ -0,0 +1,117 @@
+"""
+Recall, latency, throughput and memory of the ANN index types in
+retrieval/ann.py, built from the vectors of an existing index.
+
+    python -m benchmarks.index_types --types flat ivf ivfpq hnsw --nprobe 4 16 64
+
+Queries are perturbed copies of stored vectors (see hierarchical_recall),
+ground truth is exact flat search, so no embedding calls are made.
+
+Memory: "RSS MB" is how much the resident set of a fresh process grows
+when it reads the saved index into RAM, "disk MB" the size of the index
+file. The agent maps the file instead (see retrieval/ann.py), so under
+memory pressure it can hold less than the RSS figure.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+from benchmarks.hierarchical_recall import sample_queries
+from benchmarks.retrieval_scaling import in_child, rss_mb
+from config import CARDIOLOGY_INDEX_PATH, EMBEDDING_CACHE_PATH, EMBEDDING_MODEL
+from retrieval.ann import INDEX_TYPES, built_type, configure_search, make_index
+from retrieval.embedding_cache import make_embeddings
+from retrieval.index_store import load_index
+
+
+def recall(found, truth):
+    return np.mean([len(set(f[f != -1]) & set(t)) / len(t) for f, t in zip(found, truth)])
+
+
+def _load_rss_mb(path):
+    """Child process: resident memory taken by the index at path once it is read into RAM."""
+    before, _ = rss_mb()
+    index = faiss.read_index(path)
+    after, _ = rss_mb()
+    del index
+    return after - before
+
+
+def memory(index):
+    """(RSS MB of the index loaded in a fresh process, MB on disk)."""
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "index.faiss")
+        faiss.write_index(index, path)
+        return in_child(_load_rss_mb, path), os.path.getsize(path) / 2 ** 20
+
+
+def measure(index, queries, truth, k):
+    latencies = []
+    for q in queries:
+        started = time.perf_counter()
+        index.search(q.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    _, found = index.search(queries, k)
+    qps = len(queries) / (time.perf_counter() - started)
+    return {
+        "recall": recall(found, truth),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "qps": qps,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index", default=CARDIOLOGY_INDEX_PATH)
+    parser.add_argument("--types", nargs="+", choices=INDEX_TYPES, default=list(INDEX_TYPES))
+    parser.add_argument("--samples", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 16, 64], help="values tried for ivf / ivfpq")
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[32, 64, 128], help="values tried for hnsw")
+    args = parser.parse_args()
+
+    vectorstore = load_index(args.index, make_embeddings(EMBEDDING_MODEL, EMBEDDING_CACHE_PATH))
+    ids = np.array(sorted(vectorstore.index_to_docstore_id), dtype=np.int64)
+    vectors = vectorstore.index.reconstruct_batch(ids)
+    queries = sample_queries(vectorstore, args.samples)
+
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, args.k)
+    truth = ids[truth]
+
+    print(f"vectors: {len(ids)} x {vectors.shape[1]}, queries: {len(queries)}, k={args.k}")
+    print(f"{'type':<8}{'param':<14}{'build s':>9}{'RSS MB':>9}{'disk MB':>9}{'recall':>8}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'QPS':>10}")
+    for requested in args.types:
+        started = time.perf_counter()
+        index = make_index(requested, vectors, ids)
+        build_s = time.perf_counter() - started
+        # rows are labelled with the type actually built (ivfpq falls back to ivf on small corpora)
+        index_type = built_type(index)
+        if index_type != requested:
+            if index_type in args.types:
+                print(f"warning: skipping {requested}, it built the same {index_type} index as the {index_type} row")
+                continue
+            print(f"warning: {requested} built an {index_type} index, reported as {index_type}")
+        rss_delta_mb, disk_mb = memory(index)
+
+        if index_type in ("ivf", "ivfpq"):
+            settings = [(f"nprobe={n}", {"nprobe": n}) for n in args.nprobe]
+        elif index_type == "hnsw":
+            settings = [(f"efSearch={ef}", {"ef_search": ef}) for ef in args.ef_search]
+        else:
+            settings = [("-", {})]
+
+        for label, options in settings:
+            configure_search(index, **options)
+            r = measure(index, queries, truth, args.k)
+            print(f"{index_type:<8}{label:<14}{build_s:>9.2f}{rss_delta_mb:>9.1f}{disk_mb:>9.1f}{r['recall']:>8.3f}"
+                  f"{r['p50_ms']:>9.3f}{r['p95_ms']:>9.3f}{r['qps']:>10.0f}")
@@ -0,0 +1,256 @@
+"""
+Load test: replays patient questions against the orchestrator in this
+process (through the server's admission control) or against a running
+server, and reports throughput, error rate and latency percentiles,
+overall and per stage.
+
+    python -m benchmarks.load_test --backend stub --concurrency 1 8 32 --duration 30
+    python -m benchmarks.load_test --backend stub --rate 5 10 20 40 --latency-ms 800
+    python -m benchmarks.load_test --url http://127.0.0.1:8000 --questions logs/routing.jsonl --rate 10
+
+Closed loop (--concurrency N): N clients, each asks its next question as
+soon as the previous answer arrives. Open loop (--rate R): questions
+arrive as a Poisson process at R per second whether or not earlier ones
+have finished, and latency is measured from the scheduled arrival, so a
+backlog shows up in the percentiles instead of slowing the arrivals
+down. Each value given is one step of the sweep.
+
+Questions come from --questions (a text file with one per line, or a
+JSONL file with a "question" field such as the routing log written when
+ROUTER_LOG_PATH is set), or are generated. --backend stub/replay answers
+without network calls (see backends.py), --latency-ms sets the simulated
+model latency.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+import numpy as np
+
+TOPICS = [
+    "chest pain when climbing stairs", "palpitations at night", "atrial fibrillation", "high blood pressure",
+    "shortness of breath and swollen ankles", "a heart murmur", "fainting during exercise", "high cholesterol",
+    "an itchy rash on my arms", "a mole that changed colour", "a hernia", "recovery after knee surgery",
+]
+TEMPLATES = [
+    "I have {}. What should I do?", "What are the treatment options for {}?", "Is {} dangerous?",
+    "My father has {}, which tests does he need?", "How is {} diagnosed?",
+]
+
+
+def read_questions(path):
+    with open(path, "r", encoding="utf-8") as f:
+        lines = [line.strip() for line in f if line.strip()]
+    if path.endswith(".jsonl"):
+        return [json.loads(line)["question"] for line in lines]
+    return lines
+
+
+def synthetic_questions(n, seed=0):
+    rng = random.Random(seed)
+    return [rng.choice(TEMPLATES).format(rng.choice(TOPICS)) for _ in range(n)]
+
+
+class LocalTarget:
+    """The orchestrator behind the server's admission control, in this process."""
+
+    def __init__(self):
+        from server import AnswerService, make_orchestrator
+        self.service = AnswerService(make_orchestrator())
+
+    async def start(self):
+        await self.service.warm()
+        if not self.service.ready:
+            raise RuntimeError(f"the orchestrator did not load: {self.service.load_error}")
+
+    async def ask(self, question):
+        """Returns "ok", "rejected" or "error"."""
+        from server import Overloaded
+        try:
+            await self.service.answer(question)
+            return "ok"
+        except Overloaded:
+            return "rejected"
+        except Exception:
+            return "error"
+
+    async def stage_stats(self):
+        from tracing import tracer
+        return tracer().stats()
+
+    def reset(self):
+        from tracing import tracer
+        tracer().reset()
+
+    async def close(self):
+        pass
+
+
+class HTTPTarget:
+    """A running server.py; per-stage numbers are the server's own since it started."""
+
+    def __init__(self, url, connections):
+        import httpx
+        self.url = url.rstrip("/")
+        self.client = httpx.AsyncClient(timeout=120, limits=httpx.Limits(max_connections=connections))
+
+    async def start(self):
+        for _ in range(600):
+            try:
+                if (await self.client.get(f"{self.url}/ready")).status_code == 200:
+                    return
+            except Exception:
+                pass
+            await asyncio.sleep(0.5)
+        raise RuntimeError(f"{self.url} did not become ready")
+
+    async def ask(self, question):
+        try:
+            response = await self.client.post(f"{self.url}/answer", json={"question": question})
+        except Exception:
+            return "error"
+        if response.status_code == 429:
+            return "rejected"
+        return "ok" if response.status_code == 200 else "error"
+
+    async def stage_stats(self):
+        return (await self.client.get(f"{self.url}/stats")).json().get("stages", {})
+
+    def reset(self):
+        pass
+
+    async def close(self):
+        await self.client.aclose()
+
+
+async def closed_loop(target, questions, concurrency, duration, max_requests):
+    records = []
+    deadline = time.perf_counter() + duration
+    counter = iter(range(max_requests or 10 ** 12))
+
+    async def client():
+        for i in counter:
+            if time.perf_counter() >= deadline:
+                return
+            started = time.perf_counter()
+            outcome = await target.ask(questions[i % len(questions)])
+            records.append((outcome, time.perf_counter() - started))
+
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    return records
+
+
+async def open_loop(target, questions, rate, duration, max_requests, seed=0):
+    records = []
+    rng = random.Random(seed)
+    tasks = []
+
+    async def one(question, scheduled):
+        outcome = await target.ask(question)
+        records.append((outcome, time.perf_counter() - scheduled))
+
+    started = time.perf_counter()
+    scheduled = started
+    i = 0
+    while scheduled - started < duration and (not max_requests or i < max_requests):
+        await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+        tasks.append(asyncio.create_task(one(questions[i % len(questions)], scheduled)))
+        i += 1
+        scheduled += rng.expovariate(rate)
+    await asyncio.gather(*tasks)
+    return records
+
+
+def _ms(value):
+    return f"{value:>10.1f}" if value is not None else f"{'-':>10}"
+
+
+def summarize(records, elapsed):
+    latencies = np.array([seconds for outcome, seconds in records if outcome == "ok"]) * 1000
+    total = len(records)
+    ok = len(latencies)
+    percentiles = {f"p{q}_ms": float(np.percentile(latencies, q)) if ok else None for q in (50, 95, 99)}
+    return {
+        "requests": total,
+        "ok": ok,
+        "rejected": sum(outcome == "rejected" for outcome, _ in records),
+        "errors": sum(outcome == "error" for outcome, _ in records),
+        "error_rate": (total - ok) / total if total else 0.0,
+        "throughput": ok / elapsed if elapsed else 0.0,
+        **percentiles,
+        "max_ms": float(latencies.max()) if ok else None,
+    }
+
+
+async def run(args):
+    questions = read_questions(args.questions) if args.questions else synthetic_questions(args.synthetic)
+    target = HTTPTarget(args.url, max(args.concurrency or [0]) + 64) if args.url else LocalTarget()
+    await target.start()
+
+    # warm-up: loads indexes lazily built on first use and fills connection pools
+    if args.warmup:
+        await closed_loop(target, questions, min(4, len(questions)), duration=3600, max_requests=args.warmup)
+
+    if args.rate:
+        steps = [("rate", rate) for rate in args.rate]
+    else:
+        steps = [("concurrency", c) for c in args.concurrency or [8]]
+
+    results = []
+    print(f"{len(questions)} questions, {args.duration:.0f}s per step, target {args.url or 'in-process'}")
+    print(f"{'step':<18}{'requests':>9}{'ok/s':>9}{'errors':>8}{'429':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for mode, value in steps:
+        target.reset()
+        started = time.perf_counter()
+        if mode == "rate":
+            records = await open_loop(target, questions, value, args.duration, args.requests)
+        else:
+            records = await closed_loop(target, questions, value, args.duration, args.requests)
+        summary = summarize(records, time.perf_counter() - started)
+        summary.update({"mode": mode, mode: value, "stages": await target.stage_stats()})
+        results.append(summary)
+        print(f"{f'{mode}={value}':<18}{summary['requests']:>9}{summary['throughput']:>9.1f}{summary['errors']:>8}"
+              f"{summary['rejected']:>6}{_ms(summary['p50_ms'])}{_ms(summary['p95_ms'])}{_ms(summary['p99_ms'])}")
+        for stage, s in summary["stages"].items():
+            print(f"    {stage:<14}{s['count']:>9}{'':>23}{s['p50'] * 1000:>10.1f}{s['p95'] * 1000:>10.1f}"
+                  f"{s['p99'] * 1000:>10.1f}")
+
+    await target.close()
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"target": args.url or "in-process", "backend": os.getenv("MODEL_BACKEND", "live"),
+                       "duration": args.duration, "results": results}, f, indent=2)
+        print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="base URL of a running server.py (default: in-process)")
+    parser.add_argument("--questions", help="text file, one question per line, or JSONL with a \"question\" field")
+    parser.add_argument("--synthetic", type=int, default=500, help="number of generated questions without --questions")
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument("--concurrency", type=int, nargs="+", help="closed loop: clients in flight, one step each")
+    load.add_argument("--rate", type=float, nargs="+", help="open loop: arrivals per second, one step each")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds per step")
+    parser.add_argument("--requests", type=int, help="stop a step after this many requests")
+    parser.add_argument("--warmup", type=int, default=20, help="requests sent before measuring")
+    parser.add_argument("--backend", choices=("live", "record", "replay", "stub"),
+                        help="MODEL_BACKEND for the in-process orchestrator")
+    parser.add_argument("--latency-ms", type=float, help="BACKEND_LATENCY_MS for replay/stub")
+    parser.add_argument("--cache-size", type=int,
+                        help="SEMANTIC_CACHE_SIZE, > 0 lets repeated questions hit the answer cache (off by default)")
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+
+    # config reads these at import, which happens when the in-process target is created
+    if args.backend:
+        os.environ["MODEL_BACKEND"] = args.backend
+    if args.latency_ms is not None:
+        os.environ["BACKEND_LATENCY_MS"] = str(args.latency_ms)
+    if args.cache_size is not None:
+        os.environ["SEMANTIC_CACHE_SIZE"] = str(args.cache_size)
+    asyncio.run(run(args))
@@ -0,0 +1,263 @@
+"""
+How retrieval scales with the corpus: for each corpus size and index type,
+build time, on-disk size (index + packed texts), RSS, single-query latency
+through the vector store (FAISS search + docstore lookup, as in
+CardiologistAgent) and batch QPS.
+
+    python -m benchmarks.retrieval_scaling --scales 1 10 100 --types flat ivf ivfpq hnsw
+    python -m benchmarks.retrieval_scaling --synthetic 17000 --dim 256 --output after.json --compare before.json
+
+Scale 1 is the vectors and texts of the saved index (--index), so no
+embedding calls are made; larger scales add perturbed copies of them.
+With --synthetic N the base is N clustered random unit vectors and
+generated texts instead. Every build and every query run happens in a
+fresh process, so RSS figures are per configuration. Results are written
+as JSON with the commit and machine they were measured on; --compare
+prints the change against an earlier results file.
+
+Memory: the parent holds all vectors of the largest scale (about
+17k * 100 * 1536 * 4 bytes = 10 GB at 100x with ada-002 vectors), use
+--dim with --synthetic to stay within RAM.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+from backends import StubEmbeddings
+from config import CARDIOLOGY_INDEX_PATH
+from retrieval.ann import INDEX_TYPES, built_type, configure_search, make_index
+from retrieval.docstore import MmapDocstore, write_docstore
+from retrieval.index_store import INDEX_FILE, load_index, search_by_vectors, write_manifest
+
+CHUNK = 50_000  # rows generated per step when scaling up
+
+
+def rss_mb():
+    """(current, peak) resident set size of this process in MB."""
+    values = {}
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in ("VmRSS", "VmHWM"):
+                    values[name] = int(value.split()[0]) / 1024
+    except OSError:
+        pass
+    peak = values.get("VmHWM", resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+    return values.get("VmRSS", peak), peak
+
+
+def dir_mb(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)) / 2 ** 20
+
+
+def _unit(vectors):
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True).clip(1e-12)
+
+
+def base_from_index(index_dir):
+    """Vectors and texts of a saved index, ordered by vector id."""
+    docstore = MmapDocstore(index_dir)
+    index = faiss.read_index(os.path.join(index_dir, INDEX_FILE))
+    ids = np.asarray(docstore.table[:, 0], dtype=np.int64)
+    texts = [docstore.search(source).page_content for source in docstore.sources]
+    return index.reconstruct_batch(ids).astype(np.float32), texts
+
+
+def synthetic_base(n, dim, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, n // 50), dim)).astype(np.float32)
+    vectors = centers[rng.integers(len(centers), size=n)] + 0.5 * rng.normal(size=(n, dim)).astype(np.float32)
+    texts = [f"Synthetic chunk {i}\nKEYWORDS: synthetic\n\n" + "lorem ipsum dolor sit amet " * 30 for i in range(n)]
+    return _unit(vectors), texts
+
+
+def scale_vectors(base, scale, noise=0.3, seed=0):
+    """base followed by scale-1 copies of it, each vector moved by noise (relative to its norm) and renormalized."""
+    n, dim = base.shape
+    out = np.empty((n * scale, dim), dtype=np.float32)
+    out[:n] = base
+    rng = np.random.default_rng(seed)
+    for start in range(n, n * scale, CHUNK):
+        rows = np.arange(start, min(start + CHUNK, n * scale))
+        out[rows] = _unit(base[rows % n] + rng.normal(scale=noise / np.sqrt(dim), size=(len(rows), dim)))
+    return out
+
+
+class ScaledTexts:
+    """docstore id -> Document for write_docstore, without keeping n * scale Documents alive."""
+
+    def __init__(self, texts):
+        self.texts = texts
+
+    def __getitem__(self, source):
+        row = int(source.rsplit("#", 1)[1])
+        return Document(page_content=self.texts[row % len(self.texts)], metadata={"source": source})
+
+
+def _build(index_type, workdir, out_dir, texts):
+    """Child process: build and save one index."""
+    vectors = np.load(os.path.join(workdir, "vectors.npy"))
+    ids = np.arange(len(vectors), dtype=np.int64)
+    before, _ = rss_mb()
+    started = time.perf_counter()
+    index = make_index(index_type, vectors, ids)
+    build_s = time.perf_counter() - started
+    _, peak = rss_mb()
+
+    os.makedirs(out_dir, exist_ok=True)
+    faiss.write_index(index, os.path.join(out_dir, INDEX_FILE))
+    write_docstore(out_dir, {int(i): f"chunk#{i}" for i in ids}, ScaledTexts(texts))
+    write_manifest(out_dir, {"index_type": index_type, "num_vectors": len(ids)})
+    return {"built_type": built_type(index), "build_s": build_s, "build_peak_rss_mb": peak,
+            "build_rss_delta_mb": peak - before, "disk_mb": dir_mb(out_dir)}
+
+
+def _query(index_type, workdir, out_dir, k, nprobe, ef_search):
+    """Child process: load the saved index memory-mapped, as the agent does, and query it."""
+    queries = np.load(os.path.join(workdir, "queries.npy"))
+    truth = np.load(os.path.join(workdir, "truth.npy"))
+    before, _ = rss_mb()
+    started = time.perf_counter()
+    vectorstore = load_index(out_dir, StubEmbeddings(queries.shape[1]))
+    load_s = time.perf_counter() - started
+    configure_search(vectorstore.index, nprobe, ef_search)
+
+    latencies, found = [], []
+    for q in queries:
+        started = time.perf_counter()
+        docs = vectorstore.similarity_search_by_vector(q.tolist(), k=k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        found.append({int(d.metadata["source"].rsplit("#", 1)[1]) for d in docs})
+
+    started = time.perf_counter()
+    search_by_vectors(vectorstore, queries, k)
+    qps = len(queries) / (time.perf_counter() - started)
+
+    rss, _ = rss_mb()
+    return {
+        "load_s": load_s,
+        "rss_mb": rss,
+        "rss_delta_mb": rss - before,
+        "recall": float(np.mean([len(f & set(t)) / len(t) for f, t in zip(found, truth)])),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "batch_qps": qps,
+    }
+
+
+def in_child(function, *args):
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(function, args)
+
+
+def environment():
+    def git(*cmd):
+        try:
+            return subprocess.run(["git", *cmd], capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    return {
+        "commit": git("rev-parse", "HEAD"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "faiss": faiss.__version__,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "system": platform.system(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(results, previous_path):
+    with open(previous_path, "r", encoding="utf-8") as f:
+        previous = {(r["scale"], r["index_type"]): r for r in json.load(f)["results"]}
+    metrics = ("build_s", "disk_mb", "rss_mb", "p50_ms", "p95_ms", "batch_qps", "recall")
+    print(f"\nchange against {previous_path}")
+    print(f"{'scale':>6} {'type':<7}" + "".join(f"{m:>11}" for m in metrics))
+    for r in results:
+        old = previous.get((r["scale"], r["index_type"]))
+        if old is None:
+            continue
+        changes = [(r[m] - old[m]) / old[m] * 100 if old[m] else 0.0 for m in metrics]
+        print(f"{r['scale']:>6} {r['index_type']:<7}" + "".join(f"{c:>+10.1f}%" for c in changes))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index", default=CARDIOLOGY_INDEX_PATH, help="saved index whose vectors and texts are the base")
+    parser.add_argument("--synthetic", type=int, metavar="N", help="use N synthetic vectors as the base instead")
+    parser.add_argument("--dim", type=int, default=1536, help="dimension of synthetic vectors")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10], help="corpus sizes as multiples of the base")
+    parser.add_argument("--types", nargs="+", choices=INDEX_TYPES, default=list(INDEX_TYPES))
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--ef-search", type=int, default=64)
+    parser.add_argument("--workdir", help="where indexes are built (default: a temporary directory)")
+    parser.add_argument("--output", default="benchmarks/results/retrieval_scaling.json")
+    parser.add_argument("--compare", metavar="JSON", help="earlier results to compare against")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        base, texts = synthetic_base(args.synthetic, args.dim)
+    else:
+        base, texts = base_from_index(args.index)
+    print(f"base: {len(base)} vectors x {base.shape[1]}, scales {args.scales}, types {args.types}")
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="retrieval_scaling_")
+    os.makedirs(workdir, exist_ok=True)
+    rng = np.random.default_rng(1)
+    results = []
+    print(f"{'scale':>6}{'vectors':>10} {'type':<7}{'build s':>9}{'disk MB':>9}{'RSS MB':>9}"
+          f"{'p50 ms':>9}{'p95 ms':>9}{'QPS':>10}{'recall':>8}")
+    try:
+        for scale in args.scales:
+            vectors = scale_vectors(base, scale)
+            picked = rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)
+            queries = _unit(vectors[picked] + rng.normal(scale=0.1 / np.sqrt(vectors.shape[1]),
+                                                         size=(len(picked), vectors.shape[1])).astype(np.float32))
+            # exact neighbours; the stored ids are the row numbers
+            _, truth = faiss.knn(queries, vectors, args.k)
+            np.save(os.path.join(workdir, "vectors.npy"), vectors)
+            np.save(os.path.join(workdir, "queries.npy"), queries.astype(np.float32))
+            np.save(os.path.join(workdir, "truth.npy"), truth)
+            del vectors
+
+            for index_type in args.types:
+                out_dir = os.path.join(workdir, f"{index_type}-{scale}x")
+                result = {"scale": scale, "vectors": len(base) * scale, "dim": base.shape[1],
+                          "index_type": index_type, "k": args.k, "nprobe": args.nprobe, "ef_search": args.ef_search}
+                result.update(in_child(_build, index_type, workdir, out_dir, texts))
+                if result["built_type"] != index_type:
+                    print(f"warning: {index_type} built an {result['built_type']} index at {result['vectors']} vectors")
+                result.update(in_child(_query, index_type, workdir, out_dir, args.k, args.nprobe, args.ef_search))
+                shutil.rmtree(out_dir)
+                results.append(result)
+                print(f"{scale:>6}{result['vectors']:>10} {result['built_type']:<7}{result['build_s']:>9.2f}"
+                      f"{result['disk_mb']:>9.1f}{result['rss_mb']:>9.1f}{result['p50_ms']:>9.3f}"
+                      f"{result['p95_ms']:>9.3f}{result['batch_qps']:>10.0f}{result['recall']:>8.3f}")
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"environment": environment(), "base": "synthetic" if args.synthetic else args.index,
+                   "results": results}, f, indent=2)
+    print(f"results written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
@@ -0,0 +1,45 @@
+import argparse
+import os
+
+from config import (
+    CARDIOLOGY_DATA_PATH, CARDIOLOGY_INDEX_PATH, EMBEDDING_BATCH_SIZE, EMBEDDING_CACHE_PATH, EMBEDDING_MODEL,
+    EMBEDDING_WORKERS, INDEX_TYPE
+)
+from retrieval.ann import INDEX_TYPES
+from retrieval.bm25 import load_or_build_bm25
+from retrieval.embedding_cache import make_embeddings
+from retrieval.index_store import read_manifest, rebuild_index, update_index
+from retrieval.sharded import CATEGORIES
+
+
+def build(data, index, embeddings, args):
+    if args.rebuild:
+        rebuild_index(data, index, embeddings, EMBEDDING_MODEL, args.batch_size, args.workers, args.index_type)
+        print(f"{index}: rebuilt")
+    else:
+        stats = update_index(data, index, embeddings, EMBEDDING_MODEL, args.batch_size, args.workers, args.index_type)
+        print(f"{index}: added {stats['added']}, removed {stats['removed']}, unchanged {stats['unchanged']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or incrementally update the cardiology vector index.")
+    parser.add_argument("--data", default=CARDIOLOGY_DATA_PATH)
+    parser.add_argument("--index", default=CARDIOLOGY_INDEX_PATH)
+    parser.add_argument("--rebuild", action="store_true", help="re-embed the whole corpus")
+    parser.add_argument("--batch-size", type=int, default=EMBEDDING_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=EMBEDDING_WORKERS, help="embedding batches in flight")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default=INDEX_TYPE,
+                        help="vector index structure; a different type than the saved one rebuilds it")
+    parser.add_argument("--shard", nargs="+", choices=CATEGORIES,
+                        help="build only these category shards (for SHARDED_INDEX=1)")
+    args = parser.parse_args()
+
+    embeddings = make_embeddings(EMBEDDING_MODEL, EMBEDDING_CACHE_PATH)
+    if args.shard:
+        # the BM25 index follows the combined shard version and is refreshed by the agent on start
+        for category in args.shard:
+            build(os.path.join(args.data, category), os.path.join(args.index, category), embeddings, args)
+    else:
+        build(args.data, args.index, embeddings, args)
+        load_or_build_bm25(args.data, args.index, read_manifest(args.index)["corpus_hash"])
+    print(f"embedding cache hits: {embeddings.hits}, misses: {embeddings.misses} ({embeddings.hit_rate:.1%})")
@@ -1,4 +1,115 @@
-from openai import OpenAI
 import os
+import threading
+from pathlib import Path
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
\ No newline at end of file
+
+# data/ lives at the repository root; defaults resolve there, so commands work from multi-agent_system/ as well
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+
+CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-4o")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "64"))
+# live | record | replay | stub for chat and embeddings, see backends.py
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "live")
+RECORDINGS_PATH = os.getenv("RECORDINGS_PATH", str(DATA_DIR / "recordings.sqlite"))
+# simulated latency of replay/stub calls; unset replays the recorded latency, stub answers at once
+BACKEND_LATENCY_MS = float(os.getenv("BACKEND_LATENCY_MS")) if os.getenv("BACKEND_LATENCY_MS") else None
+BACKEND_LATENCY_JITTER_MS = float(os.getenv("BACKEND_LATENCY_JITTER_MS", "0"))
+STUB_EMBEDDING_DIM = int(os.getenv("STUB_EMBEDDING_DIM", "1536"))
+
+
+def backend_latency():
+    from backends import Latency
+    return Latency(BACKEND_LATENCY_MS, BACKEND_LATENCY_JITTER_MS)
+
+
+_lazy_lock = threading.Lock()
+
+
+def _gateway():
+    with _lazy_lock:
+        # another thread may have created it while this one waited
+        gateway = globals().get("llm")
+        if gateway is None:
+            from llm_gateway import LLMGateway
+            gateway = LLMGateway(os.getenv("OPENAI_API_KEY"), timeout=LLM_TIMEOUT, max_retries=LLM_MAX_RETRIES,
+                                 max_connections=LLM_MAX_CONNECTIONS, backend=MODEL_BACKEND,
+                                 recordings_path=RECORDINGS_PATH, simulated_latency=backend_latency())
+            globals()["llm"] = gateway
+        return gateway
+
+
+def __getattr__(name):
+    # importing the OpenAI SDK is a large part of startup, so the gateway and clients are created on first use;
+    # there is only ever one gateway, so its single-flight table and stats are shared by every caller
+    if name == "llm":
+        return _gateway()
+    if name in ("client", "async_client"):
+        # the gateway's pooled clients, for code that needs the raw SDK
+        return getattr(_gateway(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+# stub vectors are not comparable with real ones, so the stub backend keeps its own cache and indexes
+INDEX_ROOT = str(DATA_DIR / ("index-stub" if MODEL_BACKEND == "stub" else "index"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", f"{INDEX_ROOT}/embeddings.sqlite")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "4"))
+
+CARDIOLOGY_DATA_PATH = os.getenv("CARDIOLOGY_DATA_PATH", str(DATA_DIR / "processed" / "cardiology"))
+CARDIOLOGY_INDEX_PATH = os.getenv("CARDIOLOGY_INDEX_PATH", f"{INDEX_ROOT}/cardiology")
+
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "3"))
+RETRIEVAL_FETCH_K = int(os.getenv("RETRIEVAL_FETCH_K", "10"))
+# maximal marginal relevance over MMR_FETCH_K dense candidates, keeping RETRIEVAL_K_MIN..RETRIEVAL_K_MAX
+# hits depending on where the relevance scores drop by at least ADAPTIVE_K_GAP (instead of RETRIEVAL_K)
+MMR_RETRIEVAL = os.getenv("MMR_RETRIEVAL", "0") == "1"
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.5"))
+MMR_FETCH_K = int(os.getenv("MMR_FETCH_K", "100"))
+RETRIEVAL_K_MIN = int(os.getenv("RETRIEVAL_K_MIN", "2"))
+RETRIEVAL_K_MAX = int(os.getenv("RETRIEVAL_K_MAX", "6"))
+ADAPTIVE_K_GAP = float(os.getenv("ADAPTIVE_K_GAP", "0.03"))
+# dense + BM25 hits merged by reciprocal rank fusion; not combined with MMR_RETRIEVAL, whose hits are final
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "1") == "1"
+# prompt tokens for retrieved context; overlapping chunks are stitched before packing
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+# > 0 enables two-stage search: top-N documents by summary, then their chunks
+HIERARCHICAL_DOCS = int(os.getenv("HIERARCHICAL_DOCS", "0"))
+# one index per category under CARDIOLOGY_INDEX_PATH/<Category>; not combined with HIERARCHICAL_DOCS
+SHARDED_INDEX = os.getenv("SHARDED_INDEX", "0") == "1"
+RETRIEVAL_SHARDS = [s for s in os.getenv("RETRIEVAL_SHARDS", "").split(",") if s]
+# flat | ivf | ivfpq | hnsw, see retrieval/ann.py; changing it rebuilds the index
+INDEX_TYPE = os.getenv("INDEX_TYPE", "flat")
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+
+ROUTER_CONFIDENCE_THRESHOLD = float(os.getenv("ROUTER_CONFIDENCE_THRESHOLD", "0.5"))
+ROUTER_AUDIT_RATE = float(os.getenv("ROUTER_AUDIT_RATE", "0.0"))
+# one JSON line per routing decision, with the patient question; empty (the default) disables the log
+ROUTER_LOG_PATH = os.getenv("ROUTER_LOG_PATH", "")
+
+# one JSON line per traced stage (load, route, cache, embed, search, generate, request); empty (the default)
+# disables the log, the per-stage histograms in /stats and /metrics are kept either way
+TRACE_LOG_PATH = os.getenv("TRACE_LOG_PATH", "")
+
+ROUTING_BATCH_SIZE = int(os.getenv("ROUTING_BATCH_SIZE", "20"))
+GENERATION_CONCURRENCY = int(os.getenv("GENERATION_CONCURRENCY", "8"))
+
+# server.py: requests answered at once, requests allowed to wait (more get 429), per-stage limits
+SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
+# > 1: prefork worker processes sharing one loaded, memory-mapped index (see server.py)
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "1"))
+SERVER_CONCURRENCY = int(os.getenv("SERVER_CONCURRENCY", "32"))
+SERVER_QUEUE_SIZE = int(os.getenv("SERVER_QUEUE_SIZE", "64"))
+ROUTING_CONCURRENCY = int(os.getenv("ROUTING_CONCURRENCY", "16"))
+RETRIEVAL_CONCURRENCY = int(os.getenv("RETRIEVAL_CONCURRENCY", "4"))
+SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT", "30"))
+
+# answers reused for questions whose embeddings are this similar; off by default (size 0), since even at a high
+# threshold two clinical questions that differ only by a negation or a drug name can be near neighbours
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.98"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "0"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
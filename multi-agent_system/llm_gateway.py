@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import random
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, Iterator, Optional
+
+from metrics import LatencyHistogram
+from tracing import annotate
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+def _retryable(error: Exception) -> bool:
+    import openai
+    if isinstance(error, openai.APIConnectionError):  # includes timeouts
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code in RETRYABLE_STATUS
+
+
+def _usage(response) -> dict:
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return {}
+    return {"input_tokens": getattr(usage, "input_tokens", None), "output_tokens": getattr(usage, "output_tokens", None)}
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class LLMGateway:
+    """
+    Shared entry point for chat completions. Requests go over pooled HTTP
+    connections with a per-call timeout; connection errors, timeouts, 429
+    and 5xx responses are retried with exponential backoff and full
+    jitter. Identical prompts that are already in flight are coalesced
+    into one upstream call (single-flight). Latency is recorded per model.
+    """
+
+    def __init__(self, api_key: Optional[str] = None, timeout: float = 60.0, max_retries: int = 4,
+                 backoff_base: float = 0.5, backoff_max: float = 8.0, max_connections: int = 64,
+                 backend: str = "live", recordings_path: str = "data/recordings.sqlite", simulated_latency=None):
+        self.api_key = api_key
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_connections = max_connections
+        # see backends.py; anything but "live" wraps or replaces the SDK clients
+        self.backend = backend
+        self.recordings_path = recordings_path
+        self.simulated_latency = simulated_latency
+        self.retries = 0
+        self.coalesced = 0
+        self.latency: Dict[str, LatencyHistogram] = {}
+        self.first_token: Dict[str, LatencyHistogram] = {}
+        self._client = None
+        self._async_client = None
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        self._ainflight: Dict[str, asyncio.Task] = {}
+
+    def _limits(self):
+        import httpx
+        return httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+
+    def _live_client(self):
+        import httpx
+        from openai import OpenAI
+        # retries are done here, with jitter and coalescing, not by the SDK
+        return OpenAI(api_key=self.api_key, max_retries=0, timeout=self.timeout,
+                      http_client=httpx.Client(limits=self._limits(), timeout=self.timeout))
+
+    def _live_async_client(self):
+        import httpx
+        from openai import AsyncOpenAI
+        return AsyncOpenAI(api_key=self.api_key, max_retries=0, timeout=self.timeout,
+                           http_client=httpx.AsyncClient(limits=self._limits(), timeout=self.timeout))
+
+    def _backend_client(self, live, asynchronous: bool):
+        if self.backend == "live":
+            return live()
+        from backends import Latency, chat_client
+        return chat_client(self.backend, live, self.recordings_path, self.simulated_latency or Latency(), asynchronous)
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self._backend_client(self._live_client, asynchronous=False)
+        return self._client
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            self._async_client = self._backend_client(self._live_async_client, asynchronous=True)
+        return self._async_client
+
+    def _histogram(self, table: Dict[str, LatencyHistogram], model: str) -> LatencyHistogram:
+        histogram = table.get(model)
+        if histogram is None:
+            with self._lock:
+                histogram = table.setdefault(model, LatencyHistogram())
+        return histogram
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        return max(delay, _retry_after(error) or 0.0)
+
+    def _key(self, model: str, prompt: str) -> str:
+        return hashlib.sha256(f"{model}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def _create(self, model: str, prompt: str, timeout: Optional[float], **kwargs):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.client.responses.create(model=model, input=prompt, timeout=timeout or self.timeout,
+                                                    **kwargs)
+            except Exception as e:
+                if attempt == self.max_retries or not _retryable(e):
+                    raise
+                self.retries += 1
+                annotate(retries=attempt + 1)
+                time.sleep(self._backoff(attempt, e))
+
+    async def _acreate(self, model: str, prompt: str, timeout: Optional[float]):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await self.async_client.responses.create(model=model, input=prompt,
+                                                                timeout=timeout or self.timeout)
+            except Exception as e:
+                if attempt == self.max_retries or not _retryable(e):
+                    raise
+                self.retries += 1
+                annotate(retries=attempt + 1)
+                await asyncio.sleep(self._backoff(attempt, e))
+
+    def complete(self, model: str, prompt: str, timeout: Optional[float] = None) -> str:
+        """Output text for the prompt. Callers asking the same thing concurrently share one request."""
+        key = self._key(model, prompt)
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            self.coalesced += 1
+            annotate(coalesced=True)
+            return future.result()
+
+        started = time.perf_counter()
+        try:
+            response = self._create(model, prompt, timeout)
+            annotate(**_usage(response))
+            text = response.output_text
+            future.set_result(text)
+            return text
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._histogram(self.latency, model).observe(time.perf_counter() - started)
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    async def _acomplete(self, model: str, prompt: str, timeout: Optional[float]) -> str:
+        started = time.perf_counter()
+        try:
+            response = await self._acreate(model, prompt, timeout)
+            annotate(**_usage(response))
+            return response.output_text
+        finally:
+            self._histogram(self.latency, model).observe(time.perf_counter() - started)
+
+    async def acomplete(self, model: str, prompt: str, timeout: Optional[float] = None) -> str:
+        key = self._key(model, prompt)
+        task = self._ainflight.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(self._acomplete(model, prompt, timeout))
+            self._ainflight[key] = task
+            task.add_done_callback(lambda t: self._ainflight.pop(key, None) if self._ainflight.get(key) is t else None)
+        else:
+            self.coalesced += 1
+            annotate(coalesced=True)
+        # a cancelled caller must not cancel the request the others are waiting for
+        return await asyncio.shield(task)
+
+    def stream(self, model: str, prompt: str, timeout: Optional[float] = None) -> Iterator[str]:
+        """Yields output text deltas. Retries only happen before the first event; streams are not coalesced."""
+        started = time.perf_counter()
+        events = self._create(model, prompt, timeout, stream=True)
+        first = True
+        try:
+            for event in events:
+                if event.type == "response.completed":
+                    annotate(**_usage(event.response))
+                if event.type != "response.output_text.delta":
+                    continue
+                if first:
+                    self._histogram(self.first_token, model).observe(time.perf_counter() - started)
+                    first = False
+                yield event.delta
+        finally:
+            self._histogram(self.latency, model).observe(time.perf_counter() - started)
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "retries": self.retries,
+            "coalesced": self.coalesced,
+            "latency": {model: h.snapshot() for model, h in self.latency.items()},
+            "first_token": {model: h.snapshot() for model, h in self.first_token.items()},
+        }
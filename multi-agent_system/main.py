@@ -1,10 +1,25 @@
+import time
+from config import CARDIOLOGY_DATA_PATH
 from orchestrator import MedicalOrchestrator
 
 if __name__ == "__main__":
-    orchestrator = MedicalOrchestrator("data/cardiology")
+    orchestrator = MedicalOrchestrator(CARDIOLOGY_DATA_PATH)
+    # load the cardiology index while the question is being typed
+    orchestrator.warm(["cardiologist"])
 
     question = input("Enter the patient's question: ")
-    answer = orchestrator.answer(question)
+    started = time.perf_counter()
+    first_token = None
 
-    print("\nAnswer:")
-    print(answer)
+    def on_route(specialist):
+        print("specialist: ", specialist)
+        print("\nAnswer:")
+
+    for token in orchestrator.stream_answer(question, on_route):
+        if first_token is None:
+            first_token = time.perf_counter() - started
+        print(token, end="", flush=True)
+    print()
+
+    total = time.perf_counter() - started
+    print(f"\n[time to first token: {first_token or total:.2f}s, total: {total:.2f}s]")
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import bisect
+import threading
+from typing import Dict, List, Sequence, Tuple
+
+# Upper bounds in seconds, Prometheus style; the last bucket is +Inf.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram; percentiles are interpolated inside the bucket."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            self.count += 1
+            self.sum += seconds
+
+    def percentile(self, q: float) -> float:
+        """Approximate q-th percentile (0..100) in seconds."""
+        with self._lock:
+            if not self.count:
+                return 0.0
+            rank = q / 100 * self.count
+            seen = 0
+            for i, n in enumerate(self.counts):
+                if n and seen + n >= rank:
+                    low = self.buckets[i - 1] if i > 0 else 0.0
+                    high = self.buckets[i] if i < len(self.buckets) else low
+                    return low + (high - low) * (rank - seen) / n
+                seen += n
+            return self.buckets[-1]
+
+    def cumulative(self) -> Tuple[List[Tuple[str, int]], int, float]:
+        """([(upper bound, observations <= bound)], count, sum), the shape of a Prometheus histogram."""
+        with self._lock:
+            counts, count, total = list(self.counts), self.count, self.sum
+        buckets, seen = [], 0
+        for bound, n in zip([*map(str, self.buckets), "+Inf"], counts):
+            seen += n
+            buckets.append((bound, seen))
+        return buckets, count, total
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+        }
+
+
+def process_memory() -> Dict[str, float]:
+    """
+    Memory of this process in MB from /proc/self/smaps_rollup (Linux):
+    rss counts shared pages (mmapped index files, pages inherited from a
+    prefork parent) in full, pss splits them between the processes
+    sharing them, private is what this process alone holds.
+    """
+    fields = {"Rss": "rss_mb", "Pss": "pss_mb", "Shared_Clean": "shared_mb", "Shared_Dirty": "shared_mb",
+              "Private_Clean": "private_mb", "Private_Dirty": "private_mb"}
+    memory: Dict[str, float] = {}
+    try:
+        with open("/proc/self/smaps_rollup", "r") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in fields:
+                    memory[fields[name]] = memory.get(fields[name], 0.0) + int(value.split()[0]) / 1024
+    except OSError:
+        pass
+    return memory
@@ -1,26 +1,59 @@
-import openai
-from pydantic import BaseModel
-from agents.cardiologist import CardiologistAgent
-from agents.dermatologist import DermatologistAgent
-from agents.surgeon import SurgeonAgent
-from config import client
+import asyncio
+import contextlib
+import contextvars
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import config
+from config import (
+    CHAT_MODEL, GENERATION_CONCURRENCY, ROUTER_AUDIT_RATE, ROUTER_CONFIDENCE_THRESHOLD, ROUTER_LOG_PATH, ROUTING_BATCH_SIZE,
+    SEMANTIC_CACHE_SIZE, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_TTL
+)
+from router import LocalRouter, RouteLog
+from semantic_cache import SemanticCache
+from tracing import span, trace
 
 
+# Specialists are built on first use: the cardiologist pulls in FAISS, LangChain
+# and the OpenAI SDK and loads its index, which a dermatology question never needs.
+def _cardiologist(cardiology_path):
+    from agents.cardiologist import CardiologistAgent
+    return CardiologistAgent(cardiology_path)
+
+
+def _dermatologist(cardiology_path):
+    from agents.dermatologist import DermatologistAgent
+    return DermatologistAgent()
+
+
+def _surgeon(cardiology_path):
+    from agents.surgeon import SurgeonAgent
+    return SurgeonAgent()
+
+
+AGENT_FACTORIES = {
+    "cardiologist": _cardiologist,
+    "dermatologist": _dermatologist,
+    "surgeon": _surgeon,
+}
 
-class RouteDecision(BaseModel):
-    specialist: str
 
 class MedicalOrchestrator:
-    def __init__(self):
-        self.cardiologist = CardiologistAgent()
-        self.dermatologist = DermatologistAgent()
-        self.surgeon = SurgeonAgent()
+    def __init__(self, cardiology_path):
+        self.cardiology_path = cardiology_path
+        self._agents = {}
+        self._agent_locks = {specialist: threading.Lock() for specialist in AGENT_FACTORIES}
+        self.local_router = LocalRouter.from_corpora(
+            {"cardiologist": cardiology_path}, threshold=ROUTER_CONFIDENCE_THRESHOLD
+        )
+        self.route_log = RouteLog(ROUTER_LOG_PATH, audit_rate=ROUTER_AUDIT_RATE)
+        self.answer_cache = SemanticCache(SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_SIZE, SEMANTIC_CACHE_TTL)
+        # {"routing" | "retrieval" | "generation": asyncio.Semaphore}, set by the server; async paths only
+        self.stage_limits = {}
 
 
-    def route(self, question):
-        response = client.responses.create(
-              model="gpt-4o",
-              input=f"""
+    def _route_prompt(self, question):
+        return f"""
               You are a medical orchestrator.
 
               Determine which specialist should handle the following request:
@@ -33,20 +66,367 @@ class MedicalOrchestrator:
               Patient request:
               {question}
               """
-          )
 
-        specialist = response.output_text.strip().lower()
+
+    def _batch_route_prompt(self, questions):
+        requests = "\n".join(f"{i}. {q}" for i, q in enumerate(questions, start=1))
+        return f"""
+              You are a medical orchestrator.
+
+              For each numbered patient request below, determine which specialist should handle it:
+              - cardiologist
+              - dermatologist
+              - surgeon
+
+              Respond strictly with one line per request in the form "<number>: <specialist>".
+
+              Patient requests:
+              {requests}
+              """
+
+
+    def _agent(self, specialist):
+        """The specialist's agent, built by its factory on first use; None for an unknown specialist."""
+        if specialist not in AGENT_FACTORIES:
+            return None
+        agent = self._agents.get(specialist)
+        if agent is None:
+            with self._agent_locks[specialist]:
+                agent = self._agents.get(specialist)
+                if agent is None:
+                    with span("load", specialist=specialist):
+                        agent = AGENT_FACTORIES[specialist](self.cardiology_path)
+                    self._agents[specialist] = agent
+        return agent
+
+
+    @property
+    def cardiologist(self):
+        return self._agent("cardiologist")
+
+
+    def is_loaded(self, specialist):
+        return specialist in self._agents
+
+
+    def cache_stats(self):
+        """Semantic answer cache counters, and the embedding cache hit rate of each loaded agent."""
+        embeddings = {}
+        for specialist, agent in list(self._agents.items()):
+            cached = getattr(agent, "embeddings", None)
+            if hasattr(cached, "hit_rate"):
+                embeddings[specialist] = {"hits": cached.hits, "misses": cached.misses, "hit_rate": cached.hit_rate}
+        return {"answers": self.answer_cache.stats(), "embeddings": embeddings}
+
+
+    def warm(self, specialists=None):
+        """Builds agents (all by default) on a background thread, e.g. while the CLI waits for input."""
+        names = list(specialists or AGENT_FACTORIES)
+        thread = threading.Thread(target=lambda: [self._agent(name) for name in names], name="warm", daemon=True)
+        thread.start()
+        return thread
+
+
+    def _cache_lookup(self, question, specialist, vector=None):
+        """
+        Returns (question vector, cached answer or None); the vector is reused
+        by retrieval and store. A vector the caller already has is not recomputed.
+        """
+        agent = self._agent(specialist)
+        # only retrieval-backed agents have embeddings and answers worth caching
+        if self.answer_cache.max_entries <= 0 or agent is None or not hasattr(agent, "embeddings"):
+            return vector, None
+        with span("cache") as s:
+            if vector is None:
+                with span("embed"):
+                    vector = agent.embeddings.embed_query(question)
+            cached = self.answer_cache.lookup(vector, specialist, agent.index_version)
+            s.attrs["hit"] = cached is not None
+        return vector, cached
+
+
+    def _answer_args(self, agent, question, vector):
+        """Arguments for agent.answer(): an agent whose question was embedded for the cache searches with that vector."""
+        if vector is None:
+            return (question,)
+        return question, agent.retrieve(question, vector=vector)
+
+
+    def _cache_store(self, vector, specialist, answer):
+        if vector is not None:
+            self.answer_cache.store(vector, specialist, answer, self._agent(specialist).index_version)
+
+
+    def route(self, question):
+        with span("route") as s:
+            local, confidence = self.local_router.predict(question)
+            if confidence >= self.local_router.threshold:
+                llm = self.route_llm(question) if self.route_log.should_audit() else None
+                self.route_log.write(question, "local", local, confidence, local, llm)
+                s.attrs.update(source="local", specialist=local)
+                return local
+
+            specialist = self.route_llm(question)
+            self.route_log.write(question, "llm", specialist, confidence, local, specialist)
+            s.attrs.update(source="llm", specialist=specialist)
+            return specialist
+
+
+    def route_llm(self, question):
+        specialist = config.llm.complete(CHAT_MODEL, self._route_prompt(question)).strip().lower()
         return specialist
 
 
-    def answer(self, question):
-        specialist = self.route(question)
-        print("specialist: ", specialist)
-        if specialist == "cardiologist":
-            return self.cardiologist.answer(question)
-        elif specialist == "dermatologist":
-            return self.dermatologist.answer(question)
-        elif specialist == "surgeon":
-            return self.surgeon.answer(question)
-        else:
-            return "Could not determine the specialist."
\ No newline at end of file
+    def route_llm_batch(self, questions):
+        """Routes several questions in one LLM call. Returns {position: specialist} for parsed lines."""
+        output = config.llm.complete(CHAT_MODEL, self._batch_route_prompt(questions))
+
+        decided = {}
+        for line in output.splitlines():
+            m = re.match(r"^\s*(\d+)\s*[:.)-]\s*([A-Za-z]+)", line)
+            if m and 1 <= int(m.group(1)) <= len(questions):
+                decided[int(m.group(1)) - 1] = m.group(2).lower()
+        return decided
+
+
+    def route_many(self, questions):
+        """
+        Routes questions in bulk: the local router first, then batched LLM
+        calls for the rest. A question whose routing failed gets the
+        exception in its slot instead of a specialist name.
+        """
+        specialists = [None] * len(questions)
+        pending = []
+        for i, question in enumerate(questions):
+            local, confidence = self.local_router.predict(question)
+            if confidence >= self.local_router.threshold:
+                self.route_log.write(question, "local", local, confidence, local)
+                specialists[i] = local
+            else:
+                pending.append((i, local, confidence))
+
+        for start in range(0, len(pending), ROUTING_BATCH_SIZE):
+            batch = pending[start:start + ROUTING_BATCH_SIZE]
+            try:
+                decided = self.route_llm_batch([questions[i] for i, _, _ in batch])
+            except Exception:
+                decided = {}
+
+            for j, (i, local, confidence) in enumerate(batch):
+                try:
+                    # lines the batch answer did not cover are routed one by one
+                    specialist = decided[j] if j in decided else self.route_llm(questions[i])
+                except Exception as e:
+                    specialists[i] = e
+                    continue
+                self.route_log.write(questions[i], "llm", specialist, confidence, local, specialist)
+                specialists[i] = specialist
+
+        return specialists
+
+
+    async def aroute_llm(self, question):
+        specialist = await config.llm.acomplete(CHAT_MODEL, self._route_prompt(question))
+        return specialist.strip().lower()
+
+
+    def answer(self, question, request_id=None):
+        with trace(request_id):
+            specialist = self.route(question)
+            print("specialist: ", specialist)
+            agent = self._agent(specialist)
+            if agent is None:
+                return "Could not determine the specialist."
+
+            vector, cached = self._cache_lookup(question, specialist)
+            if cached is not None:
+                return cached
+            answer = agent.answer(*self._answer_args(agent, question, vector))
+            self._cache_store(vector, specialist, answer)
+            return answer
+
+
+    def stream_answer(self, question, on_route=None):
+        """
+        Like answer(), but yields the answer in pieces as the specialist
+        generates it. Only answer text is yielded; on_route(specialist), if
+        given, is called once the question is routed.
+        """
+        with trace():
+            specialist = self.route(question)
+            if on_route is not None:
+                on_route(specialist)
+            agent = self._agent(specialist)
+            if agent is None:
+                yield "Could not determine the specialist."
+                return
+
+            vector, cached = self._cache_lookup(question, specialist)
+            if cached is not None:
+                yield cached
+                return
+            parts = []
+            for token in agent.stream_answer(*self._answer_args(agent, question, vector)):
+                parts.append(token)
+                yield token
+            self._cache_store(vector, specialist, "".join(parts).strip())
+
+
+    def _stage(self, name):
+        limit = self.stage_limits.get(name)
+        return limit if limit is not None else contextlib.nullcontext()
+
+
+    async def _aagent(self, specialist):
+        """_agent() off the event loop, since the first call may load an index."""
+        if specialist in self._agents:
+            return self._agents[specialist]
+        return await asyncio.to_thread(self._agent, specialist)
+
+
+    async def _aembed_cardiology(self, question):
+        agent = await self._aagent("cardiologist")
+        with span("embed"):
+            return await agent.embeddings.aembed_query(question)
+
+
+    async def _aretrieve_cardiology(self, question, embedding):
+        """Cardiology retrieval with the question vector that the awaitable embedding yields."""
+        vector = await embedding
+        agent = await self._aagent("cardiologist")
+        async with self._stage("retrieval"):
+            return await agent.aretrieve(question, vector)
+
+
+    @staticmethod
+    def _abandon(*tasks):
+        """Cancels tasks whose results are no longer needed; finished ones are left as they are."""
+        for task in tasks:
+            if task is not None:
+                task.cancel()
+                # a worker thread may still finish; make sure its result or error is consumed
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+
+    async def aanswer(self, question, request_id=None):
+        """
+        Async variant of answer(). When the local router is not confident,
+        cardiology retrieval starts speculatively while the LLM picks the
+        specialist, and is dropped if the route turns out to be elsewhere.
+        Each stage waits for its slot in stage_limits, if one is set.
+        """
+        with trace(request_id):
+            return await self._aanswer(question)
+
+
+    async def _aanswer(self, question):
+        embedding = speculative = None
+        try:
+            with span("route") as s:
+                local, confidence = self.local_router.predict(question)
+                if confidence >= self.local_router.threshold:
+                    llm = None
+                    if self.route_log.should_audit():
+                        async with self._stage("routing"):
+                            llm = await self.aroute_llm(question)
+                    self.route_log.write(question, "local", local, confidence, local, llm)
+                    specialist = local
+                    s.attrs.update(source="local", specialist=specialist)
+                else:
+                    # one embedding serves the speculative search and, for a cardiology question, the cache lookup
+                    embedding = asyncio.create_task(self._aembed_cardiology(question))
+                    speculative = asyncio.create_task(self._aretrieve_cardiology(question, embedding))
+                    async with self._stage("routing"):
+                        specialist = await self.aroute_llm(question)
+                    self.route_log.write(question, "llm", specialist, confidence, local, specialist)
+                    s.attrs.update(source="llm", specialist=specialist, speculative=True)
+
+            if specialist == "cardiologist":
+                if embedding is None:
+                    embedding = asyncio.create_task(self._aembed_cardiology(question))
+                vector, cached = await asyncio.to_thread(self._cache_lookup, question, specialist, await embedding)
+                if cached is None:
+                    if speculative is not None:
+                        docs = await speculative
+                    else:
+                        docs = await self._aretrieve_cardiology(question, embedding)
+                    agent = await self._aagent("cardiologist")
+                    async with self._stage("generation"):
+                        answer = await agent.aanswer(question, docs)
+                    self._cache_store(vector, specialist, answer)
+                    return answer
+            else:
+                vector, cached = await asyncio.to_thread(self._cache_lookup, question, specialist)
+        finally:
+            # drops the speculative search when the question went elsewhere, was cached or failed
+            self._abandon(speculative, embedding)
+
+        if cached is not None:
+            return cached
+        agent = await self._aagent(specialist)
+        if agent is None:
+            return "Could not determine the specialist."
+        async with self._stage("generation"):
+            answer = await agent.aanswer(question)
+        self._cache_store(vector, specialist, answer)
+        return answer
+
+
+
+    def answer_many(self, questions):
+        """
+        Answers a list of questions in bulk and returns one dict per question,
+        in input order: {"question", "specialist", "answer", "error"}.
+        A failure affects only its own item.
+        """
+        with trace(questions=len(questions)):
+            return self._answer_many(questions)
+
+
+    def _answer_many(self, questions):
+        results = [{"question": q, "specialist": None, "answer": None, "error": None} for q in questions]
+
+        with span("route", questions=len(questions)):
+            specialists = self.route_many(questions)
+        for result, specialist in zip(results, specialists):
+            if isinstance(specialist, Exception):
+                result["error"] = f"routing failed: {specialist}"
+            else:
+                result["specialist"] = specialist
+
+        cardio = [i for i, r in enumerate(results) if r["specialist"] == "cardiologist"]
+        docs = {}
+        if cardio:
+            try:
+                docs = dict(zip(cardio, self.cardiologist.retrieve_many([questions[i] for i in cardio])))
+            except Exception:
+                # e.g. one question the embedding API rejects: retrieve one by one, so only that item fails
+                for i in cardio:
+                    try:
+                        docs[i] = self.cardiologist.retrieve(questions[i])
+                    except Exception as e:
+                        results[i]["error"] = f"retrieval failed: {e}"
+
+        def generate(i):
+            result = results[i]
+            if result["error"] is not None:
+                return
+            agent = self._agent(result["specialist"])
+            if agent is None:
+                result["answer"] = "Could not determine the specialist."
+                return
+            try:
+                if result["specialist"] == "cardiologist":
+                    result["answer"] = agent.answer(questions[i], docs[i])
+                else:
+                    result["answer"] = agent.answer(questions[i])
+            except Exception as e:
+                result["error"] = f"generation failed: {e}"
+
+        with ThreadPoolExecutor(max_workers=GENERATION_CONCURRENCY) as pool:
+            # each task gets its own copy of the context, so its spans carry the batch's request ID
+            futures = [pool.submit(contextvars.copy_context().run, generate, i) for i in range(len(questions))]
+            for future in futures:
+                future.result()
+
+        return results
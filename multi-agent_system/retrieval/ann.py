@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import math
+from typing import Optional
+
+import faiss
+import numpy as np
+
+# Index configurations selectable by name (INDEX_TYPE / --index-type).
+#   flat  - exact search, full-precision vectors
+#   ivf   - inverted file over k-means cells, full-precision vectors
+#   ivfpq - inverted file with product-quantized codes (smallest memory)
+#   hnsw  - graph index, fast and accurate but no single-vector removal
+INDEX_TYPES = ("flat", "ivf", "ivfpq", "hnsw")
+
+# Below this many vectors PQ codebooks cannot be trained properly.
+MIN_PQ_VECTORS = 10_000
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+
+
+def _nlist(n: int) -> int:
+    # ~4*sqrt(n) cells, while keeping the 39 training points per cell faiss asks for
+    return max(1, min(int(4 * math.sqrt(n)), n // 39))
+
+
+def _pq_m(dim: int) -> int:
+    """Number of PQ sub-quantizers: the largest of these that divides dim."""
+    for m in (96, 64, 48, 32, 24, 16, 8, 4, 2):
+        if dim % m == 0 and dim // m >= 4:
+            return m
+    return 1
+
+
+def is_ivf(index: faiss.Index) -> bool:
+    try:
+        faiss.extract_index_ivf(index)
+        return True
+    except RuntimeError:
+        return False
+
+
+def built_type(index: faiss.Index) -> str:
+    """INDEX_TYPES name of a built index; "ivf" when an ivfpq build fell back for lack of vectors."""
+    if is_ivf(index):
+        ivf = faiss.downcast_index(faiss.extract_index_ivf(index))
+        return "ivfpq" if isinstance(ivf, faiss.IndexIVFPQ) else "ivf"
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    return "hnsw" if isinstance(inner, faiss.IndexHNSW) else "flat"
+
+
+def make_index(index_type: str, vectors: np.ndarray, ids: np.ndarray) -> faiss.Index:
+    """Builds, trains and fills an index of the given type, with vectors stored under ids."""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+
+    n, dim = vectors.shape
+    if index_type == "ivfpq" and n < MIN_PQ_VECTORS:
+        print(f"[index] {n} vectors are too few to train PQ, using ivf instead")
+        index_type = "ivf"
+
+    if index_type == "flat":
+        index = faiss.IndexIDMap2(faiss.IndexFlatL2(dim))
+    elif index_type == "hnsw":
+        index = faiss.index_factory(dim, f"IDMap2,HNSW{HNSW_M}")
+        faiss.downcast_index(index.index).hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    else:
+        spec = f"IVF{_nlist(n)},Flat" if index_type == "ivf" else f"IVF{_nlist(n)},PQ{_pq_m(dim)}"
+        index = faiss.index_factory(dim, spec)
+        # a hashtable direct map keeps reconstruct() and remove_ids() working with our own ids
+        faiss.extract_index_ivf(index).set_direct_map_type(faiss.DirectMap.Hashtable)
+        index.train(vectors)
+
+    index.add_with_ids(vectors, ids)
+    return index
+
+
+def configure_search(index: faiss.Index, nprobe: int = 16, ef_search: int = 64) -> None:
+    """Applies the query-time knobs: cells probed for IVF, candidate list size for HNSW."""
+    if is_ivf(index):
+        faiss.extract_index_ivf(index).nprobe = nprobe
+    elif isinstance(index, faiss.IndexIDMap2):
+        inner = faiss.downcast_index(index.index)
+        if isinstance(inner, faiss.IndexHNSW):
+            inner.hnsw.efSearch = ef_search
+
+
+def supports_removal(index: faiss.Index) -> bool:
+    if isinstance(index, faiss.IndexIDMap2):
+        return not isinstance(faiss.downcast_index(index.index), faiss.IndexHNSW)
+    return True
+
+
+def remove_ids(index: faiss.Index, ids: np.ndarray) -> None:
+    ids = np.ascontiguousarray(ids, dtype=np.int64)
+    if is_ivf(index):
+        # the hashtable direct map only accepts an explicit id array
+        index.remove_ids(faiss.IDSelectorArray(len(ids), faiss.swig_ptr(ids)))
+    else:
+        index.remove_ids(ids)
+
+
+def search_params(index: faiss.Index, selector: Optional[faiss.IDSelector] = None) -> faiss.SearchParameters:
+    if is_ivf(index):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=faiss.extract_index_ivf(index).nprobe)
+    return faiss.SearchParameters(sel=selector)
+
+
+def mmap_flags(index_type: str) -> int:
+    """IVF maps its inverted lists, flat and HNSW map their flat vector storage."""
+    if index_type in ("ivf", "ivfpq"):
+        return faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    return getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
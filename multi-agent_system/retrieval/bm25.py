@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import json
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from retrieval.corpus import list_text_files, read_text
+
+BM25_DIR = "bm25"
+VOCAB_FILE = "vocab.json"
+DOCS_FILE = "docs.json"
+POSTINGS_IDS_FILE = "postings_ids.npy"
+POSTINGS_TF_FILE = "postings_tf.npy"
+DOC_LENGTHS_FILE = "doc_lengths.npy"
+
+# Terms from the KEYWORDS line are counted this many times.
+KEYWORDS_BOOST = 2
+
+TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9\-]*")
+STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "for", "from", "has", "have", "in", "is", "it",
+    "its", "of", "on", "or", "that", "the", "this", "to", "was", "were", "which", "with", "what", "does",
+    "do", "i", "my", "me", "can", "should", "how", "when", "why", "keywords",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN_RE.findall((text or "").lower()) if t not in STOP_WORDS]
+
+
+def chunk_terms(text: str) -> List[str]:
+    """Tokens of a chunk: title, body, and the KEYWORDS line with a boost."""
+    terms = []
+    for line in text.splitlines():
+        tokens = tokenize(line)
+        if line.strip().lower().startswith("keywords:"):
+            tokens = tokens * KEYWORDS_BOOST
+        terms.extend(tokens)
+    return terms
+
+
+def build_bm25(folder_path: str, out_dir: str, corpus_hash: str) -> None:
+    """
+    Inverted index over every chunk file: postings are stored term by term
+    as two flat arrays (doc ids, term frequencies) addressed through the
+    vocabulary's (offset, length) pairs. No network access is needed.
+    """
+    rel_paths = list_text_files(folder_path)
+    docs = []
+    lengths = []
+    postings: Dict[str, List[Tuple[int, int]]] = {}
+
+    for rel_path in rel_paths:
+        text = read_text(folder_path, rel_path)
+        if not text:
+            continue
+        doc_id = len(docs)
+        docs.append(rel_path)
+        terms = chunk_terms(text)
+        lengths.append(len(terms))
+        for term, tf in Counter(terms).items():
+            postings.setdefault(term, []).append((doc_id, tf))
+
+    vocab = {}
+    ids = []
+    tfs = []
+    for term in sorted(postings):
+        plist = postings[term]
+        vocab[term] = [len(ids), len(plist)]
+        ids.extend(d for d, _ in plist)
+        tfs.extend(min(tf, 65535) for _, tf in plist)
+
+    os.makedirs(out_dir, exist_ok=True)
+    # every file is replaced, never rewritten: running processes may have the old postings memory-mapped
+    _save_array(os.path.join(out_dir, POSTINGS_IDS_FILE), np.array(ids, dtype=np.int32))
+    _save_array(os.path.join(out_dir, POSTINGS_TF_FILE), np.array(tfs, dtype=np.uint16))
+    _save_array(os.path.join(out_dir, DOC_LENGTHS_FILE), np.array(lengths, dtype=np.float32))
+    _save_json(os.path.join(out_dir, VOCAB_FILE), vocab, separators=(",", ":"))
+    # written last: its corpus_hash marks the index as complete
+    _save_json(os.path.join(out_dir, DOCS_FILE), {"corpus_hash": corpus_hash, "docs": docs}, ensure_ascii=False)
+
+
+def _save_array(path: str, array: np.ndarray) -> None:
+    with open(path + ".tmp", "wb") as f:
+        np.save(f, array)
+    os.replace(path + ".tmp", path)
+
+
+def _save_json(path: str, data, **kwargs) -> None:
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f, **kwargs)
+    os.replace(path + ".tmp", path)
+
+
+class BM25Index:
+    """Read side of the on-disk BM25 index. Postings are memory-mapped."""
+
+    def __init__(self, index_dir: str, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        with open(os.path.join(index_dir, DOCS_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.corpus_hash = meta["corpus_hash"]
+        self.docs = meta["docs"]
+        with open(os.path.join(index_dir, VOCAB_FILE), "r", encoding="utf-8") as f:
+            self.vocab = json.load(f)
+        self.ids = np.load(os.path.join(index_dir, POSTINGS_IDS_FILE), mmap_mode="r")
+        self.tfs = np.load(os.path.join(index_dir, POSTINGS_TF_FILE), mmap_mode="r")
+        lengths = np.load(os.path.join(index_dir, DOC_LENGTHS_FILE))
+        avg = float(lengths.mean()) if len(lengths) else 1.0
+        # per-document part of the BM25 denominator, computed once
+        self._norm = (self.k1 * (1 - self.b + self.b * lengths / avg)).astype(np.float32)
+        self._folders = np.array([doc.split("/", 1)[0] for doc in self.docs])
+        self._masks: Dict[Tuple[str, ...], np.ndarray] = {}
+
+    def _mask(self, folders: Sequence[str]) -> np.ndarray:
+        key = tuple(sorted(folders))
+        if key not in self._masks:
+            self._masks[key] = np.isin(self._folders, key)
+        return self._masks[key]
+
+    def search(self, query: str, k: int = 10, folders: Optional[Sequence[str]] = None) -> List[Tuple[str, float]]:
+        """folders keeps only chunks under those top-level folders (the shard categories)."""
+        n = len(self.docs)
+        scores = np.zeros(n, dtype=np.float32)
+        for term in set(tokenize(query)):
+            entry = self.vocab.get(term)
+            if entry is None:
+                continue
+            offset, df = entry
+            ids = self.ids[offset:offset + df]
+            tf = self.tfs[offset:offset + df].astype(np.float32)
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            scores[ids] += idf * tf * (self.k1 + 1) / (tf + self._norm[ids])
+        if folders:
+            scores[~self._mask(folders)] = 0
+
+        hits = np.flatnonzero(scores)
+        if not len(hits):
+            return []
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        hits = hits[np.argsort(-scores[hits])]
+        return [(self.docs[i], float(scores[i])) for i in hits]
+
+
+def load_or_build_bm25(folder_path: str, index_dir: str, corpus_hash: str) -> BM25Index:
+    """Lexical index lives in <index_dir>/bm25 and follows the vector index's corpus hash."""
+    out_dir = os.path.join(index_dir, BM25_DIR)
+    docs_path = os.path.join(out_dir, DOCS_FILE)
+    current: Optional[str] = None
+    if os.path.exists(docs_path):
+        try:
+            with open(docs_path, "r", encoding="utf-8") as f:
+                current = json.load(f).get("corpus_hash")
+        except (OSError, ValueError):
+            current = None
+    if current != corpus_hash:
+        print(f"[bm25] building {out_dir}")
+        build_bm25(folder_path, out_dir, corpus_hash)
+    return BM25Index(out_dir)
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[str]:
+    """Merges ranked id lists; each list contributes 1 / (k + rank) per id."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
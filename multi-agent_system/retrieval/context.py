@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import os
+import re
+from typing import Dict, List, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+from retrieval.embedding_job import count_tokens
+from retrieval.hierarchical import document_of
+
+# Longest overlap looked for between consecutive chunks (chunkify uses 30 words).
+MAX_OVERLAP_WORDS = 60
+# A passage is cut to fit the budget only if at least this many tokens are left.
+MIN_PASSAGE_TOKENS = 50
+
+CHUNK_NAME_RE = re.compile(r"^(\d+)\.txt$")
+
+
+def split_chunk(text: str) -> Tuple[str, str]:
+    """(title, body) of a chunk file, without the KEYWORDS line."""
+    lines = [ln for ln in text.strip().splitlines() if not ln.strip().lower().startswith("keywords:")]
+    if not lines:
+        return "", ""
+    body = "\n".join(lines[1:]).strip()
+    if not body:
+        # single-line chunks (e.g. abstracts) have no separate title
+        return "", lines[0].strip()
+    return lines[0].strip(), body
+
+
+def _chunk_number(source: str) -> int:
+    m = CHUNK_NAME_RE.match(os.path.basename(source))
+    return int(m.group(1)) if m else -1
+
+
+def stitch(previous: str, following: str) -> str:
+    """Joins two consecutive chunks, dropping the words the second one repeats from the first."""
+    a = previous.split()
+    b = following.split()
+    for n in range(min(MAX_OVERLAP_WORDS, len(a), len(b)), 0, -1):
+        if a[-n:] == b[:n]:
+            return " ".join(a + b[n:])
+    return " ".join(a + b)
+
+
+def _passages(docs: Sequence[Document]) -> List[Tuple[str, str]]:
+    """(title, text) per run of consecutive chunks of one document, in order of the best-ranked chunk."""
+    groups: Dict[str, List[Tuple[int, int, Document]]] = {}
+    for rank, doc in enumerate(docs):
+        source = doc.metadata.get("source", str(rank))
+        groups.setdefault(document_of(source), []).append((_chunk_number(source), rank, doc))
+
+    passages = []
+    for members in groups.values():
+        members.sort(key=lambda m: (m[0], m[1]))
+        run_rank, run_number, title, text = None, None, "", ""
+        for number, rank, doc in members:
+            chunk_title, body = split_chunk(doc.page_content)
+            if run_number is not None and number >= 0 and number == run_number + 1:
+                text = stitch(text, body)
+                run_rank = min(run_rank, rank)
+            else:
+                if run_rank is not None:
+                    passages.append((run_rank, title, text))
+                run_rank, title, text = rank, chunk_title, body
+            run_number = number
+        passages.append((run_rank, title, text))
+
+    passages.sort(key=lambda p: p[0])
+    return [(title, text) for _, title, text in passages]
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    words = text.split()
+    keep = len(words)
+    while keep > 0:
+        keep = int(keep * min(0.95, max_tokens / max(1, count_tokens(" ".join(words[:keep])))))
+        candidate = " ".join(words[:keep]) + " ..."
+        if count_tokens(candidate) <= max_tokens:
+            return candidate
+    return ""
+
+
+def assemble_context(docs: Sequence[Document], token_budget: int = 1500) -> str:
+    """
+    Prompt context from retrieved chunks: KEYWORDS lines dropped, the title
+    printed once per passage, consecutive chunks of a document stitched
+    into one passage without their overlap, and passages packed best
+    first until token_budget is used up (the last one may be cut short).
+    """
+    parts = []
+    used = 0
+    for title, text in _passages(docs):
+        passage = f"{title}\n{text}" if title else text
+        tokens = count_tokens(passage) + 2  # the blank line between passages
+        if used + tokens <= token_budget:
+            parts.append(passage)
+            used += tokens
+            continue
+        remaining = token_budget - used - 2
+        if remaining >= MIN_PASSAGE_TOKENS:
+            cut = _truncate(text, remaining - (count_tokens(title) + 1 if title else 0))
+            if cut:
+                parts.append(f"{title}\n{cut}" if title else cut)
+        break
+    return "\n\n".join(parts)
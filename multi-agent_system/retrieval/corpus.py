@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional
+
+from langchain_core.documents import Document
+
+# Near-duplicate map written by scripts/data_processing/dedup_chunks.py
+DUPLICATES_FILE = "duplicates.json"
+
+
+def read_duplicates(folder_path: str) -> Dict[str, str]:
+    """
+    {duplicate: canonical} written by scripts/data_processing/dedup_chunks.py,
+    both relative to folder_path (a canonical chunk in another category starts with ../).
+    """
+    path = os.path.join(folder_path, DUPLICATES_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def list_text_files(folder_path: str) -> List[str]:
+    """
+    Relative paths of every .txt file under folder_path, in a stable order.
+    Files listed as near-duplicates in a duplicates.json are left out.
+    """
+    paths = []
+    skip = set()
+    # top-down walk: a category's duplicates.json is read before its document folders
+    for root, dirs, files in os.walk(folder_path):
+        if DUPLICATES_FILE in files:
+            skip.update(os.path.normpath(os.path.join(root, p)) for p in read_duplicates(root))
+        for file in files:
+            path = os.path.join(root, file)
+            if file.endswith(".txt") and os.path.normpath(path) not in skip:
+                paths.append(os.path.relpath(path, folder_path))
+    return sorted(paths)
+
+
+def read_text(folder_path: str, rel_path: str) -> str:
+    with open(os.path.join(folder_path, rel_path), "r", encoding="utf-8") as f:
+        return f.read().strip()
+
+
+def file_sha256(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def stat_signature(folder_path: str, rel_paths: List[str]) -> str:
+    """
+    Cheap corpus fingerprint from (path, size, mtime) only.
+    Used to skip hashing file contents when nothing was touched.
+    """
+    h = hashlib.sha256()
+    for rel_path in rel_paths:
+        st = os.stat(os.path.join(folder_path, rel_path))
+        h.update(f"{rel_path}\0{st.st_size}\0{st.st_mtime_ns}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def fingerprint_files(
+    folder_path: str, rel_paths: List[str], previous: Optional[Dict[str, dict]] = None
+) -> Dict[str, dict]:
+    """
+    Per-file fingerprint table {rel_path: {size, mtime_ns, sha256}}.
+    Files whose size and mtime match `previous` reuse the stored hash
+    instead of being read again.
+    """
+    previous = previous or {}
+    table = {}
+    for rel_path in rel_paths:
+        path = os.path.join(folder_path, rel_path)
+        st = os.stat(path)
+        prev = previous.get(rel_path)
+        if prev and prev["size"] == st.st_size and prev["mtime_ns"] == st.st_mtime_ns:
+            digest = prev["sha256"]
+        else:
+            digest = file_sha256(path)
+        table[rel_path] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": digest}
+    return table
+
+
+def corpus_hash(fingerprints: Dict[str, dict]) -> str:
+    """Content hash of the whole corpus: paths and file hashes."""
+    h = hashlib.sha256()
+    for rel_path in sorted(fingerprints):
+        h.update(f"{rel_path}\0{fingerprints[rel_path]['sha256']}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def load_documents(folder_path: str, rel_paths: List[str]) -> List[Document]:
+    documents = []
+    for rel_path in rel_paths:
+        text = read_text(folder_path, rel_path)
+        if text:
+            documents.append(Document(page_content=text, metadata={"source": rel_path}))
+    return documents
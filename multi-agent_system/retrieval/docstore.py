@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import json
+import mmap
+import os
+from typing import Dict, Optional, Union
+
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_core.documents import Document
+
+TEXTS_FILE = "texts.bin"
+TABLE_FILE = "texts_table.npy"
+SOURCES_FILE = "sources.json"
+
+
+def write_docstore(index_dir: str, index_to_docstore_id: Dict[int, str], documents: Dict[str, Document]) -> None:
+    """
+    Packs the chunk texts into one UTF-8 file ordered by vector id. The
+    table holds (vector id, start, end) byte offsets per row, the sources
+    file the docstore id of each row.
+    """
+    ids = sorted(index_to_docstore_id)
+    sources = [index_to_docstore_id[i] for i in ids]
+    table = np.zeros((len(ids), 3), dtype=np.int64)
+
+    texts_path = os.path.join(index_dir, TEXTS_FILE)
+    with open(texts_path + ".tmp", "wb") as f:
+        offset = 0
+        for row, (vector_id, source) in enumerate(zip(ids, sources)):
+            data = documents[source].page_content.encode("utf-8")
+            f.write(data)
+            table[row] = (vector_id, offset, offset + len(data))
+            offset += len(data)
+    os.replace(texts_path + ".tmp", texts_path)
+
+    table_path = os.path.join(index_dir, TABLE_FILE)
+    with open(table_path + ".tmp", "wb") as f:
+        np.save(f, table)
+    os.replace(table_path + ".tmp", table_path)
+
+    sources_path = os.path.join(index_dir, SOURCES_FILE)
+    with open(sources_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(sources, f, ensure_ascii=False)
+    os.replace(sources_path + ".tmp", sources_path)
+
+
+class MmapDocstore(Docstore):
+    """
+    Read-only docstore over the packed texts of a saved index. Only the
+    offset table and the source paths are loaded; a text is decoded from
+    the memory-mapped file when a search hit asks for it.
+    """
+
+    def __init__(self, index_dir: str):
+        self.table = np.load(os.path.join(index_dir, TABLE_FILE), mmap_mode="r")
+        with open(os.path.join(index_dir, SOURCES_FILE), "r", encoding="utf-8") as f:
+            self.sources = json.load(f)
+        self._rows = {source: row for row, source in enumerate(self.sources)}
+
+        self._file = open(os.path.join(index_dir, TEXTS_FILE), "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._texts = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self) -> int:
+        return len(self.sources)
+
+    def index_to_docstore_id(self) -> Dict[int, str]:
+        return {int(vector_id): source for vector_id, source in zip(self.table[:, 0], self.sources)}
+
+    def _document(self, row: int) -> Document:
+        _, start, end = self.table[row]
+        text = self._texts[start:end].decode("utf-8")
+        return Document(page_content=text, metadata={"source": self.sources[row]})
+
+    def search(self, search: str) -> Union[str, Document]:
+        row = self._rows.get(search)
+        if row is None:
+            return f"ID {search} not found."
+        return self._document(row)
+
+    def get(self, vector_id: int) -> Optional[Document]:
+        """Document stored under a vector id, found by binary search in the id column."""
+        ids = self.table[:, 0]
+        row = int(np.searchsorted(ids, vector_id))
+        if row == len(ids) or ids[row] != vector_id:
+            return None
+        return self._document(row)
+
+    def to_dict(self) -> Dict[str, Document]:
+        """All documents, for loading into an InMemoryDocstore that is going to be modified."""
+        return {source: self._document(row) for row, source in enumerate(self.sources)}
@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import threading
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from tracing import annotate
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding store on SQLite, keyed by
+    (model name, sha256 of the normalized text). Vectors are float32 blobs.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._connect()
+        # a SQLite connection must not be used across fork(); prefork workers get their own
+        os.register_at_fork(after_in_child=self._connect)
+
+    def _connect(self) -> None:
+        # an inherited connection is kept, not closed: closing it could checkpoint the WAL under other processes
+        self._inherited = getattr(self, "_conn", None)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, key TEXT NOT NULL, vector BLOB NOT NULL,"
+            " PRIMARY KEY (model, key)) WITHOUT ROWID"
+        )
+        self._conn.commit()
+
+    def get_many(self, model: str, keys: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        with self._lock:
+            # stay well below SQLite's host parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                marks = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE model = ? AND key IN ({marks})",
+                    [model, *batch],
+                )
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, model: str, items: Dict[str, List[float]]) -> None:
+        rows = [(model, key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items.items()]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", rows)
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+_caches: Dict[str, EmbeddingCache] = {}
+
+
+def open_cache(path: str) -> EmbeddingCache:
+    """One shared cache object per file, so every agent hits the same store."""
+    if path not in _caches:
+        _caches[path] = EmbeddingCache(path)
+    return _caches[path]
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that consults the cache first and sends only the
+    missing texts to the wrapped model. With recordings set (record mode)
+    every vector returned, cached or not, is also saved there.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache, model_name: str,
+                 recordings: Optional[EmbeddingCache] = None):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model_name = model_name
+        self.recordings = recordings
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def _count(self, hits: int, misses: int) -> None:
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_with_misses(texts)[0]
+
+    def embed_with_misses(self, texts: List[str]) -> Tuple[List[List[float]], List[str]]:
+        """embed_documents(), plus the texts that were not cached and went to the wrapped model."""
+        keys = [text_key(t) for t in texts]
+        found = self.cache.get_many(self.model_name, list(set(keys)))
+
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(self.model_name, fresh)
+            found.update({k: np.asarray(v, dtype=np.float32) for k, v in fresh.items()})
+
+        if self.recordings is not None:
+            self.recordings.put_many(self.model_name, {key: found[key] for key in set(keys)})
+        self._count(len(texts) - len(missing), len(missing))
+        annotate(cache_hits=len(texts) - len(missing), cache_misses=len(missing))
+        return [found[key].tolist() for key in keys], list(missing.values())
+
+    def embed_query(self, text: str) -> List[float]:
+        key = text_key(text)
+        found = self.cache.get_many(self.model_name, [key])
+        if key in found:
+            if self.recordings is not None:
+                self.recordings.put_many(self.model_name, found)
+            self._count(1, 0)
+            annotate(cache_hit=True)
+            return found[key].tolist()
+
+        vector = self.embeddings.embed_query(text)
+        self.cache.put_many(self.model_name, {key: vector})
+        if self.recordings is not None:
+            self.recordings.put_many(self.model_name, {key: vector})
+        self._count(0, 1)
+        annotate(cache_hit=False)
+        return vector
+
+
+def make_embeddings(model_name: str, cache_path: str) -> CachedEmbeddings:
+    """Cached embeddings from the configured MODEL_BACKEND (live OpenAI by default)."""
+    from backends import embedding_backend
+    from config import MODEL_BACKEND, RECORDINGS_PATH, STUB_EMBEDDING_DIM, backend_latency
+
+    embeddings = embedding_backend(MODEL_BACKEND, model_name, RECORDINGS_PATH, backend_latency(), STUB_EMBEDDING_DIM)
+    # stub vectors must never be served as real ones from a shared cache file
+    cache_model = f"stub/{model_name}" if MODEL_BACKEND == "stub" else model_name
+    # recording sits outside the working cache, so texts it already holds are recorded too
+    recordings = open_cache(RECORDINGS_PATH) if MODEL_BACKEND == "record" else None
+    return CachedEmbeddings(embeddings, open_cache(cache_path), cache_model, recordings)
@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+try:
+    import tiktoken
+
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _ENCODING = None
+
+
+def count_tokens(text: str) -> int:
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    # rough estimate for English text
+    return max(1, len(text) // 4)
+
+
+def _batches(texts: Iterable[str], batch_size: int) -> Iterator[List[str]]:
+    batch = []
+    for text in texts:
+        batch.append(text)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _batch_key(model_name: str, batch: List[str]) -> str:
+    h = hashlib.sha256(model_name.encode("utf-8"))
+    for text in batch:
+        h.update(hashlib.sha256(text.encode("utf-8")).digest())
+    return h.hexdigest()
+
+
+class EmbeddingJob:
+    """
+    Embeds a stream of texts in fixed-size batches with a bounded number of
+    batches in flight. Every finished batch is checkpointed as .npy under
+    checkpoint_dir (named by a hash of its texts), so a crashed build picks
+    up the completed batches on the next run instead of re-embedding them.
+    Throughput in tokens/s counts only the texts sent to the API, not those
+    served from checkpoints or the embedding cache.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_name: str,
+        checkpoint_dir: Optional[str] = None,
+        batch_size: int = 256,
+        max_workers: int = 4,
+        report_every: int = 10,
+    ):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.checkpoint_dir = checkpoint_dir
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.report_every = report_every
+        self.stats = {}
+
+    def _checkpoint_path(self, key: str) -> Optional[str]:
+        if not self.checkpoint_dir:
+            return None
+        return os.path.join(self.checkpoint_dir, f"{key}.npy")
+
+    def _embed_batch(self, batch: List[str]) -> Tuple[np.ndarray, int, int, bool]:
+        """Returns (vectors, texts sent to the API, their tokens, loaded from checkpoint)."""
+        path = self._checkpoint_path(_batch_key(self.model_name, batch))
+        if path and os.path.exists(path):
+            return np.load(path), 0, 0, True
+
+        # transient API errors are retried by the OpenAI client itself
+        embed_with_misses = getattr(self.embeddings, "embed_with_misses", None)
+        if embed_with_misses is not None:
+            # a CachedEmbeddings sends only the texts it has no vector for
+            vectors, sent = embed_with_misses(batch)
+        else:
+            vectors, sent = self.embeddings.embed_documents(batch), batch
+        vectors = np.array(vectors, dtype=np.float32)
+
+        if path:
+            np.save(path + ".tmp.npy", vectors)
+            os.replace(path + ".tmp.npy", path)
+        return vectors, len(sent), sum(count_tokens(t) for t in sent), False
+
+    def run(self, texts: Iterable[str]) -> np.ndarray:
+        if self.checkpoint_dir:
+            os.makedirs(self.checkpoint_dir, exist_ok=True)
+
+        results = {}
+        chunks_done = 0
+        tokens_sent = 0
+        resumed = 0
+        cached = 0
+        started = time.perf_counter()
+        max_in_flight = self.max_workers * 2
+
+        def report(final: bool = False) -> None:
+            elapsed = max(time.perf_counter() - started, 1e-9)
+            self.stats = {
+                "chunks": chunks_done,
+                "resumed_chunks": resumed,
+                "cached_chunks": cached,
+                "tokens": tokens_sent,
+                "seconds": elapsed,
+                "chunks_per_sec": chunks_done / elapsed,
+                "tokens_per_sec": tokens_sent / elapsed,
+            }
+            prefix = "done" if final else "progress"
+            print(
+                f"[embed] {prefix}: {chunks_done} chunks ({resumed} from checkpoints, {cached} from the cache), "
+                f"{self.stats['chunks_per_sec']:.1f} chunks/s, {self.stats['tokens_per_sec']:.0f} tokens/s"
+            )
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            pending = {}
+            batches_done = 0
+
+            def drain(block_until: int) -> None:
+                nonlocal chunks_done, tokens_sent, resumed, cached, batches_done
+                while len(pending) > block_until:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        number, size = pending.pop(future)
+                        vectors, sent, tokens, from_checkpoint = future.result()
+                        results[number] = vectors
+                        chunks_done += size
+                        tokens_sent += tokens
+                        if from_checkpoint:
+                            resumed += size
+                        else:
+                            cached += size - sent
+                        batches_done += 1
+                        if self.report_every and batches_done % self.report_every == 0:
+                            report()
+
+            for number, batch in enumerate(_batches(texts, self.batch_size)):
+                pending[pool.submit(self._embed_batch, batch)] = (number, len(batch))
+                drain(max_in_flight - 1)
+            drain(0)
+
+        report(final=True)
+        if not results:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.concatenate([results[i] for i in range(len(results))])
+
+    def clear_checkpoints(self) -> None:
+        if self.checkpoint_dir and os.path.isdir(self.checkpoint_dir):
+            shutil.rmtree(self.checkpoint_dir)
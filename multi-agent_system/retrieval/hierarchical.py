@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import os
+from collections import defaultdict
+from typing import List, Sequence, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from retrieval.ann import search_params
+
+SUMMARY_FILE = "summary.txt"
+
+
+def document_of(source: str) -> str:
+    """Document directory of a chunk, e.g. 'Cases/<title>' for 'Cases/<title>/0003.txt'."""
+    return os.path.dirname(source)
+
+
+class HierarchicalIndex:
+    """
+    Two-stage search over an existing vector store. A coarse flat index of
+    one vector per document (its summary.txt, or the mean of its chunks if
+    there is no summary) picks the top n_docs documents; the query is then
+    compared only against the chunks of those documents, through an id
+    selector on the main index.
+    """
+
+    def __init__(self, vectorstore: FAISS):
+        self.vectorstore = vectorstore
+        index = vectorstore.index
+
+        chunks = defaultdict(list)
+        summaries = {}
+        for vector_id, source in vectorstore.index_to_docstore_id.items():
+            doc = document_of(source)
+            if os.path.basename(source) == SUMMARY_FILE:
+                summaries[doc] = int(vector_id)
+            else:
+                chunks[doc].append(int(vector_id))
+
+        self.documents = sorted(chunks)
+        self.chunk_ids = [np.array(chunks[doc], dtype=np.int64) for doc in self.documents]
+
+        coarse = []
+        for doc, ids in zip(self.documents, self.chunk_ids):
+            if doc in summaries:
+                coarse.append(index.reconstruct(summaries[doc]))
+            else:
+                coarse.append(self._vectors(ids).mean(axis=0))
+        self.coarse = faiss.IndexFlatL2(index.d)
+        if coarse:
+            self.coarse.add(np.vstack(coarse).astype(np.float32))
+
+    def _vectors(self, ids: np.ndarray) -> np.ndarray:
+        return self.vectorstore.index.reconstruct_batch(ids)
+
+    def search(self, vector: Sequence[float], k: int = 3, n_docs: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns (vector ids, squared L2 distances) of the k best chunks, best first."""
+        query = np.asarray(vector, dtype=np.float32).reshape(1, -1)
+        picked = []
+        if self.documents and n_docs > 0:
+            _, top = self.coarse.search(query, min(n_docs, len(self.documents)))
+            picked = [self.chunk_ids[i] for i in top[0] if i != -1]
+        if not picked:
+            # no documents to search, e.g. an index of summaries only
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        ids = np.concatenate(picked)
+
+        params = search_params(self.vectorstore.index, faiss.IDSelectorBatch(ids))
+        dists, found = self.vectorstore.index.search(query, k, params=params)
+        keep = found[0] != -1
+        return found[0][keep], dists[0][keep]
+
+    def similarity_search_by_vector(self, vector: Sequence[float], k: int = 3, n_docs: int = 10) -> List[Document]:
+        ids, _ = self.search(vector, k, n_docs)
+        store = self.vectorstore
+        return [store.docstore.search(store.index_to_docstore_id[int(i)]) for i in ids]
+
+
+def recall_at_k(hierarchy: HierarchicalIndex, queries: np.ndarray, k: int, n_docs: int) -> float:
+    """Share of the exact (flat) top-k chunk hits that the two-stage search also returns."""
+    queries = np.asarray(queries, dtype=np.float32)
+    summary_ids = {i for i, s in hierarchy.vectorstore.index_to_docstore_id.items()
+                   if os.path.basename(s) == SUMMARY_FILE}
+    # over-fetch so that summary vectors can be dropped from the exact results
+    _, exact = hierarchy.vectorstore.index.search(queries, k + len(summary_ids) if summary_ids else k)
+
+    found = 0
+    total = 0
+    for query, row in zip(queries, exact):
+        truth = [int(i) for i in row if i != -1 and int(i) not in summary_ids][:k]
+        got, _ = hierarchy.search(query, k, n_docs)
+        found += len(set(truth) & set(int(i) for i in got))
+        total += len(truth)
+    return found / total if total else 0.0
@@ -0,0 +1,275 @@
+from __future__ import annotations
+
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from retrieval import ann
+from retrieval.corpus import corpus_hash, fingerprint_files, list_text_files, load_documents, stat_signature
+from retrieval.docstore import MmapDocstore, write_docstore
+from retrieval.embedding_job import EmbeddingJob
+
+# Bump when the on-disk layout changes; old indexes are rebuilt.
+FORMAT_VERSION = 3
+
+INDEX_FILE = "index.faiss"
+FINGERPRINTS_FILE = "fingerprints.json"
+MANIFEST_FILE = "manifest.json"
+CHECKPOINT_DIR = "checkpoints"
+
+
+def _atomic_write_bytes(path: str, data: bytes) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _read_json(path: str) -> Optional[dict]:
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path: str, data: dict) -> None:
+    _atomic_write_bytes(path, json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8"))
+
+
+def _embed(documents: List[Document], embeddings: Embeddings, job: Optional[EmbeddingJob] = None) -> np.ndarray:
+    texts = [doc.page_content for doc in documents]
+    if job is None:
+        return np.array(embeddings.embed_documents(texts), dtype=np.float32)
+    return job.run(texts)
+
+
+def _make_job(embeddings: Embeddings, model_name: str, index_dir: str, batch_size: int,
+              max_workers: int) -> EmbeddingJob:
+    return EmbeddingJob(
+        embeddings,
+        model_name,
+        checkpoint_dir=os.path.join(index_dir, CHECKPOINT_DIR),
+        batch_size=batch_size,
+        max_workers=max_workers,
+    )
+
+
+def add_documents(vectorstore: FAISS, documents: List[Document], ids: List[int],
+                  job: Optional[EmbeddingJob] = None) -> None:
+    """
+    Embed and add documents under explicit vector ids. The docstore is
+    keyed by the document's source path.
+    """
+    if not documents:
+        return
+    vectors = _embed(documents, vectorstore.embeddings, job)
+    vectorstore.index.add_with_ids(vectors, np.array(ids, dtype=np.int64))
+    vectorstore.docstore.add({doc.metadata["source"]: doc for doc in documents})
+    for vector_id, doc in zip(ids, documents):
+        vectorstore.index_to_docstore_id[vector_id] = doc.metadata["source"]
+
+
+def remove_documents(vectorstore: FAISS, ids: List[int]) -> None:
+    if not ids:
+        return
+    ann.remove_ids(vectorstore.index, np.array(ids, dtype=np.int64))
+    vectorstore.docstore.delete([vectorstore.index_to_docstore_id[i] for i in ids])
+    for vector_id in ids:
+        del vectorstore.index_to_docstore_id[vector_id]
+
+
+def search_by_vectors(vectorstore: FAISS, vectors: np.ndarray, k: int) -> List[List[Document]]:
+    """One matrix search for many query vectors; returns documents per query, best first."""
+    _, ids = vectorstore.index.search(np.asarray(vectors, dtype=np.float32), k)
+    return [
+        [vectorstore.docstore.search(vectorstore.index_to_docstore_id[i]) for i in row if i != -1]
+        for row in ids
+    ]
+
+
+def build_index(documents: List[Document], embeddings: Embeddings, job: Optional[EmbeddingJob] = None,
+                index_type: str = "flat") -> FAISS:
+    """Index of the given type (see retrieval.ann) with vector ids 0..n-1, so single vectors can be removed later."""
+    if not documents:
+        raise ValueError("Cannot build an index from an empty corpus")
+
+    vectors = _embed(documents, embeddings, job)
+    index = ann.make_index(index_type, vectors, np.arange(len(documents), dtype=np.int64))
+
+    docstore = InMemoryDocstore({doc.metadata["source"]: doc for doc in documents})
+    index_to_docstore_id = {i: doc.metadata["source"] for i, doc in enumerate(documents)}
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+
+def read_manifest(index_dir: str) -> Optional[dict]:
+    return _read_json(os.path.join(index_dir, MANIFEST_FILE))
+
+
+def write_manifest(index_dir: str, manifest: dict) -> None:
+    _write_json(os.path.join(index_dir, MANIFEST_FILE), manifest)
+
+
+def read_fingerprints(index_dir: str) -> Dict[str, dict]:
+    return _read_json(os.path.join(index_dir, FINGERPRINTS_FILE)) or {}
+
+
+def save_index(vectorstore: FAISS, index_dir: str, manifest: dict, fingerprints: Dict[str, dict]) -> None:
+    """
+    Write index, packed texts, fingerprint table and manifest. The manifest goes
+    last, so a crash mid-save leaves an index that no longer matches and
+    gets rebuilt.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    manifest_path = os.path.join(index_dir, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    index_path = os.path.join(index_dir, INDEX_FILE)
+    faiss.write_index(vectorstore.index, index_path + ".tmp")
+    os.replace(index_path + ".tmp", index_path)
+
+    write_docstore(index_dir, vectorstore.index_to_docstore_id, vectorstore.docstore._dict)
+    _write_json(os.path.join(index_dir, FINGERPRINTS_FILE), fingerprints)
+
+    write_manifest(index_dir, manifest)
+
+
+def load_index(index_dir: str, embeddings: Embeddings, mmap: bool = True) -> FAISS:
+    """
+    Load a saved index. With mmap=True the vectors (inverted lists for IVF)
+    and chunk texts are mapped read-only, use mmap=False when the index is
+    going to be modified.
+    """
+    index_type = (read_manifest(index_dir) or {}).get("index_type", "flat")
+    index = faiss.read_index(os.path.join(index_dir, INDEX_FILE), ann.mmap_flags(index_type) if mmap else 0)
+    docstore = MmapDocstore(index_dir)
+    index_to_docstore_id = docstore.index_to_docstore_id()
+    if not mmap:
+        docstore = InMemoryDocstore(docstore.to_dict())
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+
+def manifest_matches(manifest: Optional[dict], model_name: str, index_type: str = "flat") -> bool:
+    return (
+        manifest is not None
+        and manifest.get("format_version") == FORMAT_VERSION
+        and manifest.get("embedding_model") == model_name
+        and manifest.get("index_type", "flat") == index_type
+    )
+
+
+def _make_manifest(model_name: str, vectorstore: FAISS, fingerprints: Dict[str, dict], signature: str,
+                   next_id: int, index_type: str) -> dict:
+    return {
+        "format_version": FORMAT_VERSION,
+        "embedding_model": model_name,
+        "index_type": index_type,
+        "corpus_hash": corpus_hash(fingerprints),
+        "stat_signature": signature,
+        "num_files": len(fingerprints),
+        "num_vectors": vectorstore.index.ntotal,
+        "next_id": next_id,
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def rebuild_index(folder_path: str, index_dir: str, embeddings: Embeddings, model_name: str,
+                  batch_size: int = 256, max_workers: int = 4, index_type: str = "flat") -> None:
+    rel_paths = list_text_files(folder_path)
+    fingerprints = fingerprint_files(folder_path, rel_paths)
+
+    print(f"[index] building {index_type} index {index_dir} from {len(rel_paths)} files")
+    documents = load_documents(folder_path, rel_paths)
+    job = _make_job(embeddings, model_name, index_dir, batch_size, max_workers)
+    vectorstore = build_index(documents, embeddings, job, index_type)
+    for vector_id, doc in enumerate(documents):
+        fingerprints[doc.metadata["source"]]["id"] = vector_id
+
+    manifest = _make_manifest(
+        model_name, vectorstore, fingerprints, stat_signature(folder_path, rel_paths), len(documents), index_type
+    )
+    save_index(vectorstore, index_dir, manifest, fingerprints)
+    job.clear_checkpoints()
+
+
+def update_index(folder_path: str, index_dir: str, embeddings: Embeddings, model_name: str,
+                 batch_size: int = 256, max_workers: int = 4, index_type: str = "flat") -> dict:
+    """
+    Bring a saved index in line with the corpus: embed new and changed
+    files, drop vectors of changed and deleted ones, keep everything else.
+    Returns counts of added / removed / unchanged files. Index types that
+    cannot remove vectors (hnsw) are rebuilt when files change or disappear;
+    the embedding cache makes that cheap.
+    """
+    manifest = read_manifest(index_dir)
+    if not manifest_matches(manifest, model_name, index_type):
+        rebuild_index(folder_path, index_dir, embeddings, model_name, batch_size, max_workers, index_type)
+        manifest = read_manifest(index_dir)
+        return {"added": manifest["num_files"], "removed": 0, "unchanged": 0}
+
+    old = read_fingerprints(index_dir)
+    rel_paths = list_text_files(folder_path)
+    new = fingerprint_files(folder_path, rel_paths, previous=old)
+
+    stale = [p for p in old if p not in new or old[p]["sha256"] != new[p]["sha256"]]
+    fresh = [p for p in new if p not in old or old[p]["sha256"] != new[p]["sha256"]]
+    for rel_path in new:
+        if rel_path in old and rel_path not in fresh and "id" in old[rel_path]:
+            new[rel_path]["id"] = old[rel_path]["id"]
+
+    stats = {"added": len(fresh), "removed": len(stale), "unchanged": len(new) - len(fresh)}
+    signature = stat_signature(folder_path, rel_paths)
+    if not stale and not fresh:
+        if manifest.get("stat_signature") != signature:
+            _write_json(os.path.join(index_dir, FINGERPRINTS_FILE), new)
+            manifest["stat_signature"] = signature
+            write_manifest(index_dir, manifest)
+        return stats
+
+    print(f"[index] updating {index_dir}: +{len(fresh)} -{len(stale)}")
+    vectorstore = load_index(index_dir, embeddings, mmap=False)
+    if stale and not ann.supports_removal(vectorstore.index):
+        rebuild_index(folder_path, index_dir, embeddings, model_name, batch_size, max_workers, index_type)
+        return stats
+    remove_documents(vectorstore, [old[p]["id"] for p in stale if "id" in old[p]])
+
+    next_id = manifest["next_id"]
+    documents = load_documents(folder_path, fresh)
+    ids = list(range(next_id, next_id + len(documents)))
+    job = _make_job(embeddings, model_name, index_dir, batch_size, max_workers)
+    add_documents(vectorstore, documents, ids, job)
+    for vector_id, doc in zip(ids, documents):
+        new[doc.metadata["source"]]["id"] = vector_id
+
+    manifest = _make_manifest(model_name, vectorstore, new, signature, next_id + len(ids), index_type)
+    save_index(vectorstore, index_dir, manifest, new)
+    job.clear_checkpoints()
+    return stats
+
+
+def load_or_build_index(folder_path: str, index_dir: str, embeddings: Embeddings, model_name: str,
+                        batch_size: int = 256, max_workers: int = 4, index_type: str = "flat") -> FAISS:
+    """
+    Load the index saved in index_dir. If the corpus in folder_path changed
+    since it was saved, only the affected files are re-embedded; a missing
+    index, a different embedding model or index type triggers a full rebuild.
+    """
+    manifest = read_manifest(index_dir)
+    if manifest_matches(manifest, model_name, index_type):
+        if manifest.get("stat_signature") == stat_signature(folder_path, list_text_files(folder_path)):
+            return load_index(index_dir, embeddings)
+        update_index(folder_path, index_dir, embeddings, model_name, batch_size, max_workers, index_type)
+    else:
+        rebuild_index(folder_path, index_dir, embeddings, model_name, batch_size, max_workers, index_type)
+    return load_index(index_dir, embeddings)
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+from typing import Sequence, Tuple
+
+import numpy as np
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def mmr(query: Sequence[float], candidates: np.ndarray, k: int,
+        lambda_mult: float = 0.5) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Maximal marginal relevance over candidate vectors. Returns the indices
+    of up to k picks in selection order, and the cosine relevance of every
+    candidate to the query. Each step costs one matrix-vector product: the
+    highest similarity of each candidate to anything already picked is
+    kept in one array and updated with the last pick only.
+    """
+    c = _normalize(np.asarray(candidates, dtype=np.float32))
+    q = _normalize(np.asarray(query, dtype=np.float32))
+    relevance = c @ q
+    k = min(k, len(c))
+
+    selected = np.empty(k, dtype=np.int64)
+    redundancy = np.full(len(c), -1.0, dtype=np.float32)
+    available = np.ones(len(c), dtype=bool)
+    for step in range(k):
+        scores = relevance if step == 0 else lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        i = int(np.argmax(np.where(available, scores, -np.inf)))
+        selected[step] = i
+        available[i] = False
+        np.maximum(redundancy, c @ c[i], out=redundancy)
+    return selected, relevance
+
+
+def adaptive_k(scores: Sequence[float], k_min: int, k_max: int, min_gap: float = 0.03) -> int:
+    """
+    Number of results to keep from the relevance scores of the results in
+    the order they are returned (best first, or MMR selection order): cut
+    at the largest drop between neighbours within [k_min, k_max], or return
+    k_max when no drop reaches min_gap (the scores are flat).
+    """
+    top = np.asarray(scores, dtype=np.float32)[:k_max]
+    if len(top) <= k_min:
+        return len(top)
+    gaps = top[k_min - 1:-1] - top[k_min:]
+    best = int(np.argmax(gaps))
+    if gaps[best] < min_gap:
+        return len(top)
+    return k_min + best
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import hashlib
+import heapq
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from retrieval.ann import configure_search
+from retrieval.index_store import load_or_build_index, read_manifest
+
+# Same split as scripts/data_processing/chunkify.py
+CATEGORIES = ["Articles", "Cases", "Guidelines", "Handbooks", "Textbooks"]
+
+
+def _qualified(doc: Document, shard: str) -> Document:
+    """Shard docstores key documents relative to the category folder; add the category back."""
+    metadata = dict(doc.metadata)
+    metadata["source"] = f"{shard}/{doc.metadata['source']}"
+    metadata["shard"] = shard
+    return Document(page_content=doc.page_content, metadata=metadata)
+
+
+class ShardedIndex:
+    """
+    One persistent vector index per corpus category, stored under
+    <index_dir>/<category>. Queries are scattered to the selected shards on a
+    thread pool (FAISS releases the GIL while searching) and the per-shard
+    hits are merged by distance.
+    """
+
+    def __init__(self, folder_path: str, index_dir: str, embeddings: Embeddings, model_name: str,
+                 categories: Sequence[str] = CATEGORIES, batch_size: int = 256, max_workers: int = 4,
+                 index_type: str = "flat", nprobe: int = 16, ef_search: int = 64):
+        self.folder_path = folder_path
+        self.index_dir = index_dir
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.index_type = index_type
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.shards: Dict[str, FAISS] = {}
+        self._corpus_hashes: Dict[str, Optional[str]] = {}
+        for category in categories:
+            if os.path.isdir(os.path.join(folder_path, category)):
+                self.reload(category)
+        if not self.shards:
+            raise ValueError(f"No category folders found under {folder_path}")
+        self._pool = ThreadPoolExecutor(max_workers=len(self.shards), thread_name_prefix="shard")
+
+    def reload(self, category: str) -> None:
+        """(Re)load a single shard, applying pending corpus changes to it only."""
+        store = load_or_build_index(
+            os.path.join(self.folder_path, category),
+            os.path.join(self.index_dir, category),
+            self.embeddings,
+            self.model_name,
+            self.batch_size,
+            self.max_workers,
+            self.index_type,
+        )
+        configure_search(store.index, self.nprobe, self.ef_search)
+        self.shards[category] = store
+        self._corpus_hashes[category] = (read_manifest(os.path.join(self.index_dir, category)) or {}).get("corpus_hash")
+
+    @property
+    def version(self) -> str:
+        """Hash over the corpus hashes of the shards as loaded; changes when reload() picks up changes."""
+        h = hashlib.sha256()
+        for category in sorted(self._corpus_hashes):
+            h.update(f"{category}\0{self._corpus_hashes[category]}\n".encode("utf-8"))
+        return h.hexdigest()
+
+    @property
+    def ntotal(self) -> int:
+        return sum(store.index.ntotal for store in self.shards.values())
+
+    def get_document(self, source: str) -> Optional[Document]:
+        shard, _, rel_path = source.partition("/")
+        store = self.shards.get(shard)
+        if store is None:
+            return None
+        doc = store.docstore.search(rel_path)
+        return _qualified(doc, shard) if isinstance(doc, Document) else None
+
+    def _selected(self, shards: Optional[Sequence[str]]) -> List[str]:
+        if not shards:
+            return list(self.shards)
+        return [s for s in shards if s in self.shards]
+
+    def _search_ids(self, vectors: np.ndarray, k: int,
+                    shards: Optional[Sequence[str]]) -> List[List[Tuple[float, str, int]]]:
+        """Matrix search of every query on every selected shard in parallel, then a top-k merge per query."""
+        queries = np.asarray(vectors, dtype=np.float32)
+        names = self._selected(shards)
+        futures = {name: self._pool.submit(self.shards[name].index.search, queries, k) for name in names}
+
+        merged = [[] for _ in range(len(queries))]
+        for name in names:
+            dists, ids = futures[name].result()
+            for row, (drow, irow) in enumerate(zip(dists, ids)):
+                merged[row].extend((float(d), name, int(i)) for d, i in zip(drow, irow) if i != -1)
+        return [heapq.nsmallest(k, hits) for hits in merged]
+
+    def _document(self, name: str, vector_id: int) -> Document:
+        store = self.shards[name]
+        return _qualified(store.docstore.search(store.index_to_docstore_id[vector_id]), name)
+
+    def search_many(self, vectors: np.ndarray, k: int,
+                    shards: Optional[Sequence[str]] = None) -> List[List[Tuple[Document, float]]]:
+        return [[(self._document(name, i), d) for d, name, i in best] for best in self._search_ids(vectors, k, shards)]
+
+    def candidates(self, vector: Sequence[float], k: int,
+                   shards: Optional[Sequence[str]] = None) -> Tuple[np.ndarray, Callable[[int], Document]]:
+        """
+        Stored vectors of the k nearest chunks over the selected shards, best
+        first, and a function returning the document of a row. Documents
+        are only read for the rows that are actually used.
+        """
+        best = self._search_ids(np.asarray([vector], dtype=np.float32), k, shards)[0]
+        vectors = np.zeros((len(best), len(vector)), dtype=np.float32)
+        for name in {name for _, name, _ in best}:
+            rows = [row for row, (_, n, _) in enumerate(best) if n == name]
+            ids = np.array([best[row][2] for row in rows], dtype=np.int64)
+            vectors[rows] = self.shards[name].index.reconstruct_batch(ids)
+        return vectors, lambda row: self._document(best[row][1], best[row][2])
+
+    def similarity_search_with_score_by_vector(self, vector: Sequence[float], k: int = 3,
+                                               shards: Optional[Sequence[str]] = None) -> List[Tuple[Document, float]]:
+        return self.search_many(np.asarray([vector], dtype=np.float32), k, shards)[0]
+
+    def similarity_search_by_vector(self, vector: Sequence[float], k: int = 3,
+                                    shards: Optional[Sequence[str]] = None) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(vector, k, shards)]
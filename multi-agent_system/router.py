@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import math
+import os
+import random
+import re
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from retrieval.bm25 import STOP_WORDS
+from tracing import JsonLinesWriter
+
+# Seed vocabulary per specialty. Specialties with a corpus also get the
+# KEYWORDS lines of their summary.txt files on top of these.
+SEED_KEYWORDS = {
+    "cardiologist": [
+        "heart", "cardiac", "cardiology", "cardiovascular", "chest pain", "palpitations", "ecg", "ekg",
+        "myocardial infarction", "heart attack", "acute coronary syndrome", "angina", "ischemia",
+        "arrhythmia", "atrial fibrillation", "tachycardia", "bradycardia", "heart failure", "troponin",
+        "st elevation", "st depression", "stemi", "nstemi", "blood pressure", "hypertension",
+        "cholesterol", "statin", "coronary", "valve", "murmur", "pacemaker", "stent", "shortness of breath",
+    ],
+    "dermatologist": [
+        "skin", "rash", "itch", "itching", "itchy", "acne", "pimple", "eczema", "dermatitis", "psoriasis",
+        "mole", "melanoma", "wart", "hives", "urticaria", "blister", "sunburn", "hair loss", "alopecia",
+        "nail", "fungus", "fungal", "dandruff", "rosacea", "freckle", "pigmentation", "vitiligo", "lesion",
+        "scalp", "dry skin", "redness", "spots", "birthmark", "scar",
+    ],
+    "surgeon": [
+        "surgery", "surgical", "operation", "operate", "incision", "wound", "stitches", "sutures", "hernia",
+        "appendicitis", "appendix", "gallbladder", "gallstones", "fracture", "broken bone", "trauma",
+        "laparoscopy", "amputation", "abscess", "postoperative", "anesthesia", "biopsy", "tumor removal",
+        "transplant", "bleeding", "injury", "cut", "drain", "cyst", "hemorrhoids",
+    ],
+}
+
+TOKEN_RE = re.compile(r"[a-z][a-z\-]{1,}")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall((text or "").lower())
+
+
+def _terms(text: str) -> List[str]:
+    """Unigrams plus bigrams, so phrases like 'chest pain' count as a unit."""
+    tokens = tokenize(text)
+    return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+
+def read_summary_keywords(folder_path: str) -> List[str]:
+    keywords = []
+    for summary in Path(folder_path).rglob("summary.txt"):
+        for line in summary.read_text(encoding="utf-8", errors="ignore").splitlines()[:5]:
+            if line.strip().lower().startswith("keywords:"):
+                keywords.extend(k.strip() for k in line.split(":", 1)[1].split(",") if k.strip())
+                break
+    return keywords
+
+
+class LocalRouter:
+    """
+    Nearest-centroid TF-IDF classifier over specialty keywords.
+    predict() returns the best specialist and a confidence in [0, 1]:
+    the relative margin between the best and the runner-up cosine score,
+    scaled down when the best score itself is below min_score, and by the
+    share of the question's words the router knows at all. One matching
+    keyword in an otherwise unknown question ("my skin turned yellow")
+    is weak evidence, and such questions should go to the LLM.
+    """
+
+    def __init__(self, keywords: Dict[str, Iterable[str]], threshold: float = 0.5, min_score: float = 0.05):
+        self.threshold = threshold
+        self.min_score = min_score
+        counts = {name: Counter(t for kw in kws for t in _terms(kw)) for name, kws in keywords.items()}
+
+        df = Counter(t for c in counts.values() for t in c)
+        n = len(counts)
+        self.idf = {t: math.log((1 + n) / (1 + d)) + 1.0 for t, d in df.items()}
+
+        self.centroids: Dict[str, Dict[str, float]] = {}
+        for name, c in counts.items():
+            vec = {t: (1.0 + math.log(tf)) * self.idf[t] for t, tf in c.items()}
+            norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+            self.centroids[name] = {t: v / norm for t, v in vec.items()}
+
+    @classmethod
+    def from_corpora(cls, corpora: Dict[str, str], threshold: float = 0.5) -> "LocalRouter":
+        keywords = {name: list(seeds) for name, seeds in SEED_KEYWORDS.items()}
+        for name, folder_path in corpora.items():
+            if folder_path and os.path.isdir(folder_path):
+                keywords.setdefault(name, []).extend(read_summary_keywords(folder_path))
+        return cls(keywords, threshold)
+
+    def scores(self, question: str) -> Dict[str, float]:
+        query = Counter(t for t in _terms(question) if t in self.idf)
+        if not query:
+            return {name: 0.0 for name in self.centroids}
+
+        vec = {t: (1.0 + math.log(tf)) * self.idf[t] for t, tf in query.items()}
+        norm = math.sqrt(sum(v * v for v in vec.values()))
+        return {
+            name: sum(w * centroid.get(t, 0.0) for t, w in vec.items()) / norm
+            for name, centroid in self.centroids.items()
+        }
+
+    def coverage(self, question: str) -> float:
+        """Share of the question's content words that occur in some specialty's keywords."""
+        words = [t for t in tokenize(question) if t not in STOP_WORDS]
+        if not words:
+            return 0.0
+        return sum(t in self.idf for t in words) / len(words)
+
+    def predict(self, question: str) -> Tuple[str, float]:
+        ranked = sorted(self.scores(question).items(), key=lambda kv: kv[1], reverse=True)
+        (best, best_score), second_score = ranked[0], (ranked[1][1] if len(ranked) > 1 else 0.0)
+        if best_score <= 0:
+            return best, 0.0
+        margin = (best_score - second_score) / best_score
+        return best, margin * min(1.0, best_score / self.min_score) * self.coverage(question)
+
+
+class RouteLog:
+    """
+    Appends one JSON line per routing decision, patient question included,
+    when a path is given; lines are written from a background thread. Set
+    audit_rate > 0 to also ask the LLM for a sample of locally routed
+    questions, so the threshold can be tuned against LLM agreement.
+    """
+
+    def __init__(self, path: Optional[str], audit_rate: float = 0.0):
+        self.path = path
+        self.audit_rate = audit_rate
+        self._writer = JsonLinesWriter(path) if path else None
+
+    def should_audit(self) -> bool:
+        return self.audit_rate > 0 and random.random() < self.audit_rate
+
+    def write(self, question: str, source: str, specialist: str, confidence: float,
+              local_specialist: str, llm_specialist: Optional[str] = None) -> None:
+        if not self.path:
+            return
+        record = {
+            "ts": time.time(),
+            "question": question,
+            "source": source,
+            "specialist": specialist,
+            "local_specialist": local_specialist,
+            "confidence": round(confidence, 4),
+            "llm_specialist": llm_specialist,
+        }
+        self._writer.write(record)
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+
+
+class SemanticCache:
+    """
+    Answer cache keyed by question embedding. A lookup hits when a stored
+    question of the same specialist has cosine similarity >= threshold.
+    Entries expire after ttl seconds, the least recently used entry is
+    evicted at max_entries, and everything is dropped when the index
+    version the answers were generated against changes.
+    """
+
+    def __init__(self, threshold: float = 0.98, max_entries: int = 1000, ttl: float = 3600.0):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.index_version = None
+        self.hits = 0
+        self.misses = 0
+        self._vectors = None
+        self._entries = OrderedDict()  # slot -> (specialist, answer, expires_at)
+        self._free = list(range(max_entries - 1, -1, -1))
+        self._lock = threading.Lock()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hit_rate, "size": len(self._entries)}
+
+    def _normalize(self, vector: List[float]) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return v / norm if norm else v
+
+    def _check_version(self, index_version) -> None:
+        if index_version != self.index_version:
+            self._entries.clear()
+            self._free = list(range(self.max_entries - 1, -1, -1))
+            self.index_version = index_version
+
+    def _evict_expired(self, now: float) -> None:
+        expired = [slot for slot, (_, _, expires_at) in self._entries.items() if expires_at <= now]
+        for slot in expired:
+            del self._entries[slot]
+            self._free.append(slot)
+
+    def lookup(self, vector: List[float], specialist: str, index_version=None) -> Optional[str]:
+        with self._lock:
+            self._check_version(index_version)
+            self._evict_expired(time.monotonic())
+            slots = [slot for slot, (s, _, _) in self._entries.items() if s == specialist]
+            if not slots:
+                self.misses += 1
+                return None
+
+            sims = self._vectors[slots] @ self._normalize(vector)
+            best = int(np.argmax(sims))
+            if sims[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            slot = slots[best]
+            self._entries.move_to_end(slot)
+            self.hits += 1
+            return self._entries[slot][1]
+
+    def store(self, vector: List[float], specialist: str, answer: str, index_version=None) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._check_version(index_version)
+            v = self._normalize(vector)
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, v.shape[0]), dtype=np.float32)
+            if not self._free:
+                slot, _ = self._entries.popitem(last=False)
+                self._free.append(slot)
+
+            slot = self._free.pop()
+            self._vectors[slot] = v
+            self._entries[slot] = (specialist, answer, time.monotonic() + self.ttl)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._free = list(range(self.max_entries - 1, -1, -1))
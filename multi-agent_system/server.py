@@ -0,0 +1,417 @@
+"""
+HTTP service: loads the orchestrator and the cardiology index once and
+answers many questions concurrently.
+
+    python server.py --port 8000
+
+POST /answer  {"question": "..."} -> {"answer": "..."}
+GET  /health  the process is up
+GET  /ready   200 once the cardiology index is loaded, 503 before that and while shutting down
+GET  /stats   LLM gateway counters, cache hit rates, per-model and per-stage latency percentiles
+GET  /metrics per-stage latency histograms in the Prometheus text format
+
+An X-Request-ID header of up to 64 letters, digits, '.', '_' or '-' is used
+as the request ID of the question's trace (see tracing.py) and echoed back;
+without one, or with any other value, an ID is generated.
+
+At most SERVER_CONCURRENCY questions are answered at once and up to
+SERVER_QUEUE_SIZE more wait for a slot; beyond that requests get 429.
+Routing, retrieval and generation have their own limits inside a request.
+SIGINT/SIGTERM stop accepting requests and wait up to SHUTDOWN_TIMEOUT
+seconds for the ones in flight.
+
+    python server.py --workers 4
+
+With more than one worker (SERVER_WORKERS) the parent loads the
+orchestrator and the index once, then forks workers that accept on the
+same socket. FAISS vectors, BM25 postings and chunk texts are read-only
+mmaps of the index files, so all workers read the same page-cache pages;
+the rest of the loaded state is shared copy-on-write (gc.freeze() keeps
+the collector from touching it). A worker that dies is replaced; on
+SIGINT/SIGTERM the parent lets every worker drain. Each worker has its
+own limits and queue, and /stats reports its pid, its memory and how
+many objects gc.freeze() moved out of the collector's reach.
+"""
+import argparse
+import asyncio
+import contextlib
+import gc
+import itertools
+import json
+import multiprocessing
+import os
+import re
+import signal
+import socket
+import sys
+import time
+import uuid
+
+import config
+from config import (
+    CARDIOLOGY_DATA_PATH, GENERATION_CONCURRENCY, RETRIEVAL_CONCURRENCY, ROUTING_CONCURRENCY, SERVER_CONCURRENCY,
+    SERVER_HOST, SERVER_PORT, SERVER_QUEUE_SIZE, SERVER_WORKERS, SHUTDOWN_TIMEOUT
+)
+from metrics import process_memory
+from orchestrator import AGENT_FACTORIES, MedicalOrchestrator
+from tracing import close_writers, tracer
+
+MAX_BODY_BYTES = 64 * 1024
+# request and header lines are also capped by the stream reader's line limit (64 KiB)
+MAX_HEADERS = 100
+KEEP_ALIVE_TIMEOUT = 60.0
+# the request ID is echoed in a response header, so anything that could break the header is replaced
+REQUEST_ID_RE = re.compile(r"[A-Za-z0-9._-]{1,64}")
+REASONS = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+    429: "Too Many Requests", 431: "Request Header Fields Too Large", 500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Overloaded(Exception):
+    pass
+
+
+def request_id_from(header):
+    """The client's X-Request-ID if it is safe to echo back, otherwise a new ID."""
+    if header is not None and REQUEST_ID_RE.fullmatch(header):
+        return header
+    return uuid.uuid4().hex[:16]
+
+
+async def _read_line(reader, status):
+    try:
+        return await reader.readline()
+    except ValueError:
+        # the line is longer than the reader's limit
+        raise HTTPError(status, "line too long")
+
+
+async def read_request(reader):
+    """(method, path, version, headers, body) of the next request, or None when the client closed the connection."""
+    line = await asyncio.wait_for(_read_line(reader, 400), KEEP_ALIVE_TIMEOUT)
+    if not line:
+        return None
+    try:
+        method, path, version = line.decode("latin-1").split()
+    except ValueError:
+        raise HTTPError(400, "malformed request line")
+
+    headers = {}
+    for count in itertools.count():
+        line = await _read_line(reader, 431)
+        if line in (b"\r\n", b"\n", b""):
+            break
+        if count >= MAX_HEADERS:
+            raise HTTPError(431, f"more than {MAX_HEADERS} headers")
+        name, colon, value = line.decode("latin-1").partition(":")
+        if not colon or not name.strip():
+            raise HTTPError(400, "malformed header line")
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length") or 0)
+    except ValueError:
+        raise HTTPError(400, "invalid Content-Length")
+    if length < 0:
+        raise HTTPError(400, "invalid Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, f"body larger than {MAX_BODY_BYTES} bytes")
+    body = await reader.readexactly(length) if length else b""
+    return method, path.split("?", 1)[0], version, headers, body
+
+
+def write_response(writer, status, payload, keep_alive, headers=None):
+    """A str payload is sent as plain text (the Prometheus format), anything else as JSON."""
+    if isinstance(payload, str):
+        body, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+    else:
+        body, content_type = json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8"
+    lines = [
+        f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+        f"Content-Type: {content_type}",
+        f"Content-Length: {len(body)}",
+        f"Connection: {'keep-alive' if keep_alive else 'close'}",
+    ]
+    lines.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+
+
+class AnswerService:
+
+    def __init__(self, orchestrator, concurrency=SERVER_CONCURRENCY, queue_size=SERVER_QUEUE_SIZE):
+        self.orchestrator = orchestrator
+        self.slots = asyncio.Semaphore(concurrency)
+        self.queue_size = queue_size
+        self.active = 0
+        self.waiting = 0
+        self.ready = False
+        self.draining = False
+        self.load_error = None
+        self.connections = set()
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    async def warm(self):
+        try:
+            await asyncio.to_thread(lambda: self.orchestrator.cardiologist)
+            self.ready = True
+            print("[server] cardiology index loaded")
+        except Exception as e:
+            self.load_error = str(e)
+            print(f"[server] loading the cardiology index failed: {e}")
+
+    async def answer(self, question, request_id=None):
+        if self.slots.locked() and self.waiting >= self.queue_size:
+            raise Overloaded()
+        self.waiting += 1
+        try:
+            await self.slots.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.active += 1
+        self._idle.clear()
+        try:
+            return await self.orchestrator.aanswer(question, request_id)
+        finally:
+            self.active -= 1
+            self.slots.release()
+            if not self.active:
+                self._idle.set()
+
+    def status(self):
+        return {
+            "ready": self.ready and not self.draining,
+            "draining": self.draining,
+            "agents": {name: self.orchestrator.is_loaded(name) for name in AGENT_FACTORIES},
+            "active": self.active,
+            "waiting": self.waiting,
+            "error": self.load_error,
+            "worker": os.getpid(),
+        }
+
+    async def dispatch(self, method, path, body, request_id=None):
+        """Returns (status, payload, extra headers)."""
+        if path == "/health":
+            if method != "GET":
+                return 405, {"error": "use GET"}, {}
+            return 200, {"status": "ok", "active": self.active, "waiting": self.waiting}, {}
+
+        if path == "/ready":
+            if method != "GET":
+                return 405, {"error": "use GET"}, {}
+            status = self.status()
+            return (200 if status["ready"] else 503), status, {}
+
+        if path == "/stats":
+            if method != "GET":
+                return 405, {"error": "use GET"}, {}
+            return 200, {"worker": os.getpid(), "memory": process_memory(), "gc_frozen": gc.get_freeze_count(),
+                         "llm": config.llm.stats(), "cache": self.orchestrator.cache_stats(),
+                         "stages": tracer().stats()}, {}
+
+        if path == "/metrics":
+            if method != "GET":
+                return 405, {"error": "use GET"}, {}
+            return 200, tracer().prometheus(), {}
+
+        if path == "/answer":
+            if method != "POST":
+                return 405, {"error": "use POST"}, {}
+            request_id = request_id_from(request_id)
+            if self.draining or not self.ready:
+                return 503, {"error": "not ready" if not self.draining else "shutting down"}, {"Retry-After": "1"}
+            try:
+                question = json.loads(body or b"{}").get("question")
+            except (ValueError, AttributeError):
+                return 400, {"error": "body must be a JSON object"}, {}
+            if not isinstance(question, str) or not question.strip():
+                return 400, {"error": "question is required"}, {}
+            try:
+                return 200, {"answer": await self.answer(question, request_id)}, {"X-Request-ID": request_id}
+            except Overloaded:
+                return 429, {"error": "too many requests"}, {"Retry-After": "1"}
+            except Exception as e:
+                print(f"[server] answer failed: {e!r}")
+                return 500, {"error": str(e)}, {}
+
+        return 404, {"error": "not found"}, {}
+
+    async def handle(self, reader, writer):
+        self.connections.add(writer)
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except HTTPError as e:
+                    write_response(writer, e.status, {"error": str(e)}, keep_alive=False)
+                    break
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                if request is None:
+                    break
+
+                method, path, version, headers, body = request
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                status, payload, extra = await self.dispatch(method, path, body, headers.get("x-request-id"))
+                keep_alive = keep_alive and not self.draining
+                write_response(writer, status, payload, keep_alive, extra)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self.connections.discard(writer)
+            writer.close()
+
+    async def drain(self, timeout):
+        """Stops taking new questions and waits for the ones in flight."""
+        self.draining = True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            print(f"[server] {self.active} requests still running after {timeout:.0f}s")
+        for writer in list(self.connections):
+            writer.close()
+
+
+def make_orchestrator(data_path=CARDIOLOGY_DATA_PATH):
+    """The orchestrator with the per-stage limits the server runs it with."""
+    orchestrator = MedicalOrchestrator(data_path)
+    orchestrator.stage_limits = {
+        "routing": asyncio.Semaphore(ROUTING_CONCURRENCY),
+        "retrieval": asyncio.Semaphore(RETRIEVAL_CONCURRENCY),
+        "generation": asyncio.Semaphore(GENERATION_CONCURRENCY),
+    }
+    return orchestrator
+
+
+async def serve(host, port, orchestrator=None, sock=None):
+    """One server process; with sock it accepts on an inherited listening socket (a prefork worker)."""
+    service = AnswerService(orchestrator or make_orchestrator())
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        with contextlib.suppress(NotImplementedError):
+            loop.add_signal_handler(sig, stop.set)
+
+    if sock is not None:
+        server = await asyncio.start_server(service.handle, sock=sock)
+    else:
+        server = await asyncio.start_server(service.handle, host, port)
+    warming = asyncio.create_task(service.warm())
+    print(f"[server] {os.getpid()} listening on http://{host}:{port}")
+
+    await stop.wait()
+    print("[server] shutting down")
+    server.close()
+    await service.drain(SHUTDOWN_TIMEOUT)
+    await server.wait_closed()
+    warming.cancel()
+
+
+def _prepare_index(data_path):
+    # builds or updates the index; run in its own process so that no FAISS
+    # (OpenMP) threads exist in the parent when it forks
+    AGENT_FACTORIES["cardiologist"](data_path)
+
+
+def _spawn_worker(host, port, orchestrator, sock):
+    sys.stdout.flush()  # or the child would print the parent's buffered output again
+    pid = os.fork()
+    if pid:
+        return pid
+    code = 0
+    try:
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        asyncio.run(serve(host, port, orchestrator, sock))
+    except BaseException as e:
+        print(f"[server] worker {os.getpid()} failed: {e!r}")
+        code = 1
+    finally:
+        close_writers()
+        sys.stdout.flush()
+        os._exit(code)
+
+
+def prefork(host, port, workers):
+    """Loads everything once, then runs and supervises worker processes forked from this one."""
+    process = multiprocessing.get_context("spawn").Process(target=_prepare_index, args=(CARDIOLOGY_DATA_PATH,))
+    process.start()
+    process.join()
+    if process.exitcode:
+        raise SystemExit(f"[server] preparing the cardiology index failed (exit code {process.exitcode})")
+
+    orchestrator = make_orchestrator()
+    orchestrator.cardiologist  # memory-mapped load, shared by the workers
+    # objects that exist now are never collected, so the collector does not write to the shared pages
+    gc.collect()
+    gc.freeze()
+
+    sock = socket.create_server((host, port), backlog=1024)
+    sock.setblocking(False)
+
+    children = set()
+    stopping = False
+
+    def stop(signum, frame):
+        # waitpid() below keeps waiting through signals; it returns once the workers exit
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    children.update(_spawn_worker(host, port, orchestrator, sock) for _ in range(workers))
+    print(f"[server] {workers} workers on http://{host}:{port}: {sorted(children)}")
+    while not stopping:
+        try:
+            pid, status = os.waitpid(-1, 0)
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        if not stopping:
+            print(f"[server] worker {pid} exited ({os.waitstatus_to_exitcode(status)}), starting a new one")
+            children.add(_spawn_worker(host, port, orchestrator, sock))
+
+    print("[server] stopping workers")
+    deadline = time.monotonic() + SHUTDOWN_TIMEOUT + 5
+    while children and time.monotonic() < deadline:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid:
+            children.discard(pid)
+        else:
+            time.sleep(0.1)
+    for pid in children:
+        with contextlib.suppress(ProcessLookupError):
+            os.kill(pid, signal.SIGKILL)
+    sock.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the medical orchestrator over HTTP.")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS, help="processes forked after loading the index")
+    args = parser.parse_args()
+    if args.workers > 1:
+        prefork(args.host, args.port, args.workers)
+    else:
+        asyncio.run(serve(args.host, args.port))
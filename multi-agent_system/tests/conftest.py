@@ -0,0 +1,46 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# config reads the environment at import: synthetic models, no network, no log files,
+# and caches in a scratch directory instead of data/
+SCRATCH = tempfile.mkdtemp(prefix="multi-agent-tests-")
+os.environ["MODEL_BACKEND"] = "stub"
+os.environ["STUB_EMBEDDING_DIM"] = "64"
+os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(SCRATCH, "embeddings.sqlite")
+os.environ["RECORDINGS_PATH"] = os.path.join(SCRATCH, "recordings.sqlite")
+os.environ["TRACE_LOG_PATH"] = ""
+os.environ["ROUTER_LOG_PATH"] = ""
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CHUNKS = {
+    "Guidelines/heart-failure/0001.txt": "Heart failure\nKEYWORDS: heart failure, diuretics\n\n"
+                                         "Diuretics relieve congestion in patients with heart failure.",
+    "Guidelines/heart-failure/0002.txt": "Heart failure\nKEYWORDS: beta blockers\n\n"
+                                         "Beta blockers reduce mortality in reduced ejection fraction.",
+    "Guidelines/hypertension/0001.txt": "Hypertension\nKEYWORDS: blood pressure\n\n"
+                                        "Lifestyle changes lower blood pressure before medication is started.",
+    "Cases/palpitations/0001.txt": "Palpitations\nKEYWORDS: atrial fibrillation, anticoagulation\n\n"
+                                   "A patient with atrial fibrillation was started on anticoagulation.",
+    "Cases/chest-pain/0001.txt": "Chest pain\nKEYWORDS: angina, troponin\n\n"
+                                 "Troponin was normal and the chest pain was attributed to stable angina.",
+}
+
+
+def write_corpus(folder, chunks):
+    for rel_path, text in chunks.items():
+        path = os.path.join(folder, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    """A small cardiology corpus laid out like data/processed/cardiology."""
+    folder = str(tmp_path / "corpus")
+    write_corpus(folder, CHUNKS)
+    return folder
@@ -0,0 +1,80 @@
+import faiss
+import numpy as np
+import pytest
+
+from retrieval import ann
+
+
+def clustered(n, dim=32, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, n // 50), dim))
+    vectors = centers[rng.integers(len(centers), size=n)] + 0.1 * rng.normal(size=(n, dim))
+    return vectors.astype(np.float32)
+
+
+@pytest.fixture(scope="module")
+def vectors():
+    return clustered(2000)
+
+
+IDS = np.arange(1000, 3000, dtype=np.int64)
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf", "hnsw"])
+def test_built_index_finds_stored_vectors_under_their_ids(vectors, index_type):
+    index = ann.make_index(index_type, vectors, IDS)
+    ann.configure_search(index, nprobe=8, ef_search=64)
+    assert ann.built_type(index) == index_type
+    assert index.ntotal == len(vectors)
+    _, found = index.search(vectors[:20], 1)
+    assert np.mean(found[:, 0] == IDS[:20]) >= 0.9
+
+
+def test_ivfpq_falls_back_to_ivf_on_a_small_corpus(vectors):
+    index = ann.make_index("ivfpq", vectors, IDS)
+    assert ann.built_type(index) == "ivf"
+
+
+def test_built_type_recognises_ivfpq():
+    # training PQ codebooks takes seconds, and built_type only looks at the index structure
+    assert ann.built_type(faiss.index_factory(16, "IVF4,PQ4")) == "ivfpq"
+    assert ann.built_type(faiss.index_factory(16, "IVF4,Flat")) == "ivf"
+
+
+def test_unknown_index_type_is_rejected(vectors):
+    with pytest.raises(ValueError):
+        ann.make_index("lsh", vectors, IDS)
+
+
+def test_configure_search_sets_the_query_knobs(vectors):
+    ivf = ann.make_index("ivf", vectors, IDS)
+    ann.configure_search(ivf, nprobe=5)
+    assert faiss.extract_index_ivf(ivf).nprobe == 5
+    hnsw = ann.make_index("hnsw", vectors, IDS)
+    ann.configure_search(hnsw, ef_search=99)
+    assert faiss.downcast_index(hnsw.index).hnsw.efSearch == 99
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf"])
+def test_remove_ids(vectors, index_type):
+    index = ann.make_index(index_type, vectors, IDS)
+    assert ann.supports_removal(index)
+    ann.remove_ids(index, IDS[:10])
+    assert index.ntotal == len(vectors) - 10
+    ann.configure_search(index, nprobe=index.nlist if ann.is_ivf(index) else 16)
+    _, found = index.search(vectors[:10], 5)
+    assert not set(found.ravel()) & set(IDS[:10])
+
+
+def test_hnsw_does_not_support_removal(vectors):
+    assert not ann.supports_removal(ann.make_index("hnsw", vectors, IDS))
+
+
+def test_search_params_keep_nprobe_and_selector(vectors):
+    index = ann.make_index("ivf", vectors, IDS)
+    ann.configure_search(index, nprobe=7)
+    allowed = IDS[100:110]
+    params = ann.search_params(index, faiss.IDSelectorBatch(allowed))
+    assert params.nprobe == 7
+    _, found = index.search(vectors[:3], 5, params=params)
+    assert set(found.ravel()) - {-1} <= set(allowed)
@@ -0,0 +1,114 @@
+import types
+
+import numpy as np
+import pytest
+
+from backends import Latency, ReplayEmbeddings, StubEmbeddings, chat_client, synthetic_reply
+from retrieval.embedding_cache import CachedEmbeddings, EmbeddingCache
+
+
+class CountingEmbeddings(StubEmbeddings):
+    """Stands in for the API in record mode and counts the texts sent to it."""
+
+    def __init__(self):
+        super().__init__(dim=32)
+        self.sent = 0
+
+    def embed_documents(self, texts):
+        self.sent += len(texts)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        self.sent += 1
+        return super().embed_query(text)
+
+
+class LiveResponses:
+    def __init__(self):
+        self.calls = 0
+
+    def create(self, model, input, stream=False, **kwargs):
+        self.calls += 1
+        return types.SimpleNamespace(output_text=f"live answer to {input}")
+
+
+def test_stub_embeddings_are_deterministic_and_normalized():
+    a = StubEmbeddings(dim=64).embed_query("chest pain at night")
+    b = StubEmbeddings(dim=64).embed_query("chest pain at night")
+    assert a == b
+    assert np.isclose(np.linalg.norm(a), 1.0)
+
+
+def test_stub_embeddings_put_shared_words_close():
+    stub = StubEmbeddings(dim=256)
+    q, near, far = stub.embed_documents(["heart failure treatment", "treatment of heart failure", "itchy rash"])
+    assert np.dot(q, near) > np.dot(q, far)
+
+
+def test_recorded_embeddings_replay(tmp_path):
+    recordings = EmbeddingCache(str(tmp_path / "recordings.sqlite"))
+    live = CountingEmbeddings()
+    recorder = CachedEmbeddings(live, EmbeddingCache(str(tmp_path / "cache.sqlite")), "model", recordings)
+    vectors = recorder.embed_documents(["angina", "palpitations"])
+    query = recorder.embed_query("syncope")
+
+    replay = ReplayEmbeddings(recordings, "model")
+    assert np.allclose(replay.embed_documents(["angina", "palpitations"]), vectors)
+    assert np.allclose(replay.embed_query("syncope"), query)
+
+
+def test_recording_includes_working_cache_hits(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"))
+    live = CountingEmbeddings()
+    CachedEmbeddings(live, cache, "model").embed_documents(["angina", "palpitations"])
+
+    recordings = EmbeddingCache(str(tmp_path / "recordings.sqlite"))
+    recorder = CachedEmbeddings(live, cache, "model", recordings)
+    recorder.embed_documents(["angina", "palpitations"])
+    recorder.embed_query("angina")
+    assert live.sent == 2  # everything after the first call came from the working cache
+    assert len(recordings) == 2
+    ReplayEmbeddings(recordings, "model").embed_documents(["angina", "palpitations"])
+
+
+def test_replay_of_unrecorded_text_fails(tmp_path):
+    replay = ReplayEmbeddings(EmbeddingCache(str(tmp_path / "recordings.sqlite")), "model")
+    with pytest.raises(LookupError):
+        replay.embed_query("never recorded")
+
+
+def test_recorded_chat_replays(tmp_path):
+    path = str(tmp_path / "recordings.sqlite")
+    live = LiveResponses()
+    recorder = chat_client("record", lambda: types.SimpleNamespace(responses=live), path, Latency())
+    recorded = recorder.responses.create(model="gpt", input="What is angina?").output_text
+
+    replay = chat_client("replay", lambda: pytest.fail("replay must not build a live client"), path, Latency())
+    assert replay.responses.create(model="gpt", input="What is angina?").output_text == recorded
+    assert live.calls == 1
+    with pytest.raises(LookupError):
+        replay.responses.create(model="gpt", input="Something else")
+    with pytest.raises(LookupError):
+        replay.responses.create(model="other-model", input="What is angina?")
+
+
+def test_replay_streams_the_recorded_text(tmp_path):
+    path = str(tmp_path / "recordings.sqlite")
+    recorder = chat_client("record", lambda: types.SimpleNamespace(responses=LiveResponses()), path, Latency())
+    recorded = recorder.responses.create(model="gpt", input="What is angina?").output_text
+
+    replay = chat_client("replay", lambda: None, path, Latency(0))
+    events = replay.responses.create(model="gpt", input="What is angina?", stream=True)
+    assert "".join(event.delta for event in events) == recorded
+
+
+def test_stub_chat_routes_to_the_cardiologist():
+    client = chat_client("stub", lambda: None, "", Latency())
+    prompt = "You are a medical orchestrator.\nPatient request:\nmy chest hurts"
+    assert client.responses.create(model="gpt", input=prompt).output_text == "cardiologist"
+    assert synthetic_reply("What is angina?").startswith("Stub answer")
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        chat_client("offline", lambda: None, "", Latency())
@@ -0,0 +1,67 @@
+import os
+
+from conftest import CHUNKS, write_corpus
+from retrieval.bm25 import BM25Index, build_bm25, load_or_build_bm25, reciprocal_rank_fusion
+
+
+def test_search_ranks_the_matching_chunk_first(corpus, tmp_path):
+    index = load_or_build_bm25(corpus, str(tmp_path / "index"), "v1")
+    hits = index.search("atrial fibrillation anticoagulation", k=3)
+    assert hits[0][0] == "Cases/palpitations/0001.txt"
+    assert [score for _, score in hits] == sorted((score for _, score in hits), reverse=True)
+
+
+def test_search_without_matching_terms_is_empty(corpus, tmp_path):
+    index = load_or_build_bm25(corpus, str(tmp_path / "index"), "v1")
+    assert index.search("dermatology eczema", k=3) == []
+
+
+def test_search_returns_at_most_k_hits(corpus, tmp_path):
+    index = load_or_build_bm25(corpus, str(tmp_path / "index"), "v1")
+    assert len(index.search("heart failure blood pressure angina", k=2)) == 2
+
+
+def test_search_limited_to_folders(corpus, tmp_path):
+    index = load_or_build_bm25(corpus, str(tmp_path / "index"), "v1")
+    hits = index.search("heart failure angina troponin", k=5, folders=["Guidelines"])
+    assert hits
+    assert all(source.startswith("Guidelines/") for source, _ in hits)
+
+
+def test_index_is_rebuilt_only_when_the_corpus_hash_changes(corpus, tmp_path):
+    index_dir = str(tmp_path / "index")
+    load_or_build_bm25(corpus, index_dir, "v1")
+    write_corpus(corpus, {"Cases/syncope/0001.txt": "Syncope\n\nFainting during exercise needs an echocardiogram."})
+
+    assert load_or_build_bm25(corpus, index_dir, "v1").search("fainting", k=1) == []
+    hits = load_or_build_bm25(corpus, index_dir, "v2").search("fainting", k=1)
+    assert hits[0][0] == "Cases/syncope/0001.txt"
+
+
+def test_rebuild_leaves_an_open_index_readable(corpus, tmp_path):
+    out_dir = str(tmp_path / "bm25")
+    build_bm25(corpus, out_dir, "v1")
+    before = BM25Index(out_dir)
+    expected = before.search("beta blockers", k=1)
+
+    # the old postings stay mapped: files are replaced, not rewritten in place
+    write_corpus(corpus, {"Cases/syncope/0001.txt": "Syncope\n\nBeta blockers can cause fainting."})
+    build_bm25(corpus, out_dir, "v2")
+    assert before.search("beta blockers", k=1) == expected
+    assert BM25Index(out_dir).corpus_hash == "v2"
+    assert not [name for name in os.listdir(out_dir) if name.endswith(".tmp")]
+
+
+def test_reciprocal_rank_fusion_favours_ids_in_both_rankings():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]])
+    assert fused[0] == "b"
+    assert set(fused) == {"a", "b", "c", "d"}
+
+
+def test_reciprocal_rank_fusion_keeps_single_ranking_order():
+    assert reciprocal_rank_fusion([["c", "a", "b"]]) == ["c", "a", "b"]
+
+
+def test_all_chunks_are_indexed(corpus, tmp_path):
+    index = load_or_build_bm25(corpus, str(tmp_path / "index"), "v1")
+    assert sorted(index.docs) == sorted(CHUNKS)
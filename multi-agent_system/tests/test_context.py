@@ -0,0 +1,65 @@
+from langchain_core.documents import Document
+
+from retrieval.context import assemble_context, split_chunk, stitch
+from retrieval.embedding_job import count_tokens
+
+
+def chunk(source, title, body):
+    return Document(page_content=f"{title}\nKEYWORDS: a, b\n\n{body}", metadata={"source": source})
+
+
+def test_stitch_drops_the_repeated_words():
+    assert stitch("one two three four", "three four five six") == "one two three four five six"
+
+
+def test_stitch_without_overlap_joins_both():
+    assert stitch("one two", "three four") == "one two three four"
+
+
+def test_split_chunk_drops_the_keywords_line():
+    title, body = split_chunk("Heart failure\nKEYWORDS: diuretics\n\nDiuretics relieve congestion.")
+    assert title == "Heart failure"
+    assert body == "Diuretics relieve congestion."
+
+
+def test_split_chunk_single_line_is_body():
+    assert split_chunk("Only an abstract.") == ("", "Only an abstract.")
+
+
+def test_consecutive_chunks_become_one_passage():
+    docs = [
+        chunk("Guidelines/hf/0002.txt", "Heart failure", "beta blockers reduce mortality in most patients"),
+        chunk("Guidelines/hf/0001.txt", "Heart failure", "diuretics relieve congestion and beta blockers reduce"),
+    ]
+    context = assemble_context(docs, token_budget=1000)
+    assert context == "Heart failure\ndiuretics relieve congestion and beta blockers reduce mortality in most patients"
+    assert "KEYWORDS" not in context
+
+
+def test_passages_keep_the_rank_of_their_best_chunk():
+    docs = [
+        chunk("Cases/af/0001.txt", "Atrial fibrillation", "anticoagulation was started"),
+        chunk("Guidelines/hf/0001.txt", "Heart failure", "diuretics relieve congestion"),
+        chunk("Cases/af/0003.txt", "Atrial fibrillation", "rate control with beta blockers"),
+    ]
+    passages = assemble_context(docs, token_budget=1000).split("\n\n")
+    # chunks 1 and 3 are not consecutive, so they stay separate passages
+    assert [p.splitlines()[1] for p in passages] == [
+        "anticoagulation was started", "diuretics relieve congestion", "rate control with beta blockers",
+    ]
+
+
+def test_context_stays_within_the_token_budget():
+    long_body = " ".join(f"word{i}" for i in range(2000))
+    docs = [
+        chunk("Guidelines/hf/0001.txt", "Heart failure", "diuretics relieve congestion"),
+        chunk("Textbooks/ecg/0001.txt", "ECG", long_body),
+    ]
+    context = assemble_context(docs, token_budget=300)
+    assert count_tokens(context) <= 300
+    assert context.startswith("Heart failure\ndiuretics relieve congestion")
+    assert context.endswith("...")
+
+
+def test_empty_retrieval_gives_empty_context():
+    assert assemble_context([], token_budget=100) == ""
@@ -0,0 +1,80 @@
+import json
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from conftest import write_corpus
+from retrieval.corpus import list_text_files, read_duplicates
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "scripts", "data_processing"))
+import dedup_chunks  # noqa: E402
+
+BODY = ("Beta blockers reduce mortality in heart failure with reduced ejection fraction and should be started at a "
+        "low dose once the patient is euvolemic, then titrated every two weeks towards the target dose used in the "
+        "trials while heart rate and blood pressure are monitored at each visit")
+OTHER = ("Loop diuretics relieve congestion and breathlessness but do not change prognosis, so the dose is lowered "
+         "to the smallest one that keeps the patient free of oedema once the fluid overload has resolved")
+
+
+@pytest.fixture
+def base(tmp_path, monkeypatch):
+    folder = tmp_path / "cardiology"
+    write_corpus(str(folder), {
+        "Guidelines/heart-failure/0001.txt": f"Heart failure\nKEYWORDS: beta blockers\n\n{BODY}",
+        "Guidelines/heart-failure/0002.txt": f"Heart failure\nKEYWORDS: diuretics\n\n{OTHER}",
+        "Guidelines/heart-failure/summary.txt": "Heart failure\nKEYWORDS: heart failure\n\nA guideline summary.",
+        # the same chunk reposted under another title and keywords, with one word changed
+        "Articles/beta-blockers/0001.txt": f"Beta blockers\nKEYWORDS: mortality\n\n{BODY.replace('visit', 'review')}",
+    })
+    monkeypatch.setattr(dedup_chunks, "BASE", folder)
+    return folder
+
+
+def signature(text):
+    a, b = dedup_chunks._permutations(dedup_chunks.NUM_PERM, dedup_chunks.SEED)
+    return dedup_chunks.minhash(dedup_chunks._shingles(text), a, b)
+
+
+def test_minhash_agreement_follows_text_similarity():
+    near = np.mean(signature(BODY) == signature(BODY.replace("visit", "review")))
+    far = np.mean(signature(BODY) == signature(OTHER))
+    assert near >= dedup_chunks.JACCARD_THRESHOLD
+    assert far < 0.1
+
+
+def test_repost_maps_to_the_chunk_of_the_larger_document(base):
+    chunks = dedup_chunks._list_chunks()
+    assert len(chunks) == 3  # summaries are not chunks
+    duplicates = dedup_chunks.find_duplicates(chunks)
+    assert duplicates == {
+        base / "Articles/beta-blockers/0001.txt": base / "Guidelines/heart-failure/0001.txt",
+    }
+    # the article's only chunk is a copy, so the article as a whole duplicates the guideline
+    assert dedup_chunks.duplicate_documents(chunks, duplicates) == {
+        base / "Articles/beta-blockers": base / "Guidelines/heart-failure",
+    }
+
+
+def test_duplicates_json_resolves_from_the_category_folder(base):
+    chunks = dedup_chunks._list_chunks()
+    duplicates = dedup_chunks.find_duplicates(chunks)
+    dedup_chunks.write_maps(duplicates, dedup_chunks.duplicate_documents(chunks, duplicates))
+
+    articles = base / "Articles"
+    mapping = json.loads((articles / "duplicates.json").read_text(encoding="utf-8"))
+    assert mapping == {"beta-blockers/0001.txt": "../Guidelines/heart-failure/0001.txt"}
+    for duplicate, canonical in read_duplicates(str(articles)).items():
+        assert (articles / duplicate).exists()
+        assert (articles / canonical).resolve() == (base / "Guidelines/heart-failure/0001.txt").resolve()
+    assert not (base / "Guidelines" / "duplicates.json").exists()
+
+
+def test_indexing_skips_listed_duplicates(base):
+    chunks = dedup_chunks._list_chunks()
+    dedup_chunks.write_maps(dedup_chunks.find_duplicates(chunks), {})
+    assert "Articles/beta-blockers/0001.txt" not in list_text_files(str(base))
+    assert list_text_files(str(base / "Articles")) == []
+    assert "heart-failure/0001.txt" in list_text_files(str(base / "Guidelines"))
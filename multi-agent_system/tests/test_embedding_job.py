@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from backends import StubEmbeddings
+from retrieval.embedding_cache import CachedEmbeddings, EmbeddingCache
+from retrieval.embedding_job import EmbeddingJob, count_tokens
+
+TEXTS = [f"chunk {i} about heart failure and beta blockers" for i in range(20)]
+
+
+class FlakyEmbeddings(StubEmbeddings):
+    """Counts the texts it embeds; fails once on the text in fail_on."""
+
+    def __init__(self, fail_on=None):
+        super().__init__(dim=16)
+        self.fail_on = fail_on
+        self.sent = []
+
+    def embed_documents(self, texts):
+        if self.fail_on in texts:
+            self.fail_on = None
+            raise ConnectionError("embedding API unavailable")
+        self.sent.extend(texts)
+        return super().embed_documents(texts)
+
+
+def job(embeddings, tmp_path, **kwargs):
+    return EmbeddingJob(embeddings, "stub/test", str(tmp_path / "checkpoints"), batch_size=4, max_workers=1, **kwargs)
+
+
+def test_vectors_come_back_in_input_order(tmp_path):
+    vectors = job(FlakyEmbeddings(), tmp_path).run(TEXTS)
+    assert np.allclose(vectors, StubEmbeddings(dim=16).embed_documents(TEXTS))
+
+
+def test_resumed_run_embeds_only_the_unfinished_batches(tmp_path):
+    embeddings = FlakyEmbeddings(fail_on=TEXTS[13])
+    with pytest.raises(ConnectionError):
+        job(embeddings, tmp_path).run(TEXTS)
+    assert TEXTS[13] not in embeddings.sent
+
+    embeddings.sent = []
+    resumed = job(embeddings, tmp_path)
+    vectors = resumed.run(TEXTS)
+    assert np.allclose(vectors, StubEmbeddings(dim=16).embed_documents(TEXTS))
+    assert resumed.stats["resumed_chunks"] >= 12  # the three batches before the failure
+    assert len(embeddings.sent) == len(TEXTS) - resumed.stats["resumed_chunks"]
+    assert resumed.stats["tokens"] == sum(count_tokens(t) for t in embeddings.sent)
+
+
+def test_tokens_count_only_texts_sent_to_the_api(tmp_path):
+    model = FlakyEmbeddings()
+    cached = CachedEmbeddings(model, EmbeddingCache(str(tmp_path / "cache.sqlite")), "stub/test")
+    cached.embed_documents(TEXTS[:10])
+    model.sent = []
+
+    run = EmbeddingJob(cached, "stub/test", batch_size=4, max_workers=2)
+    run.run(TEXTS)
+    assert sorted(model.sent) == sorted(TEXTS[10:])
+    assert run.stats["cached_chunks"] == 10
+    assert run.stats["tokens"] == sum(count_tokens(t) for t in TEXTS[10:])
+
+
+def test_clear_checkpoints(tmp_path):
+    finished = job(FlakyEmbeddings(), tmp_path)
+    finished.run(TEXTS)
+    assert (tmp_path / "checkpoints").is_dir()
+    finished.clear_checkpoints()
+    assert not (tmp_path / "checkpoints").exists()
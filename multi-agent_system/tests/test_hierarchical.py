@@ -0,0 +1,37 @@
+import pytest
+
+from backends import StubEmbeddings
+from conftest import write_corpus
+from retrieval.hierarchical import HierarchicalIndex
+from retrieval.index_store import load_or_build_index
+
+
+@pytest.fixture
+def embeddings():
+    return StubEmbeddings(dim=64)
+
+
+def hierarchy_of(folder, tmp_path, embeddings):
+    return HierarchicalIndex(load_or_build_index(folder, str(tmp_path / "index"), embeddings, "stub/test"))
+
+
+def test_search_stays_within_the_top_documents(corpus, tmp_path, embeddings):
+    hierarchy = hierarchy_of(corpus, tmp_path, embeddings)
+    vector = embeddings.embed_query("atrial fibrillation anticoagulation")
+    docs = hierarchy.similarity_search_by_vector(vector, k=3, n_docs=1)
+    assert [d.metadata["source"] for d in docs] == ["Cases/palpitations/0001.txt"]
+
+
+def test_k_larger_than_the_index(corpus, tmp_path, embeddings):
+    hierarchy = hierarchy_of(corpus, tmp_path, embeddings)
+    ids, dists = hierarchy.search(embeddings.embed_query("heart failure"), k=50, n_docs=50)
+    assert len(ids) == len(dists) == hierarchy.vectorstore.index.ntotal
+
+
+def test_index_without_chunks_gives_no_hits(tmp_path, embeddings):
+    folder = str(tmp_path / "corpus")
+    write_corpus(folder, {"Cases/syncope/summary.txt": "Syncope\nKEYWORDS: fainting\n\nA summary without chunks."})
+    hierarchy = hierarchy_of(folder, tmp_path, embeddings)
+    ids, dists = hierarchy.search(embeddings.embed_query("fainting"), k=3, n_docs=5)
+    assert len(ids) == len(dists) == 0
+    assert hierarchy.similarity_search_by_vector(embeddings.embed_query("fainting")) == []
@@ -0,0 +1,84 @@
+import os
+
+import pytest
+
+from backends import StubEmbeddings
+from conftest import CHUNKS, write_corpus
+from retrieval.index_store import load_index, load_or_build_index, read_manifest, update_index
+from retrieval.sharded import ShardedIndex
+
+MODEL = "stub/test"
+
+
+@pytest.fixture
+def embeddings():
+    return StubEmbeddings(dim=64)
+
+
+def stored_texts(index_dir, embeddings):
+    store = load_index(index_dir, embeddings, mmap=False)
+    texts = {}
+    for source in store.index_to_docstore_id.values():
+        texts[source] = store.docstore.search(source).page_content
+    return store, texts
+
+
+def test_build_stores_every_chunk(corpus, tmp_path, embeddings):
+    index_dir = str(tmp_path / "index")
+    store = load_or_build_index(corpus, index_dir, embeddings, MODEL)
+    assert store.index.ntotal == len(CHUNKS)
+    assert read_manifest(index_dir)["num_files"] == len(CHUNKS)
+
+
+def test_update_adds_changes_and_deletes(corpus, tmp_path, embeddings):
+    index_dir = str(tmp_path / "index")
+    load_or_build_index(corpus, index_dir, embeddings, MODEL)
+    version = read_manifest(index_dir)["corpus_hash"]
+
+    write_corpus(corpus, {
+        "Cases/syncope/0001.txt": "Syncope\n\nFainting during exercise needs an echocardiogram.",
+        "Guidelines/hypertension/0001.txt": "Hypertension\n\nTarget blood pressure is below 130/80.",
+    })
+    os.remove(os.path.join(corpus, "Cases/chest-pain/0001.txt"))
+
+    stats = update_index(corpus, index_dir, embeddings, MODEL)
+    assert stats == {"added": 2, "removed": 2, "unchanged": len(CHUNKS) - 2}
+
+    store, texts = stored_texts(index_dir, embeddings)
+    assert store.index.ntotal == len(CHUNKS)
+    assert "Cases/chest-pain/0001.txt" not in texts
+    assert "Fainting during exercise" in texts["Cases/syncope/0001.txt"]
+    assert "below 130/80" in texts["Guidelines/hypertension/0001.txt"]
+    assert texts["Guidelines/heart-failure/0001.txt"] == CHUNKS["Guidelines/heart-failure/0001.txt"]
+    assert read_manifest(index_dir)["corpus_hash"] != version
+
+
+def test_update_finds_changed_text(corpus, tmp_path, embeddings):
+    index_dir = str(tmp_path / "index")
+    load_or_build_index(corpus, index_dir, embeddings, MODEL)
+    write_corpus(corpus, {"Cases/syncope/0001.txt": "Syncope\n\nFainting during exercise needs an echocardiogram."})
+    update_index(corpus, index_dir, embeddings, MODEL)
+
+    store = load_index(index_dir, embeddings)
+    vector = embeddings.embed_query("fainting during exercise echocardiogram")
+    assert store.similarity_search_by_vector(vector, k=1)[0].metadata["source"] == "Cases/syncope/0001.txt"
+
+
+def test_update_without_changes_keeps_the_index(corpus, tmp_path, embeddings):
+    index_dir = str(tmp_path / "index")
+    load_or_build_index(corpus, index_dir, embeddings, MODEL)
+    manifest = read_manifest(index_dir)
+    stats = update_index(corpus, index_dir, embeddings, MODEL)
+    assert stats == {"added": 0, "removed": 0, "unchanged": len(CHUNKS)}
+    assert read_manifest(index_dir)["corpus_hash"] == manifest["corpus_hash"]
+
+
+def test_sharded_version_follows_reload(corpus, tmp_path, embeddings):
+    shards = ShardedIndex(corpus, str(tmp_path / "index"), embeddings, MODEL, categories=["Cases", "Guidelines"])
+    version = shards.version
+    write_corpus(corpus, {"Cases/syncope/0001.txt": "Syncope\n\nFainting during exercise needs an echocardiogram."})
+    # the version describes the loaded shards, so it only moves once the shard is reloaded
+    assert shards.version == version
+    shards.reload("Cases")
+    assert shards.version != version
+    assert shards.get_document("Cases/syncope/0001.txt") is not None
@@ -0,0 +1,195 @@
+import asyncio
+import threading
+import time
+import types
+
+import httpx
+import openai
+import pytest
+
+import config
+import llm_gateway
+from llm_gateway import LLMGateway
+
+REQUEST = httpx.Request("POST", "https://api.openai.com/v1/responses")
+
+
+def status_error(status, headers=None):
+    response = httpx.Response(status, headers=headers or {}, request=REQUEST)
+    return openai.APIStatusError(f"status {status}", response=response, body=None)
+
+
+class FakeResponses:
+    """responses.create that fails with the queued errors first, then answers; release gates the answer."""
+
+    def __init__(self, errors=(), release=None):
+        self.errors = list(errors)
+        self.release = release
+        self.calls = []
+
+    def create(self, model, input, timeout=None, **kwargs):
+        self.calls.append(input)
+        if self.errors:
+            raise self.errors.pop(0)
+        if self.release is not None:
+            assert self.release.wait(5)
+        return types.SimpleNamespace(output_text=f"answer to {input}", usage=None)
+
+
+class AsyncFakeResponses(FakeResponses):
+    async def create(self, model, input, timeout=None, **kwargs):
+        self.calls.append(input)
+        if self.errors:
+            raise self.errors.pop(0)
+        await asyncio.sleep(0.05)
+        return types.SimpleNamespace(output_text=f"answer to {input}", usage=None)
+
+
+def gateway_with(responses, asynchronous=False, **kwargs):
+    gateway = LLMGateway(**kwargs)
+    client = types.SimpleNamespace(responses=responses)
+    if asynchronous:
+        gateway._async_client = client
+    else:
+        gateway._client = client
+    return gateway
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(llm_gateway.time, "sleep", delays.append)
+    return delays
+
+
+def test_identical_concurrent_prompts_share_one_request():
+    release = threading.Event()
+    responses = FakeResponses(release=release)
+    gateway = gateway_with(responses)
+    answers = []
+    threads = [threading.Thread(target=lambda: answers.append(gateway.complete("gpt", "What is angina?")))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while gateway.coalesced < 4 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert responses.calls == ["What is angina?"]
+    assert answers == ["answer to What is angina?"] * 5
+    assert gateway.stats()["coalesced"] == 4
+
+
+def test_sequential_prompts_are_not_coalesced():
+    responses = FakeResponses()
+    gateway = gateway_with(responses)
+    gateway.complete("gpt", "What is angina?")
+    gateway.complete("gpt", "What is angina?")
+    assert len(responses.calls) == 2
+    assert gateway.coalesced == 0
+
+
+def test_failed_request_leaves_nothing_in_flight(sleeps):
+    responses = FakeResponses(errors=[status_error(400)])
+    gateway = gateway_with(responses)
+    with pytest.raises(openai.APIStatusError):
+        gateway.complete("gpt", "What is angina?")
+    assert gateway._inflight == {}
+
+
+def test_async_identical_prompts_share_one_request():
+    responses = AsyncFakeResponses()
+    gateway = gateway_with(responses, asynchronous=True)
+
+    async def run():
+        return await asyncio.gather(*[gateway.acomplete("gpt", "What is angina?") for _ in range(5)])
+
+    assert asyncio.run(run()) == ["answer to What is angina?"] * 5
+    assert responses.calls == ["What is angina?"]
+    assert gateway.coalesced == 4
+
+
+def test_cancelled_caller_does_not_cancel_the_shared_request():
+    responses = AsyncFakeResponses()
+    gateway = gateway_with(responses, asynchronous=True)
+
+    async def run():
+        first = asyncio.ensure_future(gateway.acomplete("gpt", "What is angina?"))
+        second = asyncio.ensure_future(gateway.acomplete("gpt", "What is angina?"))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()) == "answer to What is angina?"
+    assert len(responses.calls) == 1
+
+
+def test_retryable_errors_are_retried_with_backoff(sleeps):
+    errors = [openai.APIConnectionError(request=REQUEST), status_error(503)]
+    responses = FakeResponses(errors=errors)
+    gateway = gateway_with(responses, backoff_base=0.5, backoff_max=8.0)
+    assert gateway.complete("gpt", "What is angina?") == "answer to What is angina?"
+    assert len(responses.calls) == 3
+    assert gateway.retries == 2
+    assert len(sleeps) == 2
+    assert 0 <= sleeps[0] <= 0.5 and 0 <= sleeps[1] <= 1.0
+
+
+def test_client_errors_are_not_retried(sleeps):
+    responses = FakeResponses(errors=[status_error(400)])
+    gateway = gateway_with(responses)
+    with pytest.raises(openai.APIStatusError):
+        gateway.complete("gpt", "What is angina?")
+    assert len(responses.calls) == 1
+    assert sleeps == []
+
+
+def test_gives_up_after_max_retries(sleeps):
+    responses = FakeResponses(errors=[status_error(429)] * 5)
+    gateway = gateway_with(responses, max_retries=2)
+    with pytest.raises(openai.APIStatusError):
+        gateway.complete("gpt", "What is angina?")
+    assert len(responses.calls) == 3
+    assert gateway.retries == 2
+
+
+def test_async_retries():
+    responses = AsyncFakeResponses(errors=[status_error(502)])
+    gateway = gateway_with(responses, asynchronous=True, backoff_base=0.01)
+    assert asyncio.run(gateway.acomplete("gpt", "What is angina?")) == "answer to What is angina?"
+    assert gateway.retries == 1
+
+
+def test_backoff_has_full_jitter_and_a_cap():
+    gateway = LLMGateway(backoff_base=0.5, backoff_max=8.0)
+    error = status_error(503)
+    delays = [gateway._backoff(3, error) for _ in range(200)]
+    assert all(0 <= d <= 4.0 for d in delays)
+    assert len(set(delays)) > 100
+    assert all(0 <= gateway._backoff(10, error) <= 8.0 for _ in range(50))
+
+
+def test_backoff_honours_retry_after():
+    gateway = LLMGateway(backoff_base=0.5)
+    assert gateway._backoff(0, status_error(429, {"retry-after": "3"})) >= 3.0
+
+
+def test_config_creates_one_gateway_across_threads(monkeypatch):
+    monkeypatch.delitem(config.__dict__, "llm", raising=False)
+    start = threading.Barrier(8)
+    seen = []
+
+    def get():
+        start.wait()
+        seen.append(config.llm)
+
+    threads = [threading.Thread(target=get) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(g) for g in seen}) == 1
+    assert config.client is seen[0].client
@@ -0,0 +1,60 @@
+import numpy as np
+
+from retrieval.mmr import adaptive_k, mmr
+
+QUERY = [1.0, 0.0, 0.0]
+CANDIDATES = np.array([
+    [1.0, 0.0, 0.10],   # most relevant
+    [1.0, 0.0, 0.12],   # near-duplicate of the first
+    [0.8, 0.6, 0.00],   # less relevant, but different
+], dtype=np.float32)
+
+
+def test_mmr_starts_with_the_most_relevant_candidate():
+    order, _ = mmr(QUERY, CANDIDATES, k=1)
+    assert order.tolist() == [0]
+
+
+def test_mmr_prefers_a_different_candidate_over_a_near_duplicate():
+    order, _ = mmr(QUERY, CANDIDATES, k=3, lambda_mult=0.5)
+    assert order.tolist() == [0, 2, 1]
+
+
+def test_mmr_with_lambda_one_is_plain_relevance_order():
+    order, relevance = mmr(QUERY, CANDIDATES, k=3, lambda_mult=1.0)
+    assert order.tolist() == [0, 1, 2]
+    assert np.all(np.diff(relevance[order]) <= 0)
+
+
+def test_mmr_relevance_is_cosine_similarity():
+    _, relevance = mmr(QUERY, CANDIDATES * 5, k=3)
+    expected = CANDIDATES[:, 0] / np.linalg.norm(CANDIDATES, axis=1)
+    assert np.allclose(relevance, expected, atol=1e-6)
+
+
+def test_mmr_k_larger_than_candidates():
+    order, _ = mmr(QUERY, CANDIDATES, k=10)
+    assert sorted(order.tolist()) == [0, 1, 2]
+
+
+def test_adaptive_k_cuts_at_the_largest_drop():
+    assert adaptive_k([0.90, 0.88, 0.60, 0.58, 0.57], k_min=1, k_max=5) == 2
+
+
+def test_adaptive_k_keeps_k_max_when_scores_are_flat():
+    assert adaptive_k([0.90, 0.89, 0.88, 0.87, 0.86], k_min=1, k_max=4, min_gap=0.03) == 4
+
+
+def test_adaptive_k_ignores_drops_before_k_min():
+    assert adaptive_k([0.90, 0.40, 0.39, 0.10], k_min=2, k_max=4) == 3
+
+
+def test_adaptive_k_with_fewer_scores_than_k_min():
+    assert adaptive_k([0.9], k_min=2, k_max=6) == 1
+
+
+def test_adaptive_k_on_mmr_order():
+    # MMR order is not sorted by relevance: the cut is at the drop in that order
+    order, relevance = mmr(QUERY, CANDIDATES, k=3, lambda_mult=0.5)
+    assert adaptive_k(relevance[order], k_min=1, k_max=3, min_gap=0.1) == 1
+    assert adaptive_k(relevance[order], k_min=2, k_max=3, min_gap=0.1) == 3
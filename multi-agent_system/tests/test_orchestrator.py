@@ -0,0 +1,202 @@
+import asyncio
+import threading
+
+import pytest
+
+from agents.cardiologist import CardiologistAgent
+from orchestrator import AGENT_FACTORIES, MedicalOrchestrator
+from semantic_cache import SemanticCache
+
+QUESTION = "Which diuretics relieve congestion in heart failure?"
+# confident enough for the local router, so no routing call is made
+LOCAL_QUESTION = "Chest pain and palpitations: is it angina?"
+
+
+@pytest.fixture
+def orchestrator(corpus, tmp_path, monkeypatch):
+    """An orchestrator on the stub backend, with the cardiology index built from the test corpus."""
+    monkeypatch.setitem(AGENT_FACTORIES, "cardiologist", lambda path: CardiologistAgent(path, str(tmp_path / "index")))
+    return MedicalOrchestrator(corpus)
+
+
+def embedding_calls(orchestrator):
+    embeddings = orchestrator.cardiologist.embeddings
+    return embeddings.hits + embeddings.misses
+
+
+def test_cached_question_is_embedded_once(orchestrator):
+    orchestrator.answer_cache = SemanticCache(max_entries=10)
+    before = embedding_calls(orchestrator)
+    first = orchestrator.answer(QUESTION)
+    # the vector computed for the cache lookup is also the one retrieval searches with
+    assert embedding_calls(orchestrator) == before + 1
+
+    assert orchestrator.answer(QUESTION) == first
+    assert orchestrator.answer_cache.stats()["hits"] == 1
+    assert embedding_calls(orchestrator) == before + 2
+
+
+def test_streamed_question_is_embedded_once(orchestrator):
+    orchestrator.answer_cache = SemanticCache(max_entries=10)
+    before = embedding_calls(orchestrator)
+    "".join(orchestrator.stream_answer(QUESTION))
+    assert embedding_calls(orchestrator) == before + 1
+
+
+def llm_routed(orchestrator, specialist=None):
+    """Sends every question to the LLM router; specialist, if given, is what it answers."""
+    orchestrator.local_router.threshold = 2.0
+    if specialist is not None:
+        async def aroute_llm(question):
+            await asyncio.sleep(0.05)
+            return specialist
+        orchestrator.aroute_llm = aroute_llm
+    return orchestrator
+
+
+def test_async_answer_with_speculative_retrieval(orchestrator):
+    llm_routed(orchestrator).answer_cache = SemanticCache(max_entries=10)
+    before = embedding_calls(orchestrator)
+    answer = asyncio.run(orchestrator.aanswer(QUESTION))
+    assert answer.startswith("stub answer")
+    # the speculative search and the cache lookup share one embedding
+    assert embedding_calls(orchestrator) == before + 1
+
+
+def test_async_answer_routed_locally_embeds_once(orchestrator):
+    orchestrator.answer_cache = SemanticCache(max_entries=10)
+    specialist, confidence = orchestrator.local_router.predict(LOCAL_QUESTION)
+    assert specialist == "cardiologist" and confidence >= orchestrator.local_router.threshold
+    before = embedding_calls(orchestrator)
+    asyncio.run(orchestrator.aanswer(LOCAL_QUESTION))
+    assert embedding_calls(orchestrator) == before + 1
+
+
+def test_speculative_retrieval_is_cancelled_when_routed_elsewhere(orchestrator):
+    llm_routed(orchestrator, "dermatologist")
+    agent = orchestrator.cardiologist
+    cancelled = []
+
+    async def slow_retrieve(question, vector=None):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(question)
+            raise
+
+    agent.aretrieve = slow_retrieve
+
+    async def run():
+        answer = await orchestrator.aanswer(QUESTION)
+        await asyncio.sleep(0.01)
+        return answer
+
+    assert asyncio.run(run()) == orchestrator._agent("dermatologist").answer(QUESTION)
+    assert cancelled == [QUESTION]
+
+
+def test_async_search_and_fusion_run_off_the_event_loop(orchestrator):
+    llm_routed(orchestrator)
+    agent = orchestrator.cardiologist
+    fuse = agent._fuse
+    threads = []
+
+    def recording_fuse(*args, **kwargs):
+        threads.append(threading.current_thread())
+        return fuse(*args, **kwargs)
+
+    agent._fuse = recording_fuse
+    asyncio.run(orchestrator.aanswer(QUESTION))
+    assert threads and threading.main_thread() not in threads
+
+
+MANY = [
+    "Which diuretics relieve congestion in heart failure?",
+    "An itchy rash and eczema on my arms",
+    "Is anticoagulation needed for atrial fibrillation?",
+]
+
+
+def test_answer_many_keeps_the_input_order(orchestrator):
+    results = orchestrator.answer_many(MANY)
+    assert [r["question"] for r in results] == MANY
+    assert [r["specialist"] for r in results] == ["cardiologist", "dermatologist", "cardiologist"]
+    assert all(r["error"] is None and r["answer"] for r in results)
+    assert results[0]["answer"] == orchestrator.answer(MANY[0])
+
+
+def test_answer_many_routing_failure_affects_only_its_item(orchestrator, monkeypatch):
+    def route_llm_batch(questions):
+        raise ConnectionError("batch routing failed")
+
+    def route_llm(question):
+        raise ConnectionError(f"cannot route {question!r}")
+
+    monkeypatch.setattr(orchestrator, "route_llm_batch", route_llm_batch)
+    monkeypatch.setattr(orchestrator, "route_llm", route_llm)
+    results = orchestrator.answer_many([LOCAL_QUESTION, "my skin turned yellow"])
+    assert results[0]["error"] is None and results[0]["answer"]
+    assert results[1]["specialist"] is None
+    assert results[1]["error"].startswith("routing failed")
+
+
+def test_answer_many_retrieves_one_by_one_when_the_batch_fails(orchestrator, monkeypatch):
+    agent = orchestrator.cardiologist
+    retrieve = agent.retrieve
+
+    def retrieve_many(questions):
+        raise ValueError("the embedding API rejected the batch")
+
+    def retrieve_one(question, shards=None, vector=None):
+        if "anticoagulation" in question:
+            raise ValueError("the embedding API rejected this question")
+        return retrieve(question, shards, vector)
+
+    monkeypatch.setattr(agent, "retrieve_many", retrieve_many)
+    monkeypatch.setattr(agent, "retrieve", retrieve_one)
+    results = orchestrator.answer_many(MANY)
+    assert [r["error"] is None for r in results] == [True, True, False]
+    assert results[2]["error"].startswith("retrieval failed")
+    assert results[0]["answer"] == orchestrator.answer(MANY[0])
+
+
+def test_answer_many_generation_failure_affects_only_its_item(orchestrator, monkeypatch):
+    agent = orchestrator.cardiologist
+    answer = agent.answer
+
+    def answer_one(question, docs=None):
+        if "anticoagulation" in question:
+            raise TimeoutError("generation timed out")
+        return answer(question, docs)
+
+    monkeypatch.setattr(agent, "answer", answer_one)
+    results = orchestrator.answer_many(MANY)
+    assert [r["error"] is None for r in results] == [True, True, False]
+    assert results[2]["error"].startswith("generation failed")
+
+
+def test_stream_answer_yields_the_answer_in_pieces(orchestrator):
+    pieces = list(orchestrator.stream_answer(QUESTION))
+    assert len(pieces) > 1
+    assert "".join(pieces).strip() == orchestrator.answer(QUESTION)
+    assert not pieces[0][:1].isspace()
+
+
+def test_stream_answer_reports_the_specialist_outside_the_text(orchestrator):
+    routed = []
+    text = "".join(orchestrator.stream_answer(QUESTION, on_route=routed.append))
+    assert routed == ["cardiologist"]
+    assert "specialist" not in text and "cardiologist" not in text
+
+
+def test_stream_answer_of_an_agent_without_streaming(orchestrator):
+    routed = []
+    pieces = list(orchestrator.stream_answer("An itchy rash and eczema on my arms", on_route=routed.append))
+    assert routed == ["dermatologist"]
+    assert pieces == [orchestrator._agent("dermatologist").answer("")]
+
+
+def test_stream_answer_serves_a_cached_answer_whole(orchestrator):
+    orchestrator.answer_cache = SemanticCache(max_entries=10)
+    streamed = "".join(orchestrator.stream_answer(QUESTION)).strip()
+    assert list(orchestrator.stream_answer(QUESTION)) == [streamed]
@@ -0,0 +1,97 @@
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from conftest import SCRATCH
+
+SERVER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server.py")
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork"), reason="prefork needs fork()")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def get(port, path):
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=5) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def wait_for(check, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            result = check()
+            if result:
+                return result
+        except OSError:
+            pass
+        time.sleep(0.1)
+    pytest.fail("timed out")
+
+
+def parent_of(pid):
+    with open(f"/proc/{pid}/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith("PPid:"))
+
+
+def worker_pids(port, n=40):
+    return {get(port, "/stats")[1]["worker"] for _ in range(n)}
+
+
+@pytest.fixture
+def server(corpus, tmp_path):
+    port = free_port()
+    env = {**os.environ, "CARDIOLOGY_DATA_PATH": corpus, "CARDIOLOGY_INDEX_PATH": str(tmp_path / "index"),
+           "EMBEDDING_CACHE_PATH": os.path.join(SCRATCH, "prefork-embeddings.sqlite"), "SHUTDOWN_TIMEOUT": "2"}
+    process = subprocess.Popen([sys.executable, SERVER, "--port", str(port), "--workers", "2"], env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    try:
+        wait_for(lambda: get(port, "/ready")[0] == 200)
+        yield process, port
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+
+def test_workers_are_forked_after_loading_and_freezing(server):
+    process, port = server
+    workers = wait_for(lambda: len(worker_pids(port)) == 2 and worker_pids(port))
+    assert all(parent_of(pid) == process.pid for pid in workers)
+
+    status, stats = get(port, "/stats")
+    # the parent froze everything it had loaded before forking
+    assert stats["gc_frozen"] > 10000
+    status, ready = get(port, "/ready")
+    assert ready["agents"]["cardiologist"] is True
+
+
+def test_dead_worker_is_replaced_and_shutdown_is_clean(server):
+    process, port = server
+    workers = wait_for(lambda: len(worker_pids(port)) == 2 and worker_pids(port))
+    victim = min(workers)
+    os.kill(victim, signal.SIGKILL)
+    replaced = wait_for(lambda: (pids := worker_pids(port)) - {victim} == pids and len(pids) == 2 and pids)
+    assert victim not in replaced
+    assert len(replaced & workers) == 1
+
+    process.send_signal(signal.SIGTERM)
+    output, _ = process.communicate(timeout=30)
+    assert process.returncode == 0
+    assert f"worker {victim} exited" in output
+    assert "stopping workers" in output
@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+from conftest import write_corpus
+from orchestrator import MedicalOrchestrator
+from router import LocalRouter, RouteLog, SEED_KEYWORDS
+from tracing import close_writers
+
+
+@pytest.fixture
+def router():
+    return LocalRouter(SEED_KEYWORDS, threshold=0.5)
+
+
+@pytest.mark.parametrize("question, specialist", [
+    ("I have chest pain and palpitations when climbing stairs", "cardiologist"),
+    ("An itchy rash and eczema on my arms", "dermatologist"),
+    ("When can I walk after hernia surgery?", "surgeon"),
+])
+def test_clear_questions_are_routed_confidently(router, question, specialist):
+    predicted, confidence = router.predict(question)
+    assert predicted == specialist
+    assert confidence >= router.threshold
+
+
+def test_one_keyword_in_an_unknown_question_is_not_confident(router):
+    assert router.predict("my skin turned yellow")[0] == "dermatologist"
+    assert router.predict("my skin turned yellow")[1] < router.threshold
+
+
+def test_mixed_question_is_not_confident(router):
+    assert router.predict("chest pain after surgery on a skin lesion")[1] < router.threshold
+
+
+def test_question_without_known_words_has_zero_confidence(router):
+    assert router.predict("what should I do?")[1] == 0.0
+
+
+def test_summary_keywords_extend_the_seed_lists(tmp_path):
+    corpus = str(tmp_path / "corpus")
+    write_corpus(corpus, {"Cases/takotsubo/summary.txt": "Takotsubo\nKEYWORDS: takotsubo cardiomyopathy\n\n..."})
+    assert LocalRouter(SEED_KEYWORDS).predict("takotsubo cardiomyopathy")[1] == 0.0
+    router = LocalRouter.from_corpora({"cardiologist": corpus})
+    assert router.predict("takotsubo cardiomyopathy") == ("cardiologist", pytest.approx(1.0))
+
+
+def test_orchestrator_calls_the_llm_only_below_the_threshold(corpus, monkeypatch):
+    orchestrator = MedicalOrchestrator(corpus)
+    asked = []
+    monkeypatch.setattr(orchestrator, "route_llm", lambda question: asked.append(question) or "surgeon")
+    assert orchestrator.route("I have chest pain and palpitations") == "cardiologist"
+    assert asked == []
+    assert orchestrator.route("my skin turned yellow") == "surgeon"
+    assert asked == ["my skin turned yellow"]
+
+
+def test_route_log_is_written_only_with_a_path(tmp_path):
+    RouteLog("").write("chest pain", "local", "cardiologist", 0.9, "cardiologist")
+    path = tmp_path / "routing.jsonl"
+    log = RouteLog(str(path))
+    log.write("my skin turned yellow", "llm", "dermatologist", 0.33, "dermatologist", "dermatologist")
+    close_writers()
+    record = json.loads(path.read_text(encoding="utf-8"))
+    assert record["question"] == "my skin turned yellow"
+    assert (record["source"], record["specialist"], record["confidence"]) == ("llm", "dermatologist", 0.33)
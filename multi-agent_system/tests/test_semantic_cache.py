@@ -0,0 +1,78 @@
+import time
+
+import numpy as np
+
+from config import SEMANTIC_CACHE_THRESHOLD
+from semantic_cache import SemanticCache
+
+HEART = [1.0, 0.0, 0.0]
+HEART_REPHRASED = [0.99, 0.05, 0.0]
+SKIN = [0.0, 1.0, 0.0]
+
+
+def test_similar_question_hits():
+    cache = SemanticCache(threshold=0.95)
+    cache.store(HEART, "cardiologist", "answer", index_version="v1")
+    assert cache.lookup(HEART_REPHRASED, "cardiologist", index_version="v1") == "answer"
+    assert cache.stats()["hits"] == 1
+
+
+def test_different_question_misses():
+    cache = SemanticCache(threshold=0.95)
+    cache.store(HEART, "cardiologist", "answer", index_version="v1")
+    assert cache.lookup(SKIN, "cardiologist", index_version="v1") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_other_specialist_misses():
+    cache = SemanticCache(threshold=0.95)
+    cache.store(HEART, "cardiologist", "answer", index_version="v1")
+    assert cache.lookup(HEART, "surgeon", index_version="v1") is None
+
+
+def test_index_version_change_drops_every_entry():
+    cache = SemanticCache(threshold=0.95)
+    cache.store(HEART, "cardiologist", "old answer", index_version="v1")
+    assert cache.lookup(HEART, "cardiologist", index_version="v2") is None
+    assert cache.stats()["size"] == 0
+    # answers stored under the new version are served again
+    cache.store(HEART, "cardiologist", "new answer", index_version="v2")
+    assert cache.lookup(HEART, "cardiologist", index_version="v2") == "new answer"
+
+
+def test_expired_entries_miss():
+    cache = SemanticCache(threshold=0.95, ttl=0.01)
+    cache.store(HEART, "cardiologist", "answer")
+    time.sleep(0.02)
+    assert cache.lookup(HEART, "cardiologist") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SemanticCache(threshold=0.95, max_entries=2)
+    cache.store(HEART, "cardiologist", "heart")
+    cache.store(SKIN, "dermatologist", "skin")
+    assert cache.lookup(HEART, "cardiologist") == "heart"
+    cache.store([0.0, 0.0, 1.0], "surgeon", "surgery")
+    assert cache.lookup(SKIN, "dermatologist") is None
+    assert cache.lookup(HEART, "cardiologist") == "heart"
+
+
+def test_size_zero_disables_the_cache():
+    cache = SemanticCache(max_entries=0)
+    cache.store(HEART, "cardiologist", "answer")
+    assert cache.lookup(HEART, "cardiologist") is None
+
+
+def near_heart(similarity):
+    """A unit vector at the given cosine similarity to HEART."""
+    return [similarity, float(np.sqrt(1 - similarity ** 2)), 0.0]
+
+
+def test_near_miss_question_does_not_hit_at_the_default_threshold():
+    # "should I take aspirin for angina" vs "should I not take aspirin for angina" can be this close
+    cache = SemanticCache(SEMANTIC_CACHE_THRESHOLD)
+    cache.store(HEART, "cardiologist", "answer", index_version="v1")
+    assert cache.lookup(near_heart(0.96), "cardiologist", index_version="v1") is None
+    assert cache.lookup(near_heart(0.975), "cardiologist", index_version="v1") is None
+    assert cache.lookup(near_heart(0.995), "cardiologist", index_version="v1") == "answer"
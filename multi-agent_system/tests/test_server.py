@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from server import MAX_BODY_BYTES, MAX_HEADERS, HTTPError, read_request, request_id_from
+
+
+def parse(raw, limit=2 ** 16):
+    async def run():
+        reader = asyncio.StreamReader(limit=limit)
+        reader.feed_data(raw)
+        reader.feed_eof()
+        return await read_request(reader)
+    return asyncio.run(run())
+
+
+def status_of(raw, **kwargs):
+    with pytest.raises(HTTPError) as error:
+        parse(raw, **kwargs)
+    return error.value.status
+
+
+def test_post_with_body():
+    method, path, version, headers, body = parse(
+        b"POST /answer?debug=1 HTTP/1.1\r\nContent-Type: application/json\r\nContent-Length: 2\r\n\r\n{}"
+    )
+    assert (method, path, version, body) == ("POST", "/answer", "HTTP/1.1", b"{}")
+    assert headers["content-type"] == "application/json"
+
+
+def test_get_without_body():
+    assert parse(b"GET /health HTTP/1.1\r\nX-Request-ID: abc\r\n\r\n")[3] == {"x-request-id": "abc"}
+
+
+def test_closed_connection_is_none():
+    assert parse(b"") is None
+
+
+def test_malformed_request_line():
+    assert status_of(b"GET /health\r\n\r\n") == 400
+
+
+def test_non_numeric_content_length():
+    assert status_of(b"POST /answer HTTP/1.1\r\nContent-Length: ten\r\n\r\n") == 400
+
+
+def test_negative_content_length():
+    assert status_of(b"POST /answer HTTP/1.1\r\nContent-Length: -1\r\n\r\n") == 400
+
+
+def test_body_too_large():
+    raw = f"POST /answer HTTP/1.1\r\nContent-Length: {MAX_BODY_BYTES + 1}\r\n\r\n".encode()
+    assert status_of(raw) == 413
+
+
+def test_header_line_without_a_name():
+    assert status_of(b"GET /health HTTP/1.1\r\nno colon here\r\n\r\n") == 400
+
+
+def test_too_many_headers():
+    raw = b"GET /health HTTP/1.1\r\n" + b"X-Filler: 1\r\n" * (MAX_HEADERS + 1) + b"\r\n"
+    assert status_of(raw) == 431
+
+
+def test_header_line_longer_than_the_reader_limit():
+    raw = b"GET /health HTTP/1.1\r\nX-Long: " + b"a" * 200 + b"\r\n\r\n"
+    assert status_of(raw, limit=100) == 431
+
+
+def test_truncated_body():
+    with pytest.raises(asyncio.IncompleteReadError):
+        parse(b"POST /answer HTTP/1.1\r\nContent-Length: 10\r\n\r\n{}")
+
+
+def test_valid_request_id_is_kept():
+    assert request_id_from("req-42_a.b") == "req-42_a.b"
+
+
+@pytest.mark.parametrize("header", [None, "", "abc\r\nSet-Cookie: x=1", "abc\rdef", "abc\n", "a b", "x" * 65])
+def test_unsafe_request_id_is_replaced(header):
+    request_id = request_id_from(header)
+    assert request_id != header
+    assert request_id_from(request_id) == request_id
@@ -0,0 +1,142 @@
+import asyncio
+import contextvars
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from tracing import JsonLinesWriter, Tracer, annotate, request_id
+
+
+def read_records(tracer):
+    tracer._writer.close()
+    with open(tracer.path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.fixture
+def tracer(tmp_path):
+    return Tracer(str(tmp_path / "trace.jsonl"))
+
+
+def test_spans_carry_the_request_id_and_annotations(tracer):
+    with tracer.trace("req-1", question="angina"):
+        with tracer.span("search", k=3):
+            annotate(hits=2)
+        with tracer.span("generate"):
+            annotate(tokens=40)
+    records = read_records(tracer)
+
+    assert [r["stage"] for r in records] == ["search", "generate", "request"]
+    assert {r["request_id"] for r in records} == {"req-1"}
+    assert records[0]["k"] == 3 and records[0]["hits"] == 2
+    assert records[1]["tokens"] == 40
+    assert records[2]["question"] == "angina"
+    assert records[2]["ms"] >= records[0]["ms"]
+    assert request_id() is None
+
+
+def test_annotate_goes_to_the_innermost_span_only(tracer):
+    with tracer.trace("req-1"):
+        with tracer.span("route"):
+            with tracer.span("embed"):
+                annotate(cached=True)
+    embed, route, request = read_records(tracer)
+    assert embed["cached"] is True
+    assert "cached" not in route and "cached" not in request
+
+
+def test_annotate_outside_a_span_is_ignored():
+    annotate(hits=1)
+
+
+def test_failed_span_records_the_error(tracer):
+    with pytest.raises(ValueError):
+        with tracer.trace("req-1"):
+            with tracer.span("search"):
+                raise ValueError("index missing")
+    search, request = read_records(tracer)
+    assert "index missing" in search["error"]
+    assert "error" in request
+    assert tracer.stats()["search"]["count"] == 1
+
+
+def test_trace_without_an_id_makes_one(tracer):
+    with tracer.trace() as span:
+        assert request_id() == span.request_id
+    assert len(span.request_id) == 16
+
+
+def test_request_id_follows_asyncio_tasks_and_to_thread(tracer):
+    async def stage(name):
+        with tracer.span(name):
+            await asyncio.sleep(0)
+        return request_id()
+
+    async def handle(rid):
+        with tracer.trace(rid):
+            return await asyncio.gather(stage("route"), asyncio.to_thread(request_id))
+
+    async def run():
+        return await asyncio.gather(handle("req-a"), handle("req-b"))
+
+    assert asyncio.run(run()) == [["req-a", "req-a"], ["req-b", "req-b"]]
+    records = read_records(tracer)
+    assert {(r["request_id"], r["stage"]) for r in records} == {
+        ("req-a", "route"), ("req-a", "request"), ("req-b", "route"), ("req-b", "request"),
+    }
+
+
+def test_thread_pools_need_a_copied_context(tracer):
+    with ThreadPoolExecutor(1) as pool, tracer.trace("req-1"):
+        plain = pool.submit(request_id).result()
+        copied = pool.submit(contextvars.copy_context().run, request_id).result()
+    assert plain is None
+    assert copied == "req-1"
+
+
+def test_prometheus_histograms(tracer):
+    with tracer.trace("req-1"):
+        with tracer.span("search"):
+            pass
+    with tracer.trace("req-2"):
+        pass
+    text = tracer.prometheus()
+    lines = text.splitlines()
+
+    assert lines[:2] == [
+        "# HELP stage_latency_seconds Latency of each stage of answering a question.",
+        "# TYPE stage_latency_seconds histogram",
+    ]
+    assert 'stage_latency_seconds_bucket{stage="request",le="+Inf"} 2' in lines
+    assert 'stage_latency_seconds_count{stage="request"} 2' in lines
+    assert 'stage_latency_seconds_bucket{stage="search",le="+Inf"} 1' in lines
+    assert 'stage_latency_seconds_count{stage="search"} 1' in lines
+    buckets = [int(l.rsplit(" ", 1)[1]) for l in lines if l.startswith('stage_latency_seconds_bucket{stage="request"')]
+    assert buckets == sorted(buckets)
+    assert text.endswith("\n")
+
+
+def test_reset_forgets_the_histograms(tracer):
+    with tracer.trace("req-1"):
+        pass
+    tracer.reset()
+    assert tracer.stats() == {}
+    assert tracer.prometheus().count("\n") == 2
+
+
+def test_tracer_without_a_path_only_keeps_histograms():
+    tracer = Tracer()
+    with tracer.trace("req-1"):
+        pass
+    assert tracer.stats()["request"]["count"] == 1
+
+
+def test_writer_flushes_on_close_and_restarts(tmp_path):
+    writer = JsonLinesWriter(str(tmp_path / "logs" / "out.jsonl"))
+    writer.write({"n": 1})
+    writer.close()
+    writer.write({"n": 2})
+    writer.close()
+    with open(writer.path, encoding="utf-8") as f:
+        assert [json.loads(line)["n"] for line in f] == [1, 2]
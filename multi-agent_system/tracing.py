@@ -0,0 +1,209 @@
+"""
+Per-request tracing. trace() gives a question a request ID; span(stage)
+times one stage of it (load, route, cache, embed, search, generate). Every
+finished span is added to a per-stage latency histogram and, when
+TRACE_LOG_PATH is set, appended as one JSON line by a background thread:
+
+    {"ts": ..., "request_id": "...", "stage": "search", "ms": 3.1, "hits": 3}
+
+annotate(**attrs) adds attributes (token counts, cache hits, ...) to the
+innermost open span, so lower layers can report without being passed the
+span. The request ID lives in a context variable: it follows asyncio tasks
+and asyncio.to_thread, but plain thread pools must run work in a copied
+context (contextvars.copy_context().run).
+"""
+from __future__ import annotations
+
+import atexit
+import contextlib
+import contextvars
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from typing import Dict, Iterator, List, Optional
+
+from metrics import LatencyHistogram
+
+_request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("span", default=None)
+
+
+_writers: List["JsonLinesWriter"] = []
+
+
+class JsonLinesWriter:
+    """
+    Appends records to a JSON lines file from a background thread, so a
+    caller (possibly on the event loop) never waits for the disk. The
+    thread is started on first write in each process, forked workers
+    included; close_writers() (run at exit) writes what is still queued.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+        _writers.append(self)
+
+    def _reset(self) -> None:
+        # threads do not survive fork(); a child starts its own
+        self._lock = threading.Lock()
+        self._queue: Optional[queue.SimpleQueue] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def write(self, record: dict) -> None:
+        if self._queue is None:
+            with self._lock:
+                if self._queue is None:
+                    records = queue.SimpleQueue()
+                    self._thread = threading.Thread(target=self._run, args=(records,), name="jsonl-writer",
+                                                    daemon=True)
+                    self._thread.start()
+                    self._queue = records
+        self._queue.put(record)
+
+    def _run(self, records: queue.SimpleQueue) -> None:
+        while True:
+            batch = [records.get()]
+            while not records.empty():
+                batch.append(records.get())
+            done = None in batch
+            lines = [json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in batch if r is not None]
+            if lines:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.writelines(lines)
+            if done:
+                return
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Writes what is queued and stops the thread."""
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join(timeout)
+        self._reset()
+
+
+def close_writers() -> None:
+    """Flushes every JsonLinesWriter; call before os._exit(), which skips atexit."""
+    for writer in list(_writers):
+        writer.close()
+
+
+atexit.register(close_writers)
+
+
+class Span:
+    def __init__(self, stage: str, request_id: Optional[str], attrs: dict):
+        self.stage = stage
+        self.request_id = request_id
+        self.attrs = attrs
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+
+
+class Tracer:
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.stages: Dict[str, LatencyHistogram] = {}
+        self._lock = threading.Lock()
+        self._writer = JsonLinesWriter(path) if path else None
+
+    def _histogram(self, stage: str) -> LatencyHistogram:
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self.stages.setdefault(stage, LatencyHistogram())
+        return histogram
+
+    def _emit(self, span: Span, error: Optional[BaseException]) -> None:
+        self._histogram(span.stage).observe(span.seconds)
+        if self._writer is None:
+            return
+        record = {"ts": time.time(), "request_id": span.request_id, "stage": span.stage,
+                  "ms": round(span.seconds * 1000, 3), **span.attrs}
+        if error is not None:
+            record["error"] = repr(error)
+        self._writer.write(record)
+
+    @contextlib.contextmanager
+    def span(self, stage: str, **attrs) -> Iterator[Span]:
+        span = Span(stage, _request_id.get(), attrs)
+        token = _span.set(span)
+        error = None
+        try:
+            yield span
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            _span.reset(token)
+            span.seconds = time.perf_counter() - span.started
+            self._emit(span, error)
+
+    @contextlib.contextmanager
+    def trace(self, request_id: Optional[str] = None, **attrs) -> Iterator[Span]:
+        """A whole request: sets the request ID for the spans inside and is itself recorded as stage "request"."""
+        token = _request_id.set(request_id or uuid.uuid4().hex[:16])
+        try:
+            with self.span("request", **attrs) as span:
+                yield span
+        finally:
+            _request_id.reset(token)
+
+    def reset(self) -> None:
+        """Forgets the histograms, e.g. after a warm-up."""
+        with self._lock:
+            self.stages = {}
+
+    def stats(self) -> dict:
+        return {stage: h.snapshot() for stage, h in sorted(self.stages.items())}
+
+    def prometheus(self, name: str = "stage_latency_seconds") -> str:
+        """Histograms in the Prometheus text exposition format."""
+        lines = [f"# HELP {name} Latency of each stage of answering a question.", f"# TYPE {name} histogram"]
+        for stage, h in sorted(self.stages.items()):
+            buckets, count, total = h.cumulative()
+            for bound, n in buckets:
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {n}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {total}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+def request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+def annotate(**attrs) -> None:
+    span = _span.get()
+    if span is not None:
+        span.attrs.update(attrs)
+
+
+_tracer: Optional[Tracer] = None
+_tracer_lock = threading.Lock()
+
+
+def tracer() -> Tracer:
+    """The process-wide tracer, writing to TRACE_LOG_PATH."""
+    global _tracer
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                from config import TRACE_LOG_PATH
+                _tracer = Tracer(TRACE_LOG_PATH)
+    return _tracer
+
+
+def span(stage: str, **attrs):
+    return tracer().span(stage, **attrs)
+
+
+def trace(request_id: Optional[str] = None, **attrs):
+    return tracer().trace(request_id, **attrs)
@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import time
+import zlib
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+BASE = Path("data/processed/cardiology")
+CATS = ["Articles", "Cases", "Guidelines", "Handbooks", "Textbooks"]
+
+# Written into every category folder; multi-agent_system/retrieval/corpus.py
+# skips the files listed in it when building the indexes.
+DUPLICATES_FILE = "duplicates.json"
+
+# Settings
+SHINGLE_WORDS = 5
+NUM_PERM = 128
+LSH_BANDS = 16          # 16 bands x 8 rows: pairs above ~0.7 Jaccard become candidates
+JACCARD_THRESHOLD = 0.85
+DOC_DUPLICATE_SHARE = 0.9  # a document whose chunks are this duplicated is a duplicate document
+MAX_BUCKET_PAIRS = 50   # bigger buckets are only compared against their first member
+SEED = 1
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+# -------------------------
+# Utils
+# -------------------------
+
+def _read_text(p: Path) -> str:
+    return p.read_text(encoding="utf-8", errors="ignore")
+
+
+def _chunk_body(text: str) -> str:
+    # drop the title line and the KEYWORDS line: reposts often differ only there
+    lines = [ln for ln in text.splitlines() if not ln.strip().lower().startswith("keywords:")]
+    body = "\n".join(lines[1:]).strip()
+    # some sources only have a single long first line, keep it then
+    return body or "\n".join(lines)
+
+
+def _shingles(text: str) -> np.ndarray:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < SHINGLE_WORDS:
+        grams = [" ".join(words)] if words else []
+    else:
+        grams = [" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)]
+    return np.unique(np.array([zlib.crc32(g.encode("utf-8")) for g in grams], dtype=np.uint64))
+
+
+def _permutations(num_perm: int, seed: int) -> Tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, int(MAX_HASH), size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, int(MAX_HASH), size=num_perm, dtype=np.uint64)
+    return a, b
+
+
+def minhash(shingles: np.ndarray, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """One signature row: min over shingles of (a*x + b) mod p, for every permutation at once."""
+    if not len(shingles):
+        return np.full(len(a), MAX_HASH, dtype=np.uint64)
+    hashed = (np.outer(a, shingles) + b[:, None]) % MERSENNE_PRIME
+    return (hashed & MAX_HASH).min(axis=1)
+
+
+def _find(parent: List[int], i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def candidate_pairs(signatures: np.ndarray, bands: int) -> set:
+    """LSH banding: chunks that agree on every row of at least one band."""
+    rows = signatures.shape[1] // bands
+    pairs = set()
+    for band in range(bands):
+        buckets = defaultdict(list)
+        block = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows])
+        for i, row in enumerate(block):
+            buckets[row.tobytes()].append(i)
+        for members in buckets.values():
+            if len(members) < 2:
+                continue
+            if len(members) <= MAX_BUCKET_PAIRS:
+                pairs.update((x, y) for k, x in enumerate(members) for y in members[k + 1:])
+            else:
+                pairs.update((members[0], y) for y in members[1:])
+    return pairs
+
+
+# -------------------------
+# Dedup
+# -------------------------
+
+def _list_chunks() -> List[Path]:
+    chunks = []
+    for cat in CATS:
+        cat_dir = BASE / cat
+        if cat_dir.exists():
+            chunks.extend(sorted(p for p in cat_dir.glob("*/*.txt") if p.name.lower() != "summary.txt"))
+    return chunks
+
+
+def find_duplicates(chunks: List[Path]) -> Dict[Path, Path]:
+    """{duplicate chunk: canonical chunk}. The canonical copy comes from the document with most chunks."""
+    a, b = _permutations(NUM_PERM, SEED)
+    shingles = [_shingles(_chunk_body(_read_text(p))) for p in chunks]
+    signatures = np.vstack([minhash(s, a, b) for s in shingles])
+
+    parent = list(range(len(chunks)))
+    for x, y in candidate_pairs(signatures, LSH_BANDS):
+        if not len(shingles[x]) or not len(shingles[y]):
+            continue
+        if np.mean(signatures[x] == signatures[y]) >= JACCARD_THRESHOLD:
+            parent[_find(parent, x)] = _find(parent, y)
+
+    doc_size = defaultdict(int)
+    for p in chunks:
+        doc_size[p.parent] += 1
+
+    clusters = defaultdict(list)
+    for i in range(len(chunks)):
+        clusters[_find(parent, i)].append(chunks[i])
+
+    duplicates = {}
+    for members in clusters.values():
+        if len(members) < 2:
+            continue
+        canonical = min(members, key=lambda p: (-doc_size[p.parent], str(p)))
+        for p in members:
+            if p != canonical:
+                duplicates[p] = canonical
+    return duplicates
+
+
+def duplicate_documents(chunks: List[Path], duplicates: Dict[Path, Path]) -> Dict[Path, Path]:
+    """Documents whose chunks are (almost) all copies of chunks of a single other document."""
+    by_doc = defaultdict(list)
+    for p in chunks:
+        by_doc[p.parent].append(p)
+
+    documents = {}
+    for doc, doc_chunks in by_doc.items():
+        targets = [duplicates[p].parent for p in doc_chunks if p in duplicates]
+        if not targets:
+            continue
+        target, count = max(((t, targets.count(t)) for t in set(targets)), key=lambda x: (x[1], str(x[0])))
+        if target != doc and count >= DOC_DUPLICATE_SHARE * len(doc_chunks):
+            documents[doc] = target
+    return documents
+
+
+def write_maps(duplicates: Dict[Path, Path], documents: Dict[Path, Path]) -> None:
+    entries = dict(duplicates)
+    # the summary of a duplicate document would otherwise still be retrieved
+    for doc, target in documents.items():
+        if (doc / "summary.txt").exists():
+            entries[doc / "summary.txt"] = target / "summary.txt"
+
+    for cat in CATS:
+        cat_dir = BASE / cat
+        if not cat_dir.exists():
+            continue
+        # both sides relative to the category folder, so a canonical chunk in another category starts with ../
+        mapping = {
+            p.relative_to(cat_dir).as_posix(): Path(os.path.relpath(canonical, cat_dir)).as_posix()
+            for p, canonical in sorted(entries.items())
+            if cat_dir in p.parents
+        }
+        out = cat_dir / DUPLICATES_FILE
+        if mapping:
+            out.write_text(json.dumps(mapping, indent=2, ensure_ascii=False), encoding="utf-8")
+        elif out.exists():
+            out.unlink()
+
+
+# -------------------------
+# Main
+# -------------------------
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Near-duplicate chunk detection (MinHash + LSH), run after chunkify.")
+    parser.add_argument("--drop", action="store_true", help="delete duplicate chunks instead of writing duplicates.json")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    chunks = _list_chunks()
+    duplicates = find_duplicates(chunks)
+    documents = duplicate_documents(chunks, duplicates)
+
+    if args.drop:
+        for p in duplicates:
+            p.unlink()
+        for doc in documents:
+            if (doc / "summary.txt").exists():
+                (doc / "summary.txt").unlink()
+    else:
+        write_maps(duplicates, documents)
+
+    print("Done.")
+    print(f"chunks_total: {len(chunks)}")
+    print(f"duplicate_chunks: {len(duplicates)}")
+    print(f"duplicate_documents: {len(documents)}")
+    for doc, target in sorted(documents.items())[:20]:
+        print(f"   {doc.relative_to(BASE)} -> {target.relative_to(BASE)}")
+    print(f"seconds: {time.perf_counter() - started:.1f}")
+
+
+if __name__ == "__main__":
+    main()